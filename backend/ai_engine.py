@@ -1,19 +1,125 @@
 import os
-import google.generativeai as genai  # type: ignore
-from typing import Tuple
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+from .cache import LRUCache
+from .metrics import LLM_ERRORS, STARTUP_SECONDS, record_llm_usage, timed
+
+# Per-finding layout shared by the single-call review and the map-reduce shard reviews.
+FINDING_FORMAT = """### 🛡 [Category Name]
+        
+        > **🔹 [Issue Title]**
+        > **Severity:** [🔴 High / 🟡 Medium / 🟢 Low] 
+
+        >**Impact:** [High / Medium / Low] 
+
+        >**Effort:** [High / Medium / Low]
+
+        > **Confidence:** [████████░░ 80%]
+        > 
+        > **Observation:** [A precise, objective explanation of what the code is currently doing. Max 2 lines. Verify against Tech Stack/Versions]
+        > 
+        > **Potential Impact:** [Why this matters in the real world. Max 2 lines.]
+        >
+        > <details>
+        > <summary><b>💡 Click to view Suggestion</b></summary>
+        > 
+        > [A soft, constructive recommendation on how to approach the fix. Be suggestive, not demanding.]
+        > </details>
+        > 
+        > <details>
+        > <summary><b>✨ Click to view Refactored Code</b></summary>
+        > 
+        > **Current Flawed Code:**
+        > ```javascript
+        > (Exact snippet from PR diff)
+        > ```
+        > 
+        > **Senior-Level Refactored Code:**
+        > ```javascript
+        > (Actionable code correcting the issue)
+        > ```
+        > </details>
+
+        ---
+        (Repeat for other findings...)"""
+
+# Separates the reduce output's head (sections 1-3) from its tail (sections 5-7);
+# the shard findings (section 4) are spliced in at this marker.
+FINDINGS_MARKER = "<!-- DULA:FINDINGS -->"
+
+# Bump whenever a prompt template changes so cached LLM results from the old wording are not reused.
+PROMPT_TEMPLATE_VERSION = "3"
 
 class AIEngine:
-    def __init__(self, api_key: str):
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel("gemini-2.5-flash")
+    def __init__(self, api_key: str, max_concurrency: int = 8, cache: Optional[LRUCache] = None):
+        self.api_key = api_key
+        self.model_name = "gemini-2.5-flash"
+        self._model: Any = None
+        self._model_lock = threading.Lock()
+        # Caps the number of in-flight async Gemini calls across all requests
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Content-addressed results: identical prompts on the same model/template return instantly
+        self.cache = cache
 
-    def layer_1_enhance_prompt(self, basic_prompt: str, repo_structure: str, key_files_context: str, pr_diff: str, deterministic_metrics: str = "") -> str:
+    @property
+    def model(self) -> Any:
+        # The Gemini SDK (grpc, protobuf, google-api-core) takes seconds to import, so it is
+        # loaded on the first uncached call rather than when the app starts
+        with self._model_lock:
+            if self._model is None:
+                started = time.perf_counter()
+                import google.generativeai as genai  # type: ignore
+                genai.configure(api_key=self.api_key)
+                self._model = genai.GenerativeModel(self.model_name)
+                seconds = time.perf_counter() - started
+                STARTUP_SECONDS.set(seconds, phase="gemini_sdk")
+                print(f"Loaded the Gemini SDK in {seconds:.2f}s")
+        return self._model
+
+    @model.setter
+    def model(self, model: Any):
+        self._model = model
+
+    async def load_model(self) -> Any:
+        """The model, loading the SDK in a worker thread the first time so the event loop keeps serving."""
+        if self._model is None:
+            return await asyncio.to_thread(lambda: self.model)
+        return self._model
+
+    def cache_key(self, prompt: str) -> str:
         """
-        Layer 1: The Context-Aware Interceptor.
-        Takes the user's basic prompt and massive repository context to generate a highly
-        structured, restrictive, and comprehensive code review prompt.
+        Hashes the model name, the template version and the fully rendered prompt. The prompt
+        already contains the instruction, repository structure, metrics and diff, so any change
+        to those produces a new key.
+        """
+        digest = hashlib.sha256(f"{self.model_name}\0{PROMPT_TEMPLATE_VERSION}\0{prompt}".encode("utf-8"))
+        return f"llm:{digest.hexdigest()}"
+
+    def _cached(self, prompt: str, use_cache: bool) -> Optional[str]:
+        if self.cache is None or not use_cache:
+            return None
+        return self.cache.get(self.cache_key(prompt))
+
+    def _remember(self, prompt: str, result: str):
+        if self.cache is not None and result:
+            self.cache.set(self.cache_key(prompt), result)
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def build_layer_1_prompt(self, basic_prompt: str, repo_structure: str, key_files_context: str, pr_diff: str, deterministic_metrics: str = "") -> str:
         """
-        system_instruction = f"""
+        Builds the Layer 1 meta-prompt from the user's request and the repository context.
+        """
+        return f"""
         You are 'DULA Layer 1' - an expert prompt synthesis engine for codebase analysis.
         Your goal is to take a user's basic request and expand it into a magnificent, deeply technical, 
         and rigorous prompt for a downstream structural Code Review LLM.
@@ -51,12 +157,15 @@ class AIEngine:
         It MUST instruct the LLM to include '⏱ Estimated Fix Time', '⚠ Real-world Impact', and a visual 'Confidence Meter (e.g. ████████ 90%)'.
         It MUST instruct the LLM to summarize findings into an Action Plan: 🔥 Fix First, ⚡ Improve Next, 📦 Refactor Later.
         
+        DO NOT reproduce the PR diff, or any code copied from it, in your prompt: Layer 2 receives the full diff separately, right after your prompt.
+        Instead, summarize the changed files and hunks (file path, line range and what each change does) so Layer 2 knows where to look.
+        
         ---
-        Here is the Context for your evaluation to inject securely into the prompt:
+        Here is the Context for your evaluation (use it to write the prompt; only the summaries above belong in it):
         Key Core Files (Dependencies/Config):
         {key_files_context}
         
-        Current Code Changes (PR Diff):
+        Current Code Changes (PR Diff, for your analysis only):
         {pr_diff}
         ---
 
@@ -64,22 +173,27 @@ class AIEngine:
         Do not include pleasantries. Make it look as academic, rigorous, and specific to the codebase as possible.
         """
 
+    @timed("ai.layer1")
+    async def layer_1_enhance_prompt_async(self, basic_prompt: str, repo_structure: str, key_files_context: str, pr_diff: str, deterministic_metrics: str = "", use_cache: bool = True) -> str:
+        """
+        Layer 1: The Context-Aware Interceptor.
+        Takes the user's basic prompt and massive repository context to generate a highly
+        structured, restrictive, and comprehensive code review prompt. Awaits the SDK's async
+        generation under the concurrency limiter.
+        """
+        system_instruction = self.build_layer_1_prompt(basic_prompt, repo_structure, key_files_context, pr_diff, deterministic_metrics)
         try:
-             response = self.model.generate_content(system_instruction)
-             return response.text
+            return await self._generate_async(system_instruction, use_cache, "layer1")
         except Exception as e:
-             import traceback
-             traceback.print_exc()
+             LLM_ERRORS.inc(layer="layer1")
              print(f"Error in Layer 1: {e}")
              return f"Error: Could not enhance prompt based on '{basic_prompt}'. Please check API keys."
 
-    def layer_2_generate_review(self, confirmed_prompt: str, pr_diff: str) -> str:
+    def build_layer_2_prompt(self, confirmed_prompt: str, pr_diff: str) -> str:
         """
-        Layer 2: The Executor.
-        Takes the rigidly structured confirmed prompt and applies it to the PR Diff.
+        Builds the Layer 2 execution prompt: the confirmed instructions, the diff and the output template.
         """
-        
-        execution_prompt = f"""
+        return f"""
         {confirmed_prompt}
         
         ---
@@ -132,43 +246,7 @@ class AIEngine:
 
         (Group issues strictly by their category. Every finding MUST use the exact structure below. You MUST use literal HTML `<details>` and `<summary>` tags for the suggestions and fixes, or the layout will completely break!)
 
-        ### 🛡 [Category Name]
-        
-        > **🔹 [Issue Title]**
-        > **Severity:** [🔴 High / 🟡 Medium / 🟢 Low] 
-
-        >**Impact:** [High / Medium / Low] 
-
-        >**Effort:** [High / Medium / Low]
-
-        > **Confidence:** [████████░░ 80%]
-        > 
-        > **Observation:** [A precise, objective explanation of what the code is currently doing. Max 2 lines. Verify against Tech Stack/Versions]
-        > 
-        > **Potential Impact:** [Why this matters in the real world. Max 2 lines.]
-        >
-        > <details>
-        > <summary><b>💡 Click to view Suggestion</b></summary>
-        > 
-        > [A soft, constructive recommendation on how to approach the fix. Be suggestive, not demanding.]
-        > </details>
-        > 
-        > <details>
-        > <summary><b>✨ Click to view Refactored Code</b></summary>
-        > 
-        > **Current Flawed Code:**
-        > ```javascript
-        > (Exact snippet from PR diff)
-        > ```
-        > 
-        > **Senior-Level Refactored Code:**
-        > ```javascript
-        > (Actionable code correcting the issue)
-        > ```
-        > </details>
-
-        ---
-        (Repeat for other findings...)
+        {FINDING_FORMAT}
 
         # 📋 5. DETAILED TABLE
         | Issue | Category | Severity | Effort | Action |
@@ -190,14 +268,14 @@ class AIEngine:
         <details>
         <summary><b>🔍 See How (Complexity Breakdown)</b></summary>
         
-        [Explain professionally exactly which parts of the code increased the score: e.g., "The score increased due to 4 nested `if` statements, 2 `for` loops, and multiple `try/catch` blocks in XYZ function. This indicates a violation of the Single Responsibility Principle."]
+        [Using the "Complexity Breakdown" metric (exact per-file and per-function numbers), explain professionally exactly which parts of the code increased the score: e.g., "The score increased due to 4 nested `if` statements, 2 `for` loops, and multiple `try/catch` blocks in XYZ function. This indicates a violation of the Single Responsibility Principle."]
         </details>
 
-        **DRY Duplication (Levenshtein):** [Extract from DETERMINISTIC METRIC SCORES above] (> 80% is considered a DRY Violation)
+        **DRY Duplication (MinHash/LSH):** [Extract from DETERMINISTIC METRIC SCORES above] (> 80% is considered a DRY Violation)
         <details>
         <summary><b>🔍 See How (Duplication Breakdown)</b></summary>
         
-        [Identify precisely which code is duplicated based on the metrics. e.g., "Duplicate logic found resembling the `utils/security.py` core file."]
+        [Identify precisely which code is duplicated using the "Closest Existing Code Regions" metric. e.g., "Lines 10-22 of `api/auth.py` duplicate `utils/security.py` L40-52."]
         
         **Actionable Import Code:**
         ```python
@@ -211,9 +289,155 @@ class AIEngine:
         NOW, START YOUR REVIEW:
         """
 
+    async def layer_2_generate_review_async(self, confirmed_prompt: str, pr_diff: str, use_cache: bool = True) -> str:
+        """
+        Layer 2: The Executor.
+        Applies the rigidly structured confirmed prompt to the PR diff, awaiting the SDK's
+        async generation under the concurrency limiter.
+        """
+        chunks = []
+        try:
+            async for chunk in self.layer_2_stream_review(confirmed_prompt, pr_diff, use_cache):
+                chunks.append(chunk)
+        except Exception as e:
+            return f"Error: Could not generate review. {e}"
+        return "".join(chunks)
+
+    @timed("ai.layer2")
+    async def layer_2_stream_review(self, confirmed_prompt: str, pr_diff: str, use_cache: bool = True) -> AsyncIterator[str]:
+        """
+        Streaming Layer 2: yields the review text chunk by chunk as Gemini produces it.
+        The concurrency slot is held until the stream is exhausted. A cached review is
+        yielded as a single chunk. Raises when generation fails, possibly after some chunks
+        were yielded, so callers can tell a failed review from a finished one.
+        """
+        execution_prompt = self.build_layer_2_prompt(confirmed_prompt, pr_diff)
+        cached = self._cached(execution_prompt, use_cache)
+        if cached is not None:
+            yield cached
+            return
         try:
-            response = self.model.generate_content(execution_prompt)
-            return response.text
+            chunks = []
+            model = await self.load_model()
+            async with self.semaphore:
+                started = time.perf_counter()
+                response = await model.generate_content_async(execution_prompt, stream=True)
+                async for chunk in response:
+                    if chunk.text:
+                        chunks.append(chunk.text)
+                        yield chunk.text
+                # Usage metadata is complete once the stream is exhausted
+                record_llm_usage("layer2", response, time.perf_counter() - started)
+            self._remember(execution_prompt, "".join(chunks))
         except Exception as e:
+             LLM_ERRORS.inc(layer="layer2")
              print(f"Error in Layer 2: {e}")
-             return f"Error: Could not generate review. {e}"
+             raise
+
+    async def _generate_async(self, prompt: str, use_cache: bool = True, layer: str = "layer2") -> str:
+        cached = self._cached(prompt, use_cache)
+        if cached is not None:
+            return cached
+        model = await self.load_model()
+        async with self.semaphore:
+            started = time.perf_counter()
+            response = await model.generate_content_async(prompt)
+        record_llm_usage(layer, response, time.perf_counter() - started)
+        self._remember(prompt, response.text)
+        return response.text
+
+    def build_shard_prompt(self, confirmed_prompt: str, shard_diff: str) -> str:
+        """
+        Map step prompt: review one shard of the diff and return findings only.
+        The prompt does not mention the shard's position, so an unchanged shard maps to the
+        same cache key across reviews.
+        """
+        return f"""
+        {confirmed_prompt}
+
+        ---
+        PULL REQUEST CODE DIFF (ONE SHARD OF A LARGER PULL REQUEST):
+        {shard_diff}
+        ---
+
+        EXECUTION PARAMETERS:
+        1. Review ONLY the code in this shard using the instructions above.
+        2. Output ONLY the findings, grouped under `### [Category]` headings, using EXACTLY this structure for each finding:
+
+        {FINDING_FORMAT}
+
+        3. Do NOT output a summary, tables, visualizations or an action plan; they are produced later from all shards.
+        4. If this shard has no findings, output exactly: NO FINDINGS
+        """
+
+    def build_reduce_prompt(self, confirmed_prompt: str, findings: str) -> str:
+        """
+        Reduce step prompt: summarise the merged shard findings into the surrounding template sections.
+        """
+        return f"""
+        {confirmed_prompt}
+
+        ---
+        FINDINGS FROM ALL DIFF SHARDS:
+        {findings}
+        ---
+
+        EXECUTION PARAMETERS:
+        1. The in-depth findings above are final. Do NOT rewrite or repeat them.
+        2. Output ONLY the following sections, counting the findings above, with no conversational filler:
+           # 🧠 1. QUICK SUMMARY (Total Issues, Critical, Medium, Low counts and Code Health Status)
+           # 📋 2. ISSUE SUMMARY TABLE (| Category | Issues | Critical | Medium | Low |)
+           # 📊 3. VISUALIZATIONS (mermaid pie of issues by category, severity bars, code health score bar)
+           then a line containing exactly {FINDINGS_MARKER}
+           then:
+           # 📋 5. DETAILED TABLE (| Issue | Category | Severity | Effort | Action |)
+           # 🎯 6. ACTION PLAN (🔥 Fix First / ⚡ Improve Next / 📦 Refactor Later)
+           # 🧮 7. DETERMINISTIC ALGORITHMS SCORE (from the DETERMINISTIC METRIC SCORES in the instructions, with the 🔍 See How `<details>` blocks)
+
+        NOW, START YOUR SUMMARY:
+        """
+
+    @timed("ai.layer2_map")
+    async def map_shards_async(self, confirmed_prompt: str, shards: List[str], max_workers: int = 4, use_cache: bool = True) -> List[Optional[str]]:
+        """
+        Map step: reviews every shard concurrently (at most `max_workers` at a time, on top of
+        the engine-wide limit) and returns the findings per shard ("" when there are none,
+        None when the call failed).
+        """
+        workers = asyncio.Semaphore(max_workers)
+
+        async def review_shard(index: int, shard: str) -> Optional[str]:
+            async with workers:
+                try:
+                    result = await self._generate_async(self.build_shard_prompt(confirmed_prompt, shard), use_cache, "layer2_map")
+                except Exception as e:
+                    LLM_ERRORS.inc(layer="layer2_map")
+                    print(f"Error in Layer 2 shard {index}: {e}")
+                    return None
+            result = result.strip()
+            return "" if result == "NO FINDINGS" else result
+
+        return list(await asyncio.gather(*(review_shard(i, shard) for i, shard in enumerate(shards, start=1))))
+
+    @timed("ai.layer2_reduce")
+    async def reduce_findings_async(self, confirmed_prompt: str, shard_findings: List[Optional[str]], use_cache: bool = True) -> str:
+        """
+        Reduce step: one short call writes the summary, tables, action plan and metric
+        sections, and the shard findings are spliced in verbatim as section 4.
+        """
+        findings = "\n\n---\n\n".join(f for f in shard_findings if f)
+        if not findings:
+            findings = "No issues were found in any shard."
+
+        in_depth = f"# ⚡ 4. IN-DEPTH ANALYSIS\n\n{findings}\n"
+        try:
+            summary = await self._generate_async(self.build_reduce_prompt(confirmed_prompt, findings), use_cache, "layer2_reduce")
+        except Exception as e:
+            LLM_ERRORS.inc(layer="layer2_reduce")
+            print(f"Error in Layer 2 reduce: {e}")
+            return in_depth
+
+        if FINDINGS_MARKER in summary:
+            head, tail = summary.split(FINDINGS_MARKER, 1)
+            return f"{head.rstrip()}\n\n{in_depth}\n{tail.lstrip()}"
+        return f"{summary.rstrip()}\n\n{in_depth}"
@@ -1,76 +1,260 @@
 import re
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
-def calculate_levenshtein_distance(s1: str, s2: str) -> float:
+from .diff_parser import DiffFile, parse_unified_diff
+from .metrics import timed
+
+# Similarity (in %) at or above which a diff is reported as a DRY violation.
+DRY_SIMILARITY_THRESHOLD = 80.0
+
+
+def _similarity_from_distance(distance: int, max_len: int) -> float:
+    similarity = ((max_len - distance) / max_len) * 100
+    return round(max(similarity, 0.0), 2)
+
+
+@timed("algorithms.levenshtein")
+def calculate_levenshtein_distance(
+    s1: str,
+    s2: str,
+    threshold: Optional[float] = None,
+    max_cost: Optional[int] = None,
+) -> float:
     """
     Calculates the Levenshtein distance between two strings and returns a similarity percentage.
+
+    Only two rows of the DP matrix are kept (in `array` buffers), so memory is O(min(len)).
+    When `threshold` is given, the search is restricted to Ukkonen's diagonal band: as soon as the
+    distance provably exceeds the largest value compatible with `threshold`% similarity, the scan
+    stops and an upper bound on the similarity (always below `threshold`) is returned.
+    `max_cost` only applies together with `threshold`: once that many cells were evaluated, the
+    scan stops as soon as even the worst completion of the alignment still reaches `threshold`,
+    returning that (lower bound) similarity. A budget exit therefore never changes the verdict;
+    without a threshold the exact similarity is always computed.
     """
     if not s1 or not s2:
         return 0.0
 
+    max_len = max(len(s1), len(s2))
+
+    # Strip the common prefix and suffix, they never contribute to the distance.
+    prefix = 0
+    shortest = min(len(s1), len(s2))
+    while prefix < shortest and s1[prefix] == s2[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < shortest - prefix and s1[-1 - suffix] == s2[-1 - suffix]:
+        suffix += 1
+    s1 = s1[prefix:len(s1) - suffix]
+    s2 = s2[prefix:len(s2) - suffix]
+
+    # Keep the shorter string on the row axis to minimise the buffers.
+    if len(s1) < len(s2):
+        s1, s2 = s2, s1
     len_s1 = len(s1)
     len_s2 = len(s2)
-    
-    # Create the matrix
-    dp = [[0 for _ in range(len_s2 + 1)] for _ in range(len_s1 + 1)]
-    
-    # Initialize matrix
-    for i in range(len_s1 + 1):
-        dp[i][0] = i
-    for j in range(len_s2 + 1):
-        dp[0][j] = j
-        
-    # Calculate distance
+
+    if len_s2 == 0:
+        return _similarity_from_distance(len_s1, max_len)
+
+    # Largest distance that still satisfies the threshold (the band half-width).
+    band = max_len
+    if threshold is not None:
+        band = int(max_len * (100 - threshold) // 100)
+        if len_s1 - len_s2 > band:
+            # The length difference alone already rules the threshold out.
+            return _similarity_from_distance(len_s1 - len_s2, max_len)
+
+    over = band + 1
+    previous = array("l", range(len_s2 + 1))
+    current = array("l", [over]) * (len_s2 + 1)
+    cost_spent = 0
+
     for i in range(1, len_s1 + 1):
-        for j in range(1, len_s2 + 1):
-            if s1[i - 1] == s2[j - 1]:
-                cost = 0
-            else:
-                cost = 1
-            dp[i][j] = min(
-                dp[i - 1][j] + 1,      # Deletion
-                dp[i][j - 1] + 1,      # Insertion
-                dp[i - 1][j - 1] + cost # Substitution
+        char1 = s1[i - 1]
+        lo = max(1, i - band)
+        hi = min(len_s2, i + band)
+        current[0] = i if i <= band else over
+        if lo > 1:
+            current[lo - 1] = over
+        row_min = current[0]
+        for j in range(lo, hi + 1):
+            value = previous[j - 1] + (char1 != s2[j - 1])
+            deletion = previous[j] + 1
+            if deletion < value:
+                value = deletion
+            insertion = current[j - 1] + 1
+            if insertion < value:
+                value = insertion
+            if value > over:
+                value = over
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if hi < len_s2:
+            current[hi + 1] = over
+
+        if row_min > band:
+            # Ukkonen cutoff: every alignment already costs more than the band allows.
+            return _similarity_from_distance(max(row_min, len_s1 - len_s2), max_len)
+
+        cost_spent += hi - lo + 1
+        if threshold is not None and max_cost is not None and cost_spent >= max_cost and i < len_s1:
+            # Budget spent: finishing from the best cell gives an upper bound on the distance,
+            # i.e. a lower bound on the similarity. Stop only if that bound already decides.
+            upper = min(
+                current[j] + max(len_s1 - i, len_s2 - j)
+                for j in range(lo - 1 if lo > 1 else 0, hi + 1)
             )
-            
-    distance = dp[len_s1][len_s2]
-    max_len = max(len_s1, len_s2)
-    
-    # Convert distance to similarity percentage
-    if max_len == 0:
-        return 100.0
-    
-    similarity = ((max_len - distance) / max_len) * 100
-    return round(similarity, 2)
+            lower_similarity = _similarity_from_distance(upper, max_len)
+            if lower_similarity >= threshold:
+                return lower_similarity
+
+        previous, current = current, previous
+
+    return _similarity_from_distance(previous[len_s2], max_len)
+
+# One alternation for every branch token. String literals and comments are matched first
+# (as `skip`) so keywords inside them are consumed without being counted. `else` is not a
+# decision (so `else if` counts once), and optional chaining `?.` is not a ternary.
+BRANCH_TOKEN_RE = re.compile(
+    r"""(?P<skip>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`[^`]*`|\#.*|//.*|\?\.)"""
+    r"|(?P<branch>\b(?:if|elif|for|while|catch|except|case|and|or)\b|&&|\|\||\?\?|\?)"
+)
+
+# Function/method definitions for Python, JS/TS, Go and Java-like languages.
+FUNCTION_DEF_RE = re.compile(
+    r"^\s*(?:async\s+)?def\s+(?P<py>\w+)"
+    r"|\bfunction\s*\*?\s*(?P<js>\w+)"
+    r"|\b(?:const|let|var)\s+(?P<arrow>\w+)\s*=\s*(?:async\s*)?(?:\([^)]*\)|\w+)\s*=>"
+    r"|^\s*func\s+(?:\([^)]*\)\s*)?(?P<go>\w+)"
+    r"|^\s*(?:(?:public|private|protected|static|final|abstract|synchronized)\s+)+[\w<>\[\],\s]*?(?P<java>\w+)\s*\("
+)
+
+
+def _count_branches(line: str, counts: Dict[str, int]) -> int:
+    found = 0
+    for match in BRANCH_TOKEN_RE.finditer(line):
+        token = match.group("branch")
+        if token is not None:
+            counts[token] = counts.get(token, 0) + 1
+            found += 1
+    return found
+
+
+def _function_name(line: str) -> Optional[str]:
+    match = FUNCTION_DEF_RE.search(line)
+    if match is None:
+        return None
+    return next(name for name in match.groups() if name)
+
 
 def calculate_cyclomatic_complexity(code_chunk: str) -> int:
     """
     Calculates a proxy for McCabe's Cyclomatic Complexity by counting control flow statements.
     Base complexity is 1. We add 1 for every branch.
+    All branch tokens are counted in a single pass; keywords in strings and comments are ignored.
     """
     if not code_chunk:
         return 1
-        
+
     complexity = 1
-    
-    # Keywords that add a branch to the control flow graph
-    branch_keywords = [
-        r'\bif\b', 
-        r'\belif\b', 
-        r'\belse\b', 
-        r'\bfor\b', 
-        r'\bwhile\b', 
-        r'\bcatch\b', 
-        r'\bexcept\b',
-        r'\bcase\b',
-        r'&&', 
-        r'\|\|', 
-        r'\band\b', 
-        r'\bor\b',
-        r'\?' # Ternary
-    ]
-    
-    for pattern in branch_keywords:
-        matches = re.findall(pattern, code_chunk)
-        complexity += len(matches)
-        
+    for match in BRANCH_TOKEN_RE.finditer(code_chunk):
+        if match.lastgroup == "branch":
+            complexity += 1
     return complexity
+
+
+@dataclass
+class HunkComplexity:
+    header: str
+    new_start: int
+    complexity: int
+    branches: Dict[str, int] = field(default_factory=dict)
+    functions: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class FileComplexity:
+    path: str
+    complexity: int
+    hunks: List[HunkComplexity] = field(default_factory=list)
+    functions: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class ComplexityReport:
+    total: int
+    files: List[FileComplexity] = field(default_factory=list)
+    branches: Dict[str, int] = field(default_factory=dict)
+
+    def summary(self, max_functions: int = 10) -> str:
+        """
+        Markdown breakdown used for the Layer 2 "See How" section.
+        """
+        if not self.files:
+            return "No added code to analyse."
+        lines = []
+        tokens = ", ".join(f"`{token}` x{count}" for token, count in sorted(self.branches.items(), key=lambda item: -item[1]))
+        lines.append(f"      - Decision points in changed code: {tokens or 'none'}")
+        for file_result in sorted(self.files, key=lambda f: -f.complexity):
+            lines.append(f"      - `{file_result.path}`: {file_result.complexity}")
+            top_functions = sorted(file_result.functions.items(), key=lambda item: -item[1])[:max_functions]
+            for name, value in top_functions:
+                lines.append(f"        - `{name}()`: {value}")
+        return "\n".join(lines)
+
+
+@timed("algorithms.complexity")
+def analyze_diff_complexity(pr_diff: Union[str, Iterable[DiffFile]]) -> ComplexityReport:
+    """
+    Computes the cyclomatic complexity proxy of the lines a PR adds, broken down per file,
+    per hunk and, where a definition is visible in the hunk, per function.
+    Removed lines, context lines, comments and strings never contribute.
+    """
+    diff_files = parse_unified_diff(pr_diff) if isinstance(pr_diff, str) else pr_diff
+    report = ComplexityReport(total=1)
+    for diff_file in diff_files:
+        if diff_file.is_binary or diff_file.is_deleted or diff_file.skipped:
+            continue
+        file_result, branches = diff_file_complexity(diff_file)
+        for token, count in branches.items():
+            report.branches[token] = report.branches.get(token, 0) + count
+        report.total += file_result.complexity - 1
+        report.files.append(file_result)
+    return report
+
+
+def diff_file_complexity(diff_file: DiffFile) -> Tuple[FileComplexity, Dict[str, int]]:
+    """
+    Branch-token proxy for one file's added lines, per hunk and per function visible in the
+    hunk. Returns the file result and the branch tokens counted.
+    """
+    file_result = FileComplexity(path=diff_file.path, complexity=1)
+    branches: Dict[str, int] = {}
+    for hunk in diff_file.hunks:
+        hunk_result = HunkComplexity(header=hunk.header, new_start=hunk.new_start, complexity=1)
+        current_function = _function_name(hunk.section)
+        for line in hunk.lines:
+            prefix, content = line[:1], line[1:]
+            if prefix == "-" or prefix == "\\":
+                continue
+            name = _function_name(content)
+            if name:
+                current_function = name
+            if prefix != "+":
+                continue
+            found = _count_branches(content, hunk_result.branches)
+            if found and current_function:
+                hunk_result.functions[current_function] = hunk_result.functions.get(current_function, 1) + found
+            hunk_result.complexity += found
+        if hunk_result.complexity > 1:
+            file_result.complexity += hunk_result.complexity - 1
+            for name, value in hunk_result.functions.items():
+                file_result.functions[name] = file_result.functions.get(name, 1) + value - 1
+            for token, count in hunk_result.branches.items():
+                branches[token] = branches.get(token, 0) + count
+        file_result.hunks.append(hunk_result)
+    return file_result, branches
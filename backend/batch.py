@@ -0,0 +1,195 @@
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .context_pipeline import MissingDiffError
+
+TARGET_RE = re.compile(r"^(?P<repo>[\w.-]+/[\w.-]+)(?:#(?P<pr>\d+))?$")
+
+
+@dataclass
+class BatchTarget:
+    repo_full_name: str
+    pr_number: int
+
+
+@dataclass
+class BatchResult:
+    repo_full_name: str
+    pr_number: int
+    status: str  # "reviewed", "no_diff" or "failed"
+    seconds: float = 0.0
+    review_path: Optional[str] = None
+    posted: bool = False
+    error: Optional[str] = None
+    diff_tokens: Dict[str, Any] = field(default_factory=dict)
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+
+
+def parse_target_specs(specs: Iterable[str]) -> Tuple[List[BatchTarget], List[str]]:
+    """Splits `owner/repo#123` specs into explicit PRs and bare `owner/repo` specs (all open PRs)."""
+    targets: List[BatchTarget] = []
+    repos: List[str] = []
+    for spec in specs:
+        spec = spec.strip()
+        if not spec or spec.startswith("#"):
+            continue
+        match = TARGET_RE.match(spec)
+        if match is None:
+            raise ValueError(f"Invalid target {spec!r}, expected owner/repo or owner/repo#123")
+        if match.group("pr"):
+            targets.append(BatchTarget(match.group("repo"), int(match.group("pr"))))
+        else:
+            repos.append(match.group("repo"))
+    return targets, repos
+
+
+async def expand_targets(gh_client: Any, specs: Iterable[str], max_pulls: int = 500,
+                         include_drafts: bool = False) -> List[BatchTarget]:
+    """Resolves the specs to PRs, listing the open PRs of every bare repository; duplicates are dropped."""
+    targets, repos = parse_target_specs(specs)
+    listings = await asyncio.gather(*(gh_client.list_open_pull_requests(repo, max_pulls) for repo in repos))
+    for repo, pulls in zip(repos, listings):
+        targets += [BatchTarget(repo, pull["number"]) for pull in pulls if include_drafts or not pull.get("draft")]
+    unique: Dict[Tuple[str, int], BatchTarget] = {}
+    for target in targets:
+        unique.setdefault((target.repo_full_name, target.pr_number), target)
+    return list(unique.values())
+
+
+def review_filename(target: BatchTarget) -> str:
+    return f"{target.repo_full_name.replace('/', '__')}-{target.pr_number}.md"
+
+
+async def review_pull_request(app: Any, target: BatchTarget, instruction: str, review_mode: str = "auto",
+                              use_cache: bool = True, output_dir: Optional[str] = None, post: bool = False) -> BatchResult:
+    """Runs Layer 1 then Layer 2 for one PR through `app` (the `backend.main` module)."""
+    repo_full_name, pr_number = target.repo_full_name, target.pr_number
+    result = BatchResult(repo_full_name, pr_number, "failed")
+    started = time.perf_counter()
+    try:
+        context = await app.run_layer1_pipeline(repo_full_name, pr_number, instruction, use_cache)
+        enhanced_prompt = context["enhanced_prompt"]
+        result.timings_ms = context.timing_report()
+        if enhanced_prompt.startswith("Error:"):
+            result.error = enhanced_prompt
+            return result
+        # The parsed diff from Layer 1 is reused, so Layer 2 does not fetch it again
+        head_sha = context["pull_request"]["head"]["sha"] if context["pull_request"] else None
+        review, packed_diff = await app.generate_layer2_review(repo_full_name, pr_number, enhanced_prompt,
+                                                               context["diff"], review_mode, use_cache,
+                                                               head_sha=head_sha, review_key=instruction)
+        result.diff_tokens = packed_diff.report()
+        if review.startswith("Error:"):
+            result.error = review
+            return result
+        header = "## 🧠 DULA Layer 2: Final Intelligent Code Review\n\n"
+        if output_dir:
+            result.review_path = os.path.join(output_dir, review_filename(target))
+            with open(result.review_path, "w", encoding="utf-8") as f:
+                f.write(f"# {repo_full_name}#{pr_number}\n\n### Layer 1 prompt\n\n{enhanced_prompt}\n\n{header}{review}\n")
+        if post:
+            result.posted = await app.get_gh_client().post_comment(repo_full_name, pr_number, header + review)
+        result.status = "reviewed"
+    except MissingDiffError:
+        result.status = "no_diff"
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    finally:
+        result.seconds = round(time.perf_counter() - started, 3)
+    return result
+
+
+async def run_batch(app: Any, targets: List[BatchTarget], workers: int = 4, **options: Any) -> List[BatchResult]:
+    """
+    Reviews `targets` with at most `workers` PRs in flight; results keep the order of `targets`.
+    Every PR goes through the same `app` globals, so the GitHub response cache, rate limiter,
+    tree/duplicate-index caches and LLM cache are shared across the batch.
+    """
+    limiter = asyncio.Semaphore(workers)
+    done = 0
+
+    async def one(target: BatchTarget) -> BatchResult:
+        nonlocal done
+        async with limiter:
+            result = await review_pull_request(app, target, **options)
+        done += 1
+        print(f"[{done}/{len(targets)}] {target.repo_full_name}#{target.pr_number}: {result.status} "
+              f"in {result.seconds}s" + (f" ({result.error})" if result.error else ""))
+        return result
+
+    return list(await asyncio.gather(*(one(target) for target in targets)))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m backend.batch",
+                                     description="Review many pull requests with shared caches.")
+    parser.add_argument("targets", nargs="*", help="owner/repo#123 for one PR, owner/repo for all its open PRs")
+    parser.add_argument("--from-file", help="file with one target per line (# starts a comment)")
+    parser.add_argument("--instruction", help="Layer 1 instruction (default: the webhook's full structural review)")
+    parser.add_argument("--mode", choices=("auto", "single", "map_reduce"), default="auto", help="Layer 2 review mode")
+    parser.add_argument("--workers", type=int, default=4, help="pull requests reviewed in parallel")
+    parser.add_argument("--llm-concurrency", type=int, help="in-flight Gemini calls (overrides DULA_LLM_CONCURRENCY)")
+    parser.add_argument("--max-pulls", type=int, default=500, help="open PRs taken per bare owner/repo target")
+    parser.add_argument("--include-drafts", action="store_true", help="also review draft PRs")
+    parser.add_argument("--output-dir", default="dula_reviews", help="where reviews and summary.json are written ('' to skip)")
+    parser.add_argument("--post", action="store_true", help="post every review as a PR comment")
+    parser.add_argument("--bypass-cache", action="store_true", help="skip the LLM result cache")
+    args = parser.parse_args(argv)
+
+    specs = list(args.targets)
+    if args.from_file:
+        with open(args.from_file, encoding="utf-8") as f:
+            specs += f.read().splitlines()
+    if not specs:
+        parser.error("no targets given")
+    if args.llm_concurrency:
+        os.environ["DULA_LLM_CONCURRENCY"] = str(args.llm_concurrency)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    # Imported here so the environment above is in place when the clients are built
+    from . import main as app
+
+    async def run() -> List[BatchResult]:
+        try:
+            targets = await expand_targets(app.get_gh_client(), specs, args.max_pulls, args.include_drafts)
+            print(f"Reviewing {len(targets)} pull requests with {args.workers} workers")
+            return await run_batch(app, targets, args.workers,
+                                   instruction=args.instruction or app.DEFAULT_REVIEW_INSTRUCTION,
+                                   review_mode=args.mode, use_cache=not args.bypass_cache,
+                                   output_dir=args.output_dir or None, post=args.post)
+        finally:
+            if app.gh_client is not None:
+                await app.gh_client.aclose()
+
+    started = time.perf_counter()
+    results = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    counts: Dict[str, int] = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+    summary = {
+        "seconds": round(elapsed, 3),
+        "prs_per_minute": round(len(results) / elapsed * 60, 2) if elapsed else 0.0,
+        "counts": counts,
+        "llm_cache": app.llm_cache.stats(),
+        "github_cache": app.github_cache.stats(),
+        "github": app.github_rate_limiter.stats(),
+        "results": [asdict(result) for result in results],
+    }
+    if args.output_dir:
+        with open(os.path.join(args.output_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    print(f"Done in {elapsed:.1f}s: {counts}")
+    sys.exit(1 if counts.get("failed") else 0)
+
+
+if __name__ == "__main__":
+    main()
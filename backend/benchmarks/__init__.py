@@ -0,0 +1,5 @@
+"""
+Offline benchmarks for the review pipeline: `python -m backend.benchmarks` runs the hot-path
+algorithms, webhook ingress and concurrent /api/layer1 and /api/layer2 load against fake
+GitHub and Gemini back ends, and writes the results as JSON.
+"""
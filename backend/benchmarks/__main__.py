@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import asyncio
+import argparse
+
+from .corpus import DEFAULT_DIFF_SIZES
+from .suite import BENCHMARKS, run_benchmarks
+
+
+def _record(args):
+    from ..github_client import AsyncGitHubClient
+    from .fakes import record_fixture
+
+    async def record():
+        gh_client = AsyncGitHubClient(token=os.environ["GITHUB_TOKEN"])
+        try:
+            return await record_fixture(gh_client, args.repo, args.pr, tuple(args.extensions))
+        finally:
+            await gh_client.aclose()
+
+    fixture = asyncio.run(record())
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(fixture, f)
+    if args.diff_dir:
+        os.makedirs(args.diff_dir, exist_ok=True)
+        with open(os.path.join(args.diff_dir, f"{args.repo.replace('/', '_')}-{args.pr}.diff"), "w", encoding="utf-8") as f:
+            f.write(fixture["diff"])
+    print(f"Recorded {args.repo}#{args.pr} to {args.output}")
+
+
+def _run(args):
+    report = run_benchmarks(
+        selected=args.only or BENCHMARKS,
+        sizes=tuple(args.sizes),
+        corpus_dir=args.corpus_dir,
+        fixture_paths=args.fixtures,
+        e2e_max_bytes=args.e2e_max_bytes,
+        concurrency_levels=args.concurrency,
+        requests=args.requests,
+        github_latency=args.github_latency,
+        llm_latency=args.llm_latency,
+    )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    for result in report["results"]:
+        print(f"{result['benchmark']:<26} {result['case']:<28} p50 {result['p50_ms']:>10} ms  p95 {result['p95_ms']:>10} ms")
+    print(f"Results written to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m backend.benchmarks",
+                                     description="Offline DULA benchmarks against fake GitHub and Gemini back ends.")
+    commands = parser.add_subparsers(dest="command")
+
+    run = commands.add_parser("run", help="run the benchmarks (default)")
+    run.add_argument("--only", nargs="+", choices=BENCHMARKS, help="benchmarks to run (default: all)")
+    run.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_DIFF_SIZES), help="synthetic diff sizes in bytes")
+    run.add_argument("--corpus-dir", help="directory of recorded *.diff / *.patch files added to the corpus")
+    run.add_argument("--fixtures", nargs="+", default=[], help="recorded fixture JSON files (see `record`) added to the API load runs")
+    run.add_argument("--e2e-max-bytes", type=int, default=256 * 1024, help="largest corpus diff used for /api/layer1 and /api/layer2")
+    run.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32], help="in-flight API requests per load run")
+    run.add_argument("--requests", type=int, default=64, help="API requests per load run")
+    run.add_argument("--github-latency", type=float, default=0.005, help="seconds per fake GitHub call")
+    run.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake Gemini call")
+    run.add_argument("--output", default="bench_results.json", help="JSON results file")
+    run.set_defaults(handler=_run)
+
+    record = commands.add_parser("record", help="record a PR from GitHub as a fake-client fixture (needs GITHUB_TOKEN)")
+    record.add_argument("repo", help="owner/name")
+    record.add_argument("pr", type=int)
+    record.add_argument("--extensions", nargs="*", default=[], help="only keep files with these extensions")
+    record.add_argument("--output", required=True, help="fixture JSON file")
+    record.add_argument("--diff-dir", help="also save the raw diff here, for use as --corpus-dir")
+    record.set_defaults(handler=_record)
+
+    argv = sys.argv[1:]
+    if not argv or argv[0] not in ("run", "record", "-h", "--help"):
+        argv = ["run", *argv]
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
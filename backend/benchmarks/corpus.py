@@ -0,0 +1,160 @@
+import os
+import random
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+# Synthetic diff sizes, 1 KB to 5 MB
+DEFAULT_DIFF_SIZES = (1024, 16 * 1024, 256 * 1024, 1024 * 1024, 5 * 1024 * 1024)
+
+_PYTHON_BODY = [
+    "    if {a} > {b}:",
+    "        return {a} - {b}",
+    "    for item in items:",
+    "        if item.{a} and not item.{b}:",
+    "            total += item.{a}",
+    "    while {a} < limit:",
+    "        {a} += 1",
+    "    try:",
+    "        value = lookup({a}, {b})",
+    "    except KeyError:",
+    "        value = None",
+    "    elif {a} == {b} or {b} is None:",
+    "    result = [x for x in {a} if x is not None]",
+    "    # TODO: handle the {b} case",
+    "    print(f\"{a}: {{{b}}}\")",
+]
+
+_JS_BODY = [
+    "  if ({a} > {b}) {{",
+    "    return {a} - {b};",
+    "  }} else if ({a} === {b}) {{",
+    "  for (const item of items) {{",
+    "    total += item.{a} ?? 0;",
+    "  const value = {a} && {b} ? {a} : {b};",
+    "  }} catch (err) {{",
+    "  switch ({a}) {{",
+    "    case 1: return {b};",
+    "  }}",
+    "  // fetch from https://example.com/{a}?q={b}",
+]
+
+_WORDS = ["user", "order", "count", "index", "total", "limit", "cache", "token", "payload", "result", "offset", "buffer"]
+
+
+def _function(rng: random.Random, language: str) -> List[str]:
+    a, b = rng.sample(_WORDS, 2)
+    name = f"{rng.choice(_WORDS)}_{rng.choice(_WORDS)}_{rng.randrange(1000)}"
+    if language == "py":
+        lines = [f"def {name}({a}, {b}, items, limit=10):"]
+        body = _PYTHON_BODY
+    else:
+        lines = [f"function {name}({a}, {b}, items) {{"]
+        body = _JS_BODY
+    lines += [rng.choice(body).format(a=a, b=b) for _ in range(rng.randint(4, 14))]
+    if language != "py":
+        lines.append("}")
+    return lines
+
+
+def _file_diff(rng: random.Random, path: str, language: str) -> List[str]:
+    lines = [f"diff --git a/{path} b/{path}", f"index {rng.getrandbits(28):07x}..{rng.getrandbits(28):07x} 100644",
+             f"--- a/{path}", f"+++ b/{path}"]
+    old_line = 1
+    for _ in range(rng.randint(1, 4)):
+        context = _function(rng, language)[:3]
+        removed = _function(rng, language) if rng.random() < 0.5 else []
+        added = _function(rng, language) + _function(rng, language)
+        old_line += rng.randint(5, 60)
+        lines.append(f"@@ -{old_line},{len(context) + len(removed)} +{old_line},{len(context) + len(added)} @@")
+        lines += [" " + line for line in context]
+        lines += ["-" + line for line in removed]
+        lines += ["+" + line for line in added]
+    return lines
+
+
+def _lockfile_diff(rng: random.Random) -> List[str]:
+    lines = ["diff --git a/package-lock.json b/package-lock.json", "--- a/package-lock.json",
+             "+++ b/package-lock.json", "@@ -1,3 +1,40 @@"]
+    for _ in range(40):
+        package = rng.choice(_WORDS)
+        lines.append(f'+    "node_modules/{package}-{rng.randrange(100)}": {{ "version": "1.{rng.randrange(20)}.0" }},')
+    return lines
+
+
+def synthetic_diff(size_bytes: int, seed: int = 0) -> str:
+    """
+    Deterministic unified diff of at least `size_bytes` (whole files are added until it is
+    reached): Python and JavaScript files with branch-heavy functions spread over several
+    directories, plus the occasional lockfile.
+    """
+    rng = random.Random(seed)
+    lines: List[str] = []
+    size = 0
+    index = 0
+    while size < size_bytes:
+        if index % 25 == 24:
+            chunk = _lockfile_diff(rng)
+        else:
+            language = "py" if index % 3 else "js"
+            directory = f"src/{rng.choice(_WORDS)}s"
+            chunk = _file_diff(rng, f"{directory}/{rng.choice(_WORDS)}_{index}.{language}", language)
+        lines += chunk
+        size += sum(len(line) + 1 for line in chunk)
+        index += 1
+    return "\n".join(lines) + "\n"
+
+
+def load_diff_corpus(directory: Optional[str]) -> Dict[str, str]:
+    """Recorded real diffs: every `*.diff` / `*.patch` file in `directory`, keyed by file name."""
+    corpus: Dict[str, str] = {}
+    if not directory:
+        return corpus
+    for name in sorted(os.listdir(directory)):
+        if name.endswith((".diff", ".patch")):
+            with open(os.path.join(directory, name), encoding="utf-8", errors="replace") as f:
+                corpus[name] = f.read()
+    return corpus
+
+
+def build_corpus(sizes: Tuple[int, ...] = DEFAULT_DIFF_SIZES, directory: Optional[str] = None) -> Dict[str, str]:
+    """Synthetic diffs of every size (named `synthetic-<bytes>`) plus the recorded diffs of `directory`."""
+    corpus = {f"synthetic-{size}": synthetic_diff(size, seed=size) for size in sizes}
+    corpus.update(load_diff_corpus(directory))
+    return corpus
+
+
+def fixture_for_diff(repo_full_name: str, pr_number: int, diff_text: str) -> Dict[str, Any]:
+    """
+    Builds a fake-GitHub fixture around a diff: PR metadata with a head SHA derived from the
+    diff, a tree containing every changed file and a root package.json, and file contents
+    made of the diff's added lines.
+    """
+    head_sha = hashlib.sha1(diff_text.encode("utf-8")).hexdigest()
+    files: Dict[str, List[str]] = {}
+    current = None
+    for line in diff_text.splitlines():
+        if line.startswith("+++ b/"):
+            current = files.setdefault(line[len("+++ b/"):], [])
+        elif current is not None and line.startswith("+") and not line.startswith("+++"):
+            current.append(line[1:])
+    contents = {path: "\n".join(lines) + "\n" for path, lines in files.items()}
+    contents["package.json"] = '{"name": "benchmark", "dependencies": {"express": "^4.18.0"}}\n'
+
+    directories = set()
+    for path in contents:
+        parent = os.path.dirname(path)
+        while parent:
+            directories.add(parent)
+            parent = os.path.dirname(parent)
+    tree = [{"path": path, "type": "tree", "sha": hashlib.sha1(path.encode()).hexdigest()} for path in sorted(directories)]
+    tree += [{"path": path, "type": "blob", "sha": hashlib.sha1(text.encode("utf-8")).hexdigest()}
+             for path, text in sorted(contents.items())]
+    return {
+        "repo_full_name": repo_full_name,
+        "pr_number": pr_number,
+        "pull_request": {"number": pr_number, "head": {"sha": head_sha, "ref": "feature"},
+                         "base": {"sha": "0" * 40, "ref": "main"}},
+        "tree": {"sha": hashlib.sha1(head_sha.encode()).hexdigest(), "tree": tree, "truncated": False},
+        "files": contents,
+        "diff": diff_text,
+    }
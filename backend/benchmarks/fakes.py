@@ -0,0 +1,203 @@
+import json
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from ..ai_engine import AIEngine, FINDINGS_MARKER
+from ..cache import LRUCache
+
+
+class FakeGitHubClient:
+    """
+    Offline stand-in for `AsyncGitHubClient` serving recorded fixtures (see `record_fixture`
+    and `corpus.fixture_for_diff`). Every call sleeps `latency` seconds to model the network
+    round trip; `calls` counts requests per method and `comments` keeps posted comments.
+    """
+
+    def __init__(self, fixtures: Iterable[Dict[str, Any]] = (), latency: float = 0.0):
+        self.fixtures: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self.by_head: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.latency = latency
+        self.calls: Dict[str, int] = {}
+        self.comments: List[Tuple[str, int, str]] = []
+        for fixture in fixtures:
+            self.add_fixture(fixture)
+
+    @classmethod
+    def from_files(cls, paths: Iterable[str], latency: float = 0.0) -> "FakeGitHubClient":
+        fixtures = []
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                fixtures.append(json.load(f))
+        return cls(fixtures, latency)
+
+    def add_fixture(self, fixture: Dict[str, Any]):
+        self.fixtures[(fixture["repo_full_name"], fixture["pr_number"])] = fixture
+        head_sha = (fixture.get("pull_request") or {}).get("head", {}).get("sha")
+        if head_sha:
+            self.by_head[(fixture["repo_full_name"], head_sha)] = fixture
+
+    async def _call(self, name: str):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _fixture_at(self, repo_full_name: str, ref: str) -> Optional[Dict[str, Any]]:
+        fixture = self.by_head.get((repo_full_name, ref))
+        if fixture is not None:
+            return fixture
+        # Branch names and other refs resolve to the first fixture of the repository
+        return next((f for (repo, _), f in self.fixtures.items() if repo == repo_full_name), None)
+
+    async def aclose(self):
+        pass
+
+    async def get_pr_diff(self, repo_full_name: str, pr_number: int) -> str:
+        await self._call("get_pr_diff")
+        fixture = self.fixtures.get((repo_full_name, pr_number))
+        return fixture["diff"] if fixture else ""
+
+    async def get_compare_diff(self, repo_full_name: str, base: str, head: str) -> Optional[str]:
+        await self._call("get_compare_diff")
+        fixture = self.by_head.get((repo_full_name, head))
+        return fixture.get("compare_diff") if fixture else None
+
+    async def stream_pr_diff(self, repo_full_name: str, pr_number: int, etag: Optional[str] = None,
+                             response_info: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        await self._call("stream_pr_diff")
+        fixture = self.fixtures.get((repo_full_name, pr_number))
+        # The ETag is derived from the diff text, so a changed fixture misses the caller's cache
+        current = f'"{hashlib.sha1(fixture["diff"].encode("utf-8")).hexdigest()}"' if fixture else None
+        status = 404 if fixture is None else 304 if etag and etag == current else 200
+        if response_info is not None:
+            response_info.update(status=status, etag=current)
+        if status != 200:
+            return
+        for line in fixture["diff"].splitlines():
+            yield line
+
+    async def get_pull_request(self, repo_full_name: str, pr_number: int) -> Optional[Dict[str, Any]]:
+        await self._call("get_pull_request")
+        fixture = self.fixtures.get((repo_full_name, pr_number))
+        return fixture.get("pull_request") if fixture else None
+
+    async def get_repo_files(self, repo_full_name: str, ref: str, extensions: Tuple[str, ...] = (),
+                             max_file_bytes: int = 200_000) -> Optional[List[Tuple[str, str]]]:
+        await self._call("get_repo_files")
+        fixture = self._fixture_at(repo_full_name, ref)
+        if fixture is None:
+            return None
+        return [(path, text) for path, text in fixture.get("files", {}).items()
+                if (not extensions or path.endswith(extensions)) and len(text) <= max_file_bytes]
+
+    async def get_repo_tree(self, repo_full_name: str, ref: str = "main") -> Optional[Dict[str, Any]]:
+        await self._call("get_repo_tree")
+        fixture = self._fixture_at(repo_full_name, ref)
+        return fixture.get("tree") if fixture else None
+
+    async def get_file_content(self, repo_full_name: str, file_path: str, branch: str = "main") -> Optional[str]:
+        await self._call("get_file_content")
+        fixture = self._fixture_at(repo_full_name, branch)
+        return fixture.get("files", {}).get(file_path) if fixture else None
+
+    async def get_blobs(self, repo_full_name: str, ref: str, blobs: Dict[str, str]) -> Dict[str, str]:
+        await self._call("get_blobs")
+        fixture = self._fixture_at(repo_full_name, ref)
+        files = fixture.get("files", {}) if fixture else {}
+        return {path: files[path] for path in blobs if path in files}
+
+    async def post_comment(self, repo_full_name: str, issue_number: int, body: str) -> bool:
+        await self._call("post_comment")
+        self.comments.append((repo_full_name, issue_number, body))
+        return True
+
+
+async def record_fixture(gh_client: Any, repo_full_name: str, pr_number: int,
+                         extensions: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    """
+    Captures everything the review pipeline reads for one PR through a real
+    `AsyncGitHubClient`, in the format `FakeGitHubClient` serves.
+    """
+    pull_request = await gh_client.get_pull_request(repo_full_name, pr_number)
+    head_sha = pull_request["head"]["sha"] if pull_request else "main"
+    diff_lines = [line async for line in gh_client.stream_pr_diff(repo_full_name, pr_number)]
+    tree, files = await asyncio.gather(
+        gh_client.get_repo_tree(repo_full_name, head_sha),
+        gh_client.get_repo_files(repo_full_name, head_sha, extensions),
+    )
+    return {
+        "repo_full_name": repo_full_name,
+        "pr_number": pr_number,
+        "pull_request": pull_request,
+        "tree": tree,
+        "files": dict(files or []),
+        "diff": "\n".join(diff_lines) + "\n",
+    }
+
+
+class FakeUsage:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, text: str, usage_metadata: Optional[FakeUsage] = None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class FakeStream:
+    """Async-iterable streamed response; usage is available once it is exhausted, as with the SDK."""
+
+    def __init__(self, chunks: List[str], usage_metadata: FakeUsage, latency: float):
+        self.chunks = chunks
+        self.usage_metadata = usage_metadata
+        self.latency = latency
+
+    async def __aiter__(self):
+        delay = self.latency / max(len(self.chunks), 1)
+        for chunk in self.chunks:
+            if delay:
+                await asyncio.sleep(delay)
+            yield FakeResponse(chunk)
+
+
+class FakeGenerativeModel:
+    """
+    Deterministic replacement for `genai.GenerativeModel`: the output depends only on the
+    prompt, every call takes `latency` seconds, and usage metadata is estimated at four
+    characters per token. Reduce prompts get the findings marker back, so the map-reduce
+    splice runs as it would against Gemini.
+    """
+
+    def __init__(self, latency: float = 0.0, output_tokens: int = 400):
+        self.latency = latency
+        self.output_tokens = output_tokens
+        self.calls = 0
+
+    def _respond(self, prompt: str) -> Tuple[str, FakeUsage]:
+        self.calls += 1
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        filler = " ".join(digest[i:i + 8] for i in range(0, len(digest), 8))
+        body = (filler + "\n") * max(1, self.output_tokens * 4 // (len(filler) + 1))
+        text = f"Deterministic output {digest[:12]}\n{FINDINGS_MARKER}\n{body}" if FINDINGS_MARKER in prompt \
+            else f"Deterministic output {digest[:12]}\n{body}"
+        return text, FakeUsage(len(prompt) // 4, len(text) // 4)
+
+    async def generate_content_async(self, prompt: str, stream: bool = False) -> Any:
+        text, usage = self._respond(prompt)
+        if stream:
+            return FakeStream([text[i:i + 200] for i in range(0, len(text), 200)], usage, self.latency)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return FakeResponse(text, usage)
+
+
+class FakeAIEngine(AIEngine):
+    """An `AIEngine` whose prompts, caching and concurrency limits are real but whose model is `FakeGenerativeModel`."""
+
+    def __init__(self, latency: float = 0.0, output_tokens: int = 400, max_concurrency: int = 8,
+                 cache: Optional[LRUCache] = None):
+        super().__init__(api_key="offline", max_concurrency=max_concurrency, cache=cache)
+        self.model = FakeGenerativeModel(latency, output_tokens)
@@ -0,0 +1,324 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import tempfile
+import platform
+import subprocess
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from ..algorithms import calculate_levenshtein_distance, calculate_cyclomatic_complexity, analyze_diff_complexity
+from ..diff_parser import parse_unified_diff
+from .corpus import build_corpus, fixture_for_diff, DEFAULT_DIFF_SIZES
+from .fakes import FakeGitHubClient, FakeAIEngine
+
+BENCHMARKS = ("startup", "levenshtein", "complexity", "webhook", "layer1", "layer2")
+BENCH_REPO = "bench/dula"
+# Directory holding the `backend` package, for the cold-start subprocesses
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Run in a fresh interpreter: import the app, answer the health route, then load the Gemini SDK
+# the way the first review would
+STARTUP_PROBE = """
+import sys, json, time
+started = time.perf_counter()
+from backend import main
+imported = time.perf_counter()
+main.home()
+healthy = time.perf_counter()
+sdk_loaded = "google.generativeai" in sys.modules
+try:
+    import google.generativeai
+    sdk_seconds = time.perf_counter() - healthy
+except ImportError:
+    sdk_seconds = None
+print(json.dumps({"import": imported - started, "health": healthy - started, "sdk_loaded": sdk_loaded, "sdk": sdk_seconds}))
+"""
+
+
+def summarize(samples: List[float], **extra: Any) -> Dict[str, Any]:
+    """Latency percentiles (ms) of `samples` (seconds), plus any extra fields."""
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 3)
+
+    total = sum(ordered)
+    return {
+        "iterations": len(ordered),
+        "mean_ms": round(total / len(ordered) * 1000, 3),
+        "p50_ms": percentile(0.5),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        **extra,
+    }
+
+
+def measure(function: Callable[[], Any], min_iterations: int = 5, min_seconds: float = 0.5) -> List[float]:
+    """Runs `function` until both `min_iterations` and `min_seconds` are reached; returns per-call seconds."""
+    samples: List[float] = []
+    started = time.perf_counter()
+    while len(samples) < min_iterations or time.perf_counter() - started < min_seconds:
+        begin = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - begin)
+    return samples
+
+
+def _code_text(rng: random.Random, length: int) -> str:
+    words = ["if", "for", "return", "value", "count", "=", "+", "(", ")", ":", "self", "item", "\n"]
+    text = []
+    size = 0
+    while size < length:
+        word = rng.choice(words)
+        text.append(word)
+        size += len(word) + 1
+    return " ".join(text)[:length]
+
+
+def _mutate(rng: random.Random, text: str, ratio: float) -> str:
+    chars = list(text)
+    for _ in range(int(len(chars) * ratio)):
+        chars[rng.randrange(len(chars))] = rng.choice("abcdefgh ")
+    return "".join(chars)
+
+
+def bench_levenshtein(lengths: Iterable[int] = (100, 1000, 4000)) -> List[Dict[str, Any]]:
+    rng = random.Random(42)
+    results = []
+    for length in lengths:
+        s1 = _code_text(rng, length)
+        s2 = _mutate(rng, s1, 0.1)
+        for threshold in (None, 80.0):
+            samples = measure(lambda: calculate_levenshtein_distance(s1, s2, threshold=threshold))
+            results.append(summarize(samples, benchmark="levenshtein", case=f"{length}-chars",
+                                     threshold=threshold))
+    return results
+
+
+def bench_complexity(corpus: Dict[str, str]) -> List[Dict[str, Any]]:
+    results = []
+    for name, diff_text in corpus.items():
+        added = "\n".join(line[1:] for line in diff_text.splitlines() if line.startswith("+") and not line.startswith("+++"))
+        samples = measure(lambda: calculate_cyclomatic_complexity(added), min_iterations=3)
+        results.append(summarize(samples, benchmark="cyclomatic_complexity", case=name, bytes=len(added),
+                                 mb_per_s=round(len(added) / 1e6 / (sum(samples) / len(samples)), 2)))
+        files = parse_unified_diff(diff_text)
+        samples = measure(lambda: analyze_diff_complexity(files), min_iterations=3)
+        results.append(summarize(samples, benchmark="analyze_diff_complexity", case=name, bytes=len(diff_text),
+                                 files=len(files)))
+    return results
+
+
+def slowest_packages(importtime_log: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    The packages that take longest to import, from `python -X importtime` output. A package
+    costs the cumulative time of its outermost import, i.e. its largest entry; the app's own
+    `backend` modules are left out since they contain everything else.
+    """
+    packages: Dict[str, int] = {}
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, module = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        package = module.strip().split(".")[0]
+        if package != "backend":
+            packages[package] = max(packages.get(package, 0), int(cumulative))
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [{"package": package, "cumulative_ms": round(microseconds / 1000, 1)} for package, microseconds in ranked]
+
+
+def bench_startup(iterations: int = 5) -> List[Dict[str, Any]]:
+    """Cold-start cost of `backend.main`: import time, time to the first health response and the deferred SDK load."""
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    env.setdefault("GITHUB_TOKEN", "offline")
+    env.setdefault("GEMINI_API_KEY", "offline")
+    env.pop("DULA_REDIS_URL", None)
+    runs = []
+    with tempfile.TemporaryDirectory() as state_dir:
+        env["DULA_STATE_DB"] = os.path.join(state_dir, "state.db")
+        for _ in range(iterations):
+            probe = subprocess.run([sys.executable, "-c", STARTUP_PROBE], cwd=PROJECT_ROOT, env=env,
+                                   capture_output=True, text=True, check=True)
+            runs.append(json.loads(probe.stdout.strip().splitlines()[-1]))
+        profile = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_PROBE], cwd=PROJECT_ROOT, env=env,
+                                 capture_output=True, text=True, check=True)
+    sdk_samples = [run["sdk"] for run in runs if run["sdk"] is not None]
+    return [
+        summarize([run["import"] for run in runs], benchmark="startup", case="import_backend_main",
+                  slowest_imports=slowest_packages(profile.stderr)),
+        summarize([run["health"] for run in runs], benchmark="startup", case="first_health_response",
+                  sdk_loaded=any(run["sdk_loaded"] for run in runs)),
+        *([summarize(sdk_samples, benchmark="startup", case="deferred_gemini_sdk_import")] if sdk_samples else []),
+    ]
+
+
+def load_app(gh_client: FakeGitHubClient, ai_engine: FakeAIEngine, state_db: str):
+    """
+    Imports `backend.main` against a throwaway state DB and swaps its GitHub client, AI engine,
+    Layer 1 pipeline and job queue for offline stand-ins.
+    """
+    os.environ.setdefault("GITHUB_TOKEN", "offline")
+    os.environ.setdefault("GEMINI_API_KEY", "offline")
+    os.environ["DULA_STATE_DB"] = state_db
+    os.environ.pop("DULA_REDIS_URL", None)
+    from .. import main
+    from ..context_pipeline import build_layer1_pipeline
+    from ..job_queue import JobQueue
+
+    main.gh_client = gh_client
+    main.ai_engine = ai_engine
+    main.layer1_pipeline = build_layer1_pipeline(gh_client, ai_engine, main.duplicate_index_cache, main.DIFF_TOKEN_BUDGET,
+                                                 main.MAX_DIFF_BYTES, main.MAX_DIFF_FILES, main.repo_tree_cache,
+                                                 main.TREE_OUTLINE_LINES, complexity_engine=main.complexity_engine,
+                                                 diff_cache=main.diff_cache)
+    # No workers: ingress only queues jobs
+    main.job_queue = JobQueue(main.JOB_HANDLERS, workers=0, max_pending=sys.maxsize)
+    return main
+
+
+def _webhook_deliveries(count: int) -> List[Tuple[str, bytes]]:
+    """A mix resembling an org-wide hook: mostly pushes and CI noise, some comments, a few commands."""
+    rng = random.Random(7)
+    deliveries = []
+    for i in range(count):
+        roll = rng.random()
+        if roll < 0.5:
+            deliveries.append(("push", json.dumps({"ref": "refs/heads/main", "commits": [{"id": "x" * 40}] * 20}).encode()))
+        elif roll < 0.8:
+            body = {"action": "created", "comment": {"body": "LGTM, thanks!"}, "issue": {"number": i, "pull_request": {}},
+                    "repository": {"full_name": BENCH_REPO}}
+            deliveries.append(("issue_comment", json.dumps(body).encode()))
+        else:
+            body = {"action": "created", "comment": {"body": "/review focus on security"},
+                    "issue": {"number": i % 50, "pull_request": {}}, "repository": {"full_name": BENCH_REPO}}
+            deliveries.append(("issue_comment", json.dumps(body).encode()))
+    return deliveries
+
+
+async def bench_webhook(main: Any, deliveries: int = 2000) -> List[Dict[str, Any]]:
+    from starlette.requests import Request  # type: ignore
+
+    def request(event: str, body: bytes) -> Any:
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+        scope = {"type": "http", "method": "POST", "path": "/webhook", "query_string": b"",
+                 "headers": [(b"x-github-event", event.encode()), (b"content-type", b"application/json")]}
+        return Request(scope, receive)
+
+    samples = []
+    for event, body in _webhook_deliveries(deliveries):
+        begin = time.perf_counter()
+        await main.github_webhook(request(event, body))
+        samples.append(time.perf_counter() - begin)
+    return [summarize(samples, benchmark="webhook_ingress", case=f"{deliveries}-deliveries",
+                      deliveries_per_s=round(len(samples) / sum(samples), 1), queue=main.job_queue.stats())]
+
+
+async def _load(name: str, call: Callable[[int], Awaitable[Any]], requests: int, concurrency: int) -> Dict[str, Any]:
+    """Runs `requests` calls of `call(i)` with at most `concurrency` in flight."""
+    limiter = asyncio.Semaphore(concurrency)
+    samples: List[float] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with limiter:
+            begin = time.perf_counter()
+            try:
+                await call(i)
+            except Exception as e:
+                errors += 1
+                print(f"{name} request {i} failed: {e}")
+            samples.append(time.perf_counter() - begin)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - started
+    return summarize(samples, benchmark=name, case=f"concurrency-{concurrency}", concurrency=concurrency,
+                     errors=errors, wall_s=round(wall, 3), requests_per_s=round(requests / wall, 2))
+
+
+async def bench_api(main: Any, prs: List[Tuple[str, int]], which: str, concurrency_levels: Iterable[int],
+                    requests: int) -> List[Dict[str, Any]]:
+    results = []
+    for concurrency in concurrency_levels:
+        if which == "layer1":
+            async def call(i: int):
+                repo_full_name, pr_number = prs[i % len(prs)]
+                await main.api_layer1(main.Layer1Request(repo_full_name=repo_full_name, pr_number=pr_number, bypass_cache=True))
+        else:
+            async def call(i: int):
+                repo_full_name, pr_number = prs[i % len(prs)]
+                await main.api_layer2(main.Layer2Request(repo_full_name=repo_full_name, pr_number=pr_number,
+                                                         confirmed_prompt="Review for correctness.", bypass_cache=True))
+        results.append(await _load(f"api_{which}", call, requests, concurrency))
+    return results
+
+
+async def run_async_benchmarks(selected: Iterable[str], corpus: Dict[str, str], recorded: List[Dict[str, Any]],
+                               e2e_max_bytes: int, concurrency_levels: Iterable[int], requests: int,
+                               github_latency: float, llm_latency: float) -> List[Dict[str, Any]]:
+    # Pipeline runs use the diffs small enough for end-to-end load, plus every recorded PR
+    e2e_diffs = [text for text in corpus.values() if len(text) <= e2e_max_bytes]
+    fixtures = [fixture_for_diff(BENCH_REPO, pr_number, text) for pr_number, text in enumerate(e2e_diffs, start=1)]
+    fixtures += recorded
+    gh_client = FakeGitHubClient(fixtures, latency=github_latency)
+    ai_engine = FakeAIEngine(latency=llm_latency)
+    results: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as state_dir:
+        main = load_app(gh_client, ai_engine, os.path.join(state_dir, "state.db"))
+        if "webhook" in selected:
+            results += await bench_webhook(main)
+        for which in ("layer1", "layer2"):
+            if which in selected and fixtures:
+                prs = [(f["repo_full_name"], f["pr_number"]) for f in fixtures]
+                results += await bench_api(main, prs, which, concurrency_levels, requests)
+    for result in results:
+        result.setdefault("github_calls", dict(gh_client.calls))
+    return results
+
+
+def run_benchmarks(selected: Iterable[str] = BENCHMARKS, sizes: Tuple[int, ...] = DEFAULT_DIFF_SIZES,
+                   corpus_dir: Optional[str] = None, fixture_paths: Iterable[str] = (), e2e_max_bytes: int = 256 * 1024,
+                   concurrency_levels: Iterable[int] = (1, 8, 32), requests: int = 64,
+                   github_latency: float = 0.005, llm_latency: float = 0.05) -> Dict[str, Any]:
+    """Runs the selected benchmarks and returns the JSON-ready report."""
+    selected = set(selected)
+    corpus = build_corpus(sizes, corpus_dir)
+    results: List[Dict[str, Any]] = []
+    if "startup" in selected:
+        results += bench_startup()
+    if "levenshtein" in selected:
+        results += bench_levenshtein()
+    if "complexity" in selected:
+        results += bench_complexity(corpus)
+    if selected & {"webhook", "layer1", "layer2"}:
+        recorded = FakeGitHubClient.from_files(fixture_paths).fixtures.values()
+        results += asyncio.run(run_async_benchmarks(selected, corpus, list(recorded), e2e_max_bytes,
+                                                    list(concurrency_levels), requests, github_latency, llm_latency))
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "config": {
+            "benchmarks": sorted(selected),
+            "corpus": {name: len(text) for name, text in corpus.items()},
+            "fixtures": list(fixture_paths),
+            "e2e_max_bytes": e2e_max_bytes,
+            "concurrency_levels": list(concurrency_levels),
+            "requests": requests,
+            "github_latency_s": github_latency,
+            "llm_latency_s": llm_latency,
+        },
+        "results": results,
+    }
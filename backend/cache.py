@@ -0,0 +1,209 @@
+import os
+import time
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    size: int
+    expires_at: Optional[float] = None
+    etag: Optional[str] = None
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        return self.expires_at is None or (now or time.time()) < self.expires_at
+
+
+class DiskCacheBackend:
+    """
+    Stores pickled `CacheEntry` objects as one file per key under `directory`,
+    so cached data survives restarts and is shared by workers on the same host.
+    The directory is kept under `max_bytes` (by default the bound of the `LRUCache` using
+    it) by deleting the least recently used files; reads refresh a file's mtime.
+    """
+
+    def __init__(self, directory: str, max_bytes: Optional[int] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.total_bytes = sum(size for _, size, _ in self._files())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    def _files(self) -> List[Tuple[float, int, str]]:
+        """(mtime, size, path) of every stored entry."""
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _evict(self):
+        # Other workers write to the same directory, so the real usage is re-read first
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self.total_bytes = total
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as handle:
+                entry = pickle.load(handle)
+            os.utime(path)
+            return entry
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def set(self, key: str, entry: CacheEntry):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as handle:
+                pickle.dump(entry, handle)
+            size = os.path.getsize(tmp_path)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to write cache entry: {e}")
+            return
+        with self.lock:
+            self.total_bytes += size - previous
+            if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def delete(self, key: str):
+        path = self._path(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self.lock:
+            self.total_bytes -= size
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded LRU cache with per-entry TTL and an optional disk backend.
+    Entries without a TTL never expire (used for content addressed by an immutable SHA)
+    but are still subject to LRU eviction.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024,
+                 default_ttl: Optional[float] = 300.0, disk_backend: Optional[DiskCacheBackend] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.disk_backend = disk_backend
+        if disk_backend is not None and disk_backend.max_bytes is None:
+            disk_backend.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "revalidated": 0, "evictions": 0, "expired": 0}
+
+    def _evict(self):
+        while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            _, entry = self.entries.popitem(last=False)
+            self.total_bytes -= entry.size
+            self.counters["evictions"] += 1
+
+    def _remember(self, key: str, entry: CacheEntry):
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.total_bytes -= previous.size
+        if entry.size > self.max_bytes:
+            return
+        self.entries[key] = entry
+        self.total_bytes += entry.size
+        self._evict()
+
+    def get_entry(self, key: str) -> Optional[CacheEntry]:
+        """
+        Returns the entry for `key` even when it is stale (so its ETag can be revalidated),
+        or None when nothing is stored.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                return entry
+        if self.disk_backend is not None:
+            entry = self.disk_backend.get(key)
+            if entry is not None:
+                with self.lock:
+                    self._remember(key, entry)
+                return entry
+        return None
+
+    def get(self, key: str) -> Any:
+        entry = self.get_entry(key)
+        if entry is not None and entry.is_fresh():
+            self.record("hits")
+            return entry.value
+        self.record("expired" if entry is not None else "misses")
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = -1, etag: Optional[str] = None,
+            size: Optional[int] = None) -> CacheEntry:
+        """
+        Stores `value`. `ttl=-1` uses the cache default, `ttl=None` never expires.
+        """
+        if ttl == -1:
+            ttl = self.default_ttl
+        if size is None:
+            size = len(value) if isinstance(value, (bytes, str)) else 1
+        entry = CacheEntry(value=value, size=size, etag=etag,
+                           expires_at=None if ttl is None else time.time() + ttl)
+        with self.lock:
+            self._remember(key, entry)
+        if self.disk_backend is not None and size <= self.max_bytes:
+            self.disk_backend.set(key, entry)
+        return entry
+
+    def touch(self, key: str, ttl: Optional[float] = -1):
+        """Marks a revalidated entry as fresh again."""
+        entry = self.get_entry(key)
+        if entry is not None:
+            self.set(key, entry.value, ttl=ttl, etag=entry.etag, size=entry.size)
+
+    def delete(self, key: str):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry.size
+        if self.disk_backend is not None:
+            self.disk_backend.delete(key)
+
+    def record(self, counter: str):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats: Dict[str, Any] = dict(self.counters)
+            stats["entries"] = len(self.entries)
+            stats["bytes"] = self.total_bytes
+        lookups = stats["hits"] + stats["misses"] + stats["expired"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["revalidated"]) / lookups, 4) if lookups else 0.0
+        return stats
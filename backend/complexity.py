@@ -0,0 +1,439 @@
+import os
+import re
+import ast
+import asyncio
+import posixpath
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .algorithms import ComplexityReport, FileComplexity, diff_file_complexity
+from .cache import LRUCache
+from .diff_parser import DiffFile
+
+BRACE_LANGUAGES = {
+    ".js": "javascript", ".jsx": "javascript", ".mjs": "javascript", ".cjs": "javascript",
+    ".ts": "typescript", ".tsx": "typescript", ".java": "java", ".go": "go",
+}
+
+# Files larger than this are left to the diff-based proxy
+MAX_SOURCE_BYTES = 1024 * 1024
+
+# Fewer uncached files than this are analyzed in a thread instead of the process pool
+DEFAULT_PARALLEL_THRESHOLD = 8
+
+
+def source_language(path: str) -> Optional[str]:
+    extension = posixpath.splitext(path)[1].lower()
+    return "python" if extension == ".py" else BRACE_LANGUAGES.get(extension)
+
+
+@dataclass
+class FunctionMetric:
+    """McCabe complexity of one function: 1 plus one per decision point, by kind."""
+    name: str
+    start_line: int
+    end_line: int
+    complexity: int = 1
+    decisions: Dict[str, int] = field(default_factory=dict)
+
+    def add(self, kind: str, amount: int = 1):
+        self.complexity += amount
+        self.decisions[kind] = self.decisions.get(kind, 0) + amount
+
+
+@dataclass
+class FileMetrics:
+    """
+    Per-function complexity of one whole file. Decisions outside any function are kept
+    with their line numbers, so changed top-level code can still be scored.
+    """
+    path: str
+    language: str
+    complexity: int = 1
+    functions: List[FunctionMetric] = field(default_factory=list)
+    module_decisions: List[Tuple[int, str]] = field(default_factory=list)
+    error: Optional[str] = None
+
+    def touched_functions(self, lines: Iterable[int]) -> List[FunctionMetric]:
+        """The innermost function around each of `lines`, in source order."""
+        touched: Dict[int, FunctionMetric] = {}
+        for line in lines:
+            best = None
+            for function in self.functions:
+                if function.start_line <= line <= function.end_line and (
+                        best is None or function.end_line - function.start_line < best.end_line - best.start_line):
+                    best = function
+            if best is not None:
+                touched[id(best)] = best
+        return sorted(touched.values(), key=lambda function: function.start_line)
+
+
+class _PythonComplexityVisitor(ast.NodeVisitor):
+    """
+    Counts decision points per function: if/elif, loops, except clauses, boolean operators,
+    conditional expressions, comprehension loops/filters and match cases. `else` never counts,
+    and nested functions are scored on their own.
+    """
+
+    def __init__(self, metrics: FileMetrics):
+        self.metrics = metrics
+        self.scopes: List[FunctionMetric] = []
+        self.names: List[str] = []
+
+    def add(self, node: ast.AST, kind: str, amount: int = 1):
+        self.metrics.complexity += amount
+        if self.scopes:
+            self.scopes[-1].add(kind, amount)
+        else:
+            self.metrics.module_decisions.extend([(getattr(node, "lineno", 0), kind)] * amount)
+
+    def visit_FunctionDef(self, node):
+        for child in node.decorator_list + [node.args] + ([node.returns] if node.returns else []):
+            self.visit(child)
+        self.names.append(node.name)
+        function = FunctionMetric(".".join(self.names), node.lineno, getattr(node, "end_lineno", node.lineno))
+        self.metrics.functions.append(function)
+        self.scopes.append(function)
+        for statement in node.body:
+            self.visit(statement)
+        self.scopes.pop()
+        self.names.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        self.names.append(node.name)
+        self.generic_visit(node)
+        self.names.pop()
+
+    def visit_If(self, node):
+        self.add(node, "if")
+        self.generic_visit(node)
+
+    def visit_IfExp(self, node):
+        self.add(node, "ternary")
+        self.generic_visit(node)
+
+    def visit_For(self, node):
+        self.add(node, "for")
+        self.generic_visit(node)
+
+    visit_AsyncFor = visit_For
+
+    def visit_While(self, node):
+        self.add(node, "while")
+        self.generic_visit(node)
+
+    def visit_ExceptHandler(self, node):
+        self.add(node, "except")
+        self.generic_visit(node)
+
+    def visit_BoolOp(self, node):
+        self.add(node, "and" if isinstance(node.op, ast.And) else "or", len(node.values) - 1)
+        self.generic_visit(node)
+
+    def visit_comprehension(self, node):
+        self.add(node.target, "for")
+        for condition in node.ifs:
+            self.add(condition, "if")
+        self.generic_visit(node)
+
+    def visit_match_case(self, node):
+        self.add(node.pattern, "case")
+        self.generic_visit(node)
+
+
+def analyze_python(path: str, source: str) -> FileMetrics:
+    metrics = FileMetrics(path, "python")
+    _PythonComplexityVisitor(metrics).visit(ast.parse(source, filename=path))
+    return metrics
+
+
+# Whitespace and comments are matched so they can be skipped; strings so their contents
+# never look like code. Regex literals are not recognised (a rare source of noise).
+BRACE_TOKEN_RE = re.compile(
+    r"(?P<space>\s+)"
+    r"|(?P<comment>//[^\n]*|/\*[\s\S]*?(?:\*/|$))"
+    r'|(?P<string>"(?:\\.|[^"\\\n])*"?|\'(?:\\.|[^\'\\\n])*\'?|`(?:\\[\s\S]|[^`\\])*`?)'
+    r"|(?P<name>[A-Za-z_$][\w$]*)"
+    r"|(?P<number>\d[\w.]*)"
+    r"|(?P<op>&&|\|\||\?\?=?|\?\.|=>|->|[{}()\[\];,?:=<>.*])"
+    r"|(?P<other>.)"
+)
+
+BRACE_DECISIONS = {"if", "for", "while", "case", "catch"}
+CONTROL_KEYWORDS = BRACE_DECISIONS | {"switch", "else", "do", "try", "finally", "return", "synchronized",
+                                      "with", "typeof", "new", "throw", "await", "yield", "in", "of", "select"}
+CLASS_KEYWORDS = {"class", "interface", "enum", "record", "struct", "namespace"}
+# Tokens that may appear in a return type / throws clause between `)` and `{`
+TYPE_TAIL = {".", "<", ">", "[", "]", ",", "?", "|", "&", "*", ":", "=>"}
+
+
+def _brace_tokens(source: str) -> List[Tuple[str, str, int]]:
+    tokens = []
+    line = 1
+    for match in BRACE_TOKEN_RE.finditer(source):
+        kind = match.lastgroup
+        text = match.group()
+        if kind not in ("space", "comment"):
+            tokens.append((kind, text, line))
+        line += text.count("\n")
+    return tokens
+
+
+class _BraceAnalyzer:
+    """
+    Token-level analyzer for JavaScript/TypeScript, Java and Go. Functions are recognised at
+    the `{` that opens their body (declarations, methods, arrow functions, Go funcs and
+    func literals); decisions are credited to the innermost enclosing function.
+    """
+
+    def __init__(self, metrics: FileMetrics, source: str):
+        self.metrics = metrics
+        self.language = metrics.language
+        self.tokens = _brace_tokens(source)
+        self.matching: Dict[int, int] = {}
+        stack: List[int] = []
+        for i, (kind, text, _) in enumerate(self.tokens):
+            if kind != "op":
+                continue
+            if text == "(":
+                stack.append(i)
+            elif text == ")" and stack:
+                self.matching[i] = stack.pop()
+
+    def text(self, i: int) -> str:
+        return self.tokens[i][1] if 0 <= i < len(self.tokens) else ""
+
+    def _name_before(self, paren: int) -> Optional[str]:
+        """Name of the function whose parameter list opens at token `paren`, if it is one."""
+        before, keyword = self.text(paren - 1), self.text(paren - 2)
+        if self.language == "go":
+            if before == "func":
+                return "<anonymous>"
+            if keyword == "func":
+                return before
+            # Method: func (receiver) Name(...)
+            if keyword == ")" and self.text(self.matching.get(paren - 2, -1) - 1) == "func":
+                return before
+            return None
+        if before == "function" or (before == "*" and keyword == "function"):
+            return "<anonymous>"
+        if paren < 1 or self.tokens[paren - 1][0] != "name":
+            return None
+        if before in CONTROL_KEYWORDS or keyword in ("new", "."):
+            return None
+        return before
+
+    def _arrow_name(self, arrow: int) -> str:
+        """`const name = (...) =>` / `name: (...) =>` / `x -> ` names the arrow function."""
+        start = arrow - 1
+        if self.text(start) == ")":
+            start = self.matching.get(start, start)
+        start -= 1
+        if self.text(start) == "async":
+            start -= 1
+        if start >= 1 and self.text(start) in ("=", ":") and self.tokens[start - 1][0] == "name":
+            return self.text(start - 1)
+        return "<arrow>"
+
+    def _function_at(self, brace: int) -> Optional[str]:
+        """Returns the function name if the `{` at `brace` opens a function body."""
+        previous = self.text(brace - 1)
+        if previous in ("=>", "->"):
+            return self._arrow_name(brace - 1)
+        # Skip a return type / throws clause back to the parameter list
+        i = brace - 1
+        tail = 0
+        while i >= 0 and self.text(i) != ")" and tail < 24:
+            kind, text, _ = self.tokens[i]
+            if kind != "name" and text not in TYPE_TAIL:
+                return None
+            i -= 1
+            tail += 1
+        if i < 0 or self.text(i) != ")":
+            return None
+        if tail and self.language in ("javascript", "typescript") and self.text(i + 1) != ":":
+            return None
+        if tail and self.language == "java" and self.text(i + 1) != "throws":
+            return None
+        paren = self.matching.get(i)
+        if paren is None:
+            return None
+        if self.language == "go" and self.text(paren - 1) == ")" and (paren - 1) in self.matching:
+            # Result list: func name(params) (results) {
+            inner = self.matching[paren - 1]
+            if self._name_before(inner) is not None:
+                return self._name_before(inner)
+        return self._name_before(paren)
+
+    def _class_at(self, brace: int) -> Optional[str]:
+        i = brace - 1
+        while i >= 0 and self.text(i) not in (";", "{", "}"):
+            if self.text(i) in CLASS_KEYWORDS and self.tokens[i + 1][0] == "name":
+                return self.text(i + 1)
+            if self.language == "go" and self.text(i) == "type" and self.tokens[i + 1][0] == "name":
+                return self.text(i + 1)
+            i -= 1
+        return None
+
+    def is_ternary(self, i: int) -> bool:
+        if self.language == "go":
+            return False
+        following = self.text(i + 1)
+        # TS optional members (`x?: T`) and Java wildcards (`<?>`, `<? extends T>`)
+        return following not in (":", ")", ",", ">", "=", ";", "extends", "super")
+
+    def run(self) -> FileMetrics:
+        scopes: List[Tuple[str, object]] = []
+
+        def add(kind: str, line: int):
+            self.metrics.complexity += 1
+            function = next((scope for tag, scope in reversed(scopes) if tag == "function"), None)
+            if isinstance(function, FunctionMetric):
+                function.add(kind)
+            else:
+                self.metrics.module_decisions.append((line, kind))
+
+        for i, (kind, text, line) in enumerate(self.tokens):
+            if kind == "name" and text in BRACE_DECISIONS:
+                # `do { } while (x);` counts once; `else if` counts only the `if`
+                add(text, line)
+            elif kind == "op":
+                if text in ("&&", "||", "??"):
+                    add(text, line)
+                elif text == "?" and self.is_ternary(i):
+                    add("ternary", line)
+                elif text == "{":
+                    name = self._function_at(i)
+                    if name is not None:
+                        prefix = [scope for tag, scope in scopes if tag == "class"]
+                        function = FunctionMetric(".".join([str(p) for p in prefix] + [name]), line, line)
+                        self.metrics.functions.append(function)
+                        scopes.append(("function", function))
+                    else:
+                        class_name = self._class_at(i)
+                        scopes.append(("class", class_name) if class_name else ("block", None))
+                elif text == "}" and scopes:
+                    tag, scope = scopes.pop()
+                    if tag == "function" and isinstance(scope, FunctionMetric):
+                        scope.end_line = line
+        return self.metrics
+
+
+def analyze_brace_language(path: str, source: str, language: str) -> FileMetrics:
+    return _BraceAnalyzer(FileMetrics(path, language), source).run()
+
+
+def analyze_source(path: str, source: str) -> FileMetrics:
+    """
+    Per-function complexity of a whole file. Runs in worker processes, so it only takes and
+    returns picklable values; failures are reported in `error` rather than raised.
+    """
+    language = source_language(path) or "unknown"
+    if language == "unknown":
+        return FileMetrics(path, language, error="unsupported language")
+    if len(source) > MAX_SOURCE_BYTES:
+        return FileMetrics(path, language, error="file too large")
+    try:
+        if language == "python":
+            return analyze_python(path, source)
+        return analyze_brace_language(path, source, language)
+    except (SyntaxError, ValueError, RecursionError) as e:
+        return FileMetrics(path, language, error=f"{type(e).__name__}: {e}")
+
+
+def build_complexity_report(diff_files: Iterable[DiffFile], file_metrics: Dict[str, FileMetrics]) -> ComplexityReport:
+    """
+    Scores what a PR changes: for every file analyzed at the head commit, the complexity of
+    each function containing an added line (plus decisions on added top-level lines); other
+    files fall back to the branch-token proxy over their added lines.
+    """
+    report = ComplexityReport(total=1)
+    for diff_file in diff_files:
+        if diff_file.is_binary or diff_file.is_deleted or diff_file.skipped:
+            continue
+        metrics = file_metrics.get(diff_file.path)
+        if metrics is None or metrics.error:
+            file_result, branches = diff_file_complexity(diff_file)
+        else:
+            added = {line_no for hunk in diff_file.hunks for line_no, _ in hunk.added_lines()}
+            file_result, branches = FileComplexity(path=diff_file.path, complexity=1), {}
+            for function in metrics.touched_functions(added):
+                file_result.functions[function.name] = function.complexity
+                file_result.complexity += function.complexity - 1
+                for decision, count in function.decisions.items():
+                    branches[decision] = branches.get(decision, 0) + count
+            for line_no, decision in metrics.module_decisions:
+                if line_no in added:
+                    file_result.complexity += 1
+                    branches[decision] = branches.get(decision, 0) + 1
+        for token, count in branches.items():
+            report.branches[token] = report.branches.get(token, 0) + count
+        report.total += file_result.complexity - 1
+        report.files.append(file_result)
+    return report
+
+
+class ComplexityEngine:
+    """
+    Analyzes changed files at the PR head, caching results by blob SHA so a file that did not
+    change between reviews (or PRs) is never parsed twice. Large batches are fanned out over
+    a process pool, created on first use.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, parallel_threshold: int = DEFAULT_PARALLEL_THRESHOLD,
+                 max_entries: int = 4096):
+        self.max_workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+        self.parallel_threshold = parallel_threshold
+        self.cache = LRUCache(max_entries=max_entries, default_ttl=None)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    @staticmethod
+    def _key(path: str, blob_sha: str) -> str:
+        # The language comes from the extension, so a renamed blob is analyzed again
+        return f"complexity:{posixpath.splitext(path)[1].lower()}:{blob_sha}"
+
+    def lookup(self, blobs: Dict[str, str]) -> Tuple[Dict[str, FileMetrics], Dict[str, str]]:
+        """Splits {path: blob SHA} into cached metrics and the blobs still to analyze."""
+        found: Dict[str, FileMetrics] = {}
+        missing: Dict[str, str] = {}
+        for path, blob_sha in blobs.items():
+            metrics = self.cache.get(self._key(path, blob_sha))
+            if metrics is not None:
+                found[path] = replace(metrics, path=path)
+            else:
+                missing[path] = blob_sha
+        return found, missing
+
+    async def analyze(self, sources: Dict[str, Tuple[str, str]]) -> Dict[str, FileMetrics]:
+        """Analyzes {path: (blob SHA, text)} and caches every result."""
+        items = list(sources.items())
+        if len(items) >= self.parallel_threshold and self.max_workers > 1:
+            loop = asyncio.get_running_loop()
+            try:
+                analyzed = await asyncio.gather(*(loop.run_in_executor(self.executor, analyze_source, path, text)
+                                                  for path, (_, text) in items))
+            except Exception as e:
+                print(f"Complexity process pool failed ({e}), analyzing in a thread")
+                self.shutdown()
+                analyzed = await asyncio.to_thread(lambda: [analyze_source(path, text) for path, (_, text) in items])
+        else:
+            analyzed = await asyncio.to_thread(lambda: [analyze_source(path, text) for path, (_, text) in items])
+        results = {}
+        for (path, (blob_sha, _)), metrics in zip(items, analyzed):
+            self.cache.set(self._key(path, blob_sha), metrics, ttl=None)
+            results[path] = metrics
+        return results
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,305 @@
+import time
+import asyncio
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .cache import LRUCache
+from .complexity import ComplexityEngine, build_complexity_report, source_language
+from .diff_packer import pack_diff, path_skip_reason, DEFAULT_DIFF_TOKEN_BUDGET
+from .diff_parser import DiffStreamReader, ParsedDiff
+from .metrics import stage
+from .similarity import RepoIndexCache, build_repo_index, format_duplicate_report, SOURCE_EXTENSIONS
+from .tree_summary import RepoTree, RepoTreeCache, DEFAULT_OUTLINE_LINES, DEFAULT_MAX_MANIFESTS
+
+# Root manifests tried when no tree index is available
+DEPENDENCY_FILES = ("package.json", "requirements.txt")
+
+# Changed source files read per GraphQL request for the complexity engine
+BLOB_BATCH_SIZE = 50
+
+# Streaming caps for PR diffs: anything past them is not fetched
+DEFAULT_MAX_DIFF_BYTES = 10 * 1024 * 1024
+DEFAULT_MAX_DIFF_FILES = 1000
+
+
+class MissingDiffError(Exception):
+    """GitHub returned no diff (rate limited, unavailable or empty PR), so there is nothing to review."""
+
+
+@dataclass
+class ReviewContext:
+    """Inputs of one Layer 1 run plus every step result and how long each step took."""
+    repo_full_name: str
+    pr_number: int
+    instruction: str = ""
+    use_cache: bool = True
+    results: Dict[str, Any] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def __getitem__(self, name: str) -> Any:
+        return self.results[name]
+
+    def timing_report(self) -> Dict[str, float]:
+        return {name: round(seconds * 1000, 1) for name, seconds in self.timings.items()}
+
+
+@dataclass
+class PipelineStep:
+    """
+    One named unit of work. `run` receives the context once every step in `requires` has
+    finished, reads their results from it, and returns this step's result.
+    """
+    name: str
+    run: Callable[[ReviewContext], Awaitable[Any]]
+    requires: Tuple[str, ...] = ()
+
+
+class ContextPipeline:
+    """
+    Runs a dependency graph of steps over a `ReviewContext`. Each step starts as soon as its
+    requirements are done, so independent steps (GitHub fetches) overlap; a result already in
+    the context is reused instead of running the step again.
+    """
+
+    def __init__(self, steps: Iterable[PipelineStep] = ()):
+        self.steps: Dict[str, PipelineStep] = {}
+        for step in steps:
+            self.add_step(step)
+
+    def add_step(self, step: PipelineStep):
+        """Adds `step`, replacing any step with the same name."""
+        self.steps[step.name] = step
+
+    async def _run_step(self, step: PipelineStep, context: ReviewContext, requirements: List[Awaitable[Any]]):
+        await asyncio.gather(*requirements)
+        if step.name in context.results:
+            return
+        started = time.perf_counter()
+        try:
+            with stage(f"layer1.{step.name}"):
+                context.results[step.name] = await step.run(context)
+        finally:
+            context.timings[step.name] = time.perf_counter() - started
+
+    async def run(self, context: ReviewContext, targets: Optional[Iterable[str]] = None) -> ReviewContext:
+        """Runs `targets` (default: every step) and whatever they depend on."""
+        tasks: Dict[str, "asyncio.Future[None]"] = {}
+
+        def schedule(name: str) -> "asyncio.Future[None]":
+            if name not in tasks:
+                step = self.steps[name]
+                requirements = [schedule(required) for required in step.requires]
+                tasks[name] = asyncio.ensure_future(self._run_step(step, context, requirements))
+            return tasks[name]
+
+        for name in (targets if targets is not None else list(self.steps)):
+            schedule(name)
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+        return context
+
+
+def format_deterministic_metrics(complexity_report, duplicate_matches) -> str:
+    """Renders the metrics block embedded in the Layer 1 prompt."""
+    similarity_score, duplicate_report = format_duplicate_report(duplicate_matches)
+    return f"""
+    - **Cyclomatic Complexity Score**: {complexity_report.total} (If > 15, flag as High Risk / Bug Prone)
+    - **Complexity Breakdown (functions the PR changes, at the head commit)**:
+{complexity_report.summary()}
+    - **DRY Violation (Similarity to Existing Source Code)**: {similarity_score}% (If > 80%, flag as duplicate code smell and demand it be imported instead of copied)
+    - **Closest Existing Code Regions**:
+{duplicate_report}
+    """
+
+
+class ParsedDiffCache:
+    """
+    Parsed PR diffs, keyed by PR and streaming caps, with the ETag of the response they were
+    parsed from. Re-reviews of an unchanged PR send that ETag, get a 304 and reuse the parsed
+    files instead of downloading and parsing the diff again. Bounded by the diff bytes held.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entries: int = 256):
+        self.cache = LRUCache(max_entries=max_entries, max_bytes=max_bytes, default_ttl=None)
+
+    def key(self, repo_full_name: str, pr_number: int, max_bytes: Optional[int], max_files: Optional[int]) -> str:
+        return f"diff:{repo_full_name}#{pr_number}:{max_bytes}:{max_files}"
+
+    def get(self, key: str) -> Tuple[Optional[str], Optional[ParsedDiff]]:
+        entry = self.cache.get_entry(key)
+        return (entry.etag, entry.value) if entry is not None else (None, None)
+
+    def put(self, key: str, etag: str, parsed: ParsedDiff):
+        self.cache.set(key, parsed, ttl=None, etag=etag, size=max(parsed.bytes_read, 1))
+
+
+async def fetch_parsed_diff(gh_client: Any, repo_full_name: str, pr_number: int,
+                            max_bytes: Optional[int] = DEFAULT_MAX_DIFF_BYTES,
+                            max_files: Optional[int] = DEFAULT_MAX_DIFF_FILES,
+                            diff_cache: Optional[ParsedDiffCache] = None) -> ParsedDiff:
+    """
+    Streams the PR diff into parsed files, dropping lockfile/generated/vendored hunks as they
+    arrive and stopping at the byte/file caps. Raises MissingDiffError when nothing came back.
+    With `diff_cache`, the request is conditional on the cached diff's ETag.
+    """
+    key = diff_cache.key(repo_full_name, pr_number, max_bytes, max_files) if diff_cache is not None else ""
+    etag, cached = diff_cache.get(key) if diff_cache is not None else (None, None)
+    response_info: Dict[str, Any] = {}
+    reader = DiffStreamReader(max_bytes, max_files, path_skip_reason)
+    async with aclosing(gh_client.stream_pr_diff(repo_full_name, pr_number, etag, response_info)) as lines:
+        async for line in lines:
+            if not reader.feed(line):
+                break
+    if cached is not None and response_info.get("status") == 304:
+        diff_cache.cache.record("revalidated")
+        return cached
+    parsed = reader.finish()
+    if not parsed.files:
+        raise MissingDiffError(f"No diff for {repo_full_name}#{pr_number}")
+    if parsed.truncated:
+        print(f"Diff for {repo_full_name}#{pr_number} truncated by the {parsed.truncated_by} cap after {parsed.bytes_read} bytes / {len(parsed.files)} files")
+    if diff_cache is not None:
+        diff_cache.cache.record("misses")
+        if response_info.get("etag"):
+            diff_cache.put(key, response_info["etag"], parsed)
+    return parsed
+
+
+def build_layer1_pipeline(gh_client: Any, ai_engine: Any, duplicate_index_cache: Optional[RepoIndexCache] = None,
+                          diff_token_budget: int = DEFAULT_DIFF_TOKEN_BUDGET,
+                          max_diff_bytes: Optional[int] = DEFAULT_MAX_DIFF_BYTES,
+                          max_diff_files: Optional[int] = DEFAULT_MAX_DIFF_FILES,
+                          tree_cache: Optional[RepoTreeCache] = None,
+                          outline_lines: int = DEFAULT_OUTLINE_LINES,
+                          max_manifests: int = DEFAULT_MAX_MANIFESTS,
+                          complexity_engine: Optional[ComplexityEngine] = None,
+                          diff_cache: Optional[ParsedDiffCache] = None) -> ContextPipeline:
+    """
+    The Layer 1 sequence shared by the webhook, the extension API and batch runs:
+    diff, tree, PR metadata and dependency files are fetched concurrently, then duplicate
+    detection, metrics and diff packing, and finally the Layer 1 Gemini call. The diff is
+    streamed and parsed once; later steps work on the parsed files, never on the raw text.
+    """
+    index_cache = duplicate_index_cache if duplicate_index_cache is not None else RepoIndexCache()
+    tree_cache = tree_cache if tree_cache is not None else RepoTreeCache()
+    complexity_engine = complexity_engine if complexity_engine is not None else ComplexityEngine()
+
+    async def diff(ctx: ReviewContext):
+        return await fetch_parsed_diff(gh_client, ctx.repo_full_name, ctx.pr_number, max_diff_bytes, max_diff_files,
+                                       diff_cache)
+
+    def head_ref(ctx: ReviewContext) -> str:
+        return ctx["pull_request"]["head"]["sha"] if ctx["pull_request"] else "main"
+
+    async def repo_tree(ctx: ReviewContext) -> Optional[RepoTree]:
+        # The tree at the PR head is immutable, so it is fetched and indexed once per commit
+        head_sha = ctx["pull_request"]["head"]["sha"] if ctx["pull_request"] else None
+        if head_sha:
+            tree = tree_cache.get_for_commit(ctx.repo_full_name, head_sha)
+            if tree is not None:
+                return tree
+        tree_json = await gh_client.get_repo_tree(ctx.repo_full_name, head_sha or "main")
+        if tree_json is None:
+            return None
+        if head_sha:
+            return await asyncio.to_thread(tree_cache.put, ctx.repo_full_name, head_sha, tree_json)
+        return await asyncio.to_thread(RepoTree.from_tree_json, tree_json)
+
+    async def repo_structure(ctx: ReviewContext):
+        if ctx["repo_tree"] is None:
+            return "Unknown Structure"
+        return ctx["repo_tree"].outline([f.path for f in ctx["diff"].files], outline_lines)
+
+    async def pull_request(ctx: ReviewContext):
+        return await gh_client.get_pull_request(ctx.repo_full_name, ctx.pr_number)
+
+    async def dependency_files(ctx: ReviewContext):
+        tree = ctx["repo_tree"]
+        if tree is None:
+            contents = await asyncio.gather(*(gh_client.get_file_content(ctx.repo_full_name, name, head_ref(ctx))
+                                              for name in DEPENDENCY_FILES))
+            return {name: content for name, content in zip(DEPENDENCY_FILES, contents) if content}
+        # Manifests nearest to the changed files, read at the PR head in a single request
+        manifests = tree.find_manifests([f.path for f in ctx["diff"].files], max_manifests)
+        if not manifests:
+            return {}
+        return await gh_client.get_blobs(ctx.repo_full_name, head_ref(ctx), manifests)
+
+    async def key_context(ctx: ReviewContext):
+        files = ctx["dependency_files"]
+        if not files:
+            return "No specific dependency files configured."
+        return "\n\n".join(f"{path}:\n" + content[:1000] for path, content in files.items())
+
+    async def duplicates(ctx: ReviewContext):
+        if not ctx["pull_request"]:
+            return []
+        head_sha = ctx["pull_request"]["head"]["sha"]
+        index = index_cache.get(ctx.repo_full_name, head_sha)
+        if index is None:
+            files = await gh_client.get_repo_files(ctx.repo_full_name, head_sha, SOURCE_EXTENSIONS)
+            if files is None:
+                # Not cached, so the next review of this head tries the archive again
+                return []
+            index = await asyncio.to_thread(build_repo_index, files)
+            index_cache.put(ctx.repo_full_name, head_sha, index)
+        return await asyncio.to_thread(index.query_diff, ctx["diff"].files)
+
+    async def head_complexity(ctx: ReviewContext):
+        # Changed source files at the PR head, by blob SHA; unchanged blobs come from the cache
+        tree = ctx["repo_tree"]
+        if tree is None or not ctx["pull_request"]:
+            return {}
+        blobs = {}
+        for diff_file in ctx["diff"].files:
+            blob_sha = tree.blob_sha(diff_file.path)
+            if blob_sha and source_language(diff_file.path) and not (
+                    diff_file.is_binary or diff_file.is_deleted or diff_file.skipped):
+                blobs[diff_file.path] = blob_sha
+        found, missing = complexity_engine.lookup(blobs)
+        if not missing:
+            return found
+        paths = list(missing)
+        batches = await asyncio.gather(*(
+            gh_client.get_blobs(ctx.repo_full_name, head_ref(ctx), {path: missing[path] for path in paths[i:i + BLOB_BATCH_SIZE]})
+            for i in range(0, len(paths), BLOB_BATCH_SIZE)
+        ))
+        sources = {path: (missing[path], text) for batch in batches for path, text in batch.items()}
+        return {**found, **await complexity_engine.analyze(sources)}
+
+    async def metrics(ctx: ReviewContext):
+        complexity_report = await asyncio.to_thread(build_complexity_report, ctx["diff"].files, ctx["head_complexity"])
+        return format_deterministic_metrics(complexity_report, ctx["duplicates"])
+
+    async def packed_diff(ctx: ReviewContext):
+        return await asyncio.to_thread(pack_diff, ctx["diff"], diff_token_budget, ctx["duplicates"])
+
+    async def enhanced_prompt(ctx: ReviewContext):
+        return await ai_engine.layer_1_enhance_prompt_async(
+            basic_prompt=ctx.instruction,
+            repo_structure=ctx["repo_structure"],
+            key_files_context=ctx["key_context"],
+            pr_diff=ctx["packed_diff"].text,
+            deterministic_metrics=ctx["metrics"],
+            use_cache=ctx.use_cache,
+        )
+
+    return ContextPipeline([
+        # The head SHA is read before the diff, so a push in between makes the recorded SHA
+        # older than the reviewed diff (re-reviewing a few files) rather than newer (skipping them)
+        PipelineStep("pull_request", pull_request),
+        PipelineStep("diff", diff, ("pull_request",)),
+        PipelineStep("repo_tree", repo_tree, ("pull_request",)),
+        PipelineStep("repo_structure", repo_structure, ("repo_tree", "diff")),
+        PipelineStep("dependency_files", dependency_files, ("pull_request", "repo_tree", "diff")),
+        PipelineStep("key_context", key_context, ("dependency_files",)),
+        PipelineStep("duplicates", duplicates, ("pull_request", "diff")),
+        PipelineStep("head_complexity", head_complexity, ("pull_request", "repo_tree", "diff")),
+        PipelineStep("metrics", metrics, ("diff", "duplicates", "head_complexity")),
+        PipelineStep("packed_diff", packed_diff, ("diff", "duplicates")),
+        PipelineStep("enhanced_prompt", enhanced_prompt, ("repo_structure", "key_context", "packed_diff", "metrics")),
+    ])
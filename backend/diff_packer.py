@@ -0,0 +1,227 @@
+import math
+from dataclasses import dataclass, field, replace
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from .algorithms import calculate_cyclomatic_complexity
+from .diff_parser import DiffFile, DiffHunk, ParsedDiff, parse_unified_diff
+from .similarity import DuplicateMatch
+
+DEFAULT_DIFF_TOKEN_BUDGET = 24_000
+
+LOCKFILES = (
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "Pipfile.lock",
+    "Cargo.lock", "go.sum", "composer.lock", "Gemfile.lock", "uv.lock",
+)
+GENERATED_SUFFIXES = (
+    ".min.js", ".min.css", ".map", "_pb2.py", "_pb2_grpc.py", ".pb.go", ".snap",
+    ".lock",
+)
+GENERATED_DIRS = ("dist/", "build/", "vendor/", "node_modules/", "__generated__/", "generated/")
+GENERATED_MARKERS = ("@generated", "DO NOT EDIT", "auto-generated", "autogenerated")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for code)."""
+    return math.ceil(len(text) / 4)
+
+
+def path_skip_reason(path: str) -> Optional[str]:
+    """
+    Returns why a file should never reach the LLM judging by its path alone (lockfile,
+    generated or vendored), or None. Cheap enough to apply while a diff streams in.
+    """
+    name = path.rsplit("/", 1)[-1]
+    if name in LOCKFILES:
+        return "lockfile"
+    if path.endswith(GENERATED_SUFFIXES) or any(f"/{d}" in f"/{path}" for d in GENERATED_DIRS):
+        return "generated"
+    return None
+
+
+def skip_reason(diff_file: DiffFile) -> Optional[str]:
+    """
+    Returns why a file should never reach the LLM (lockfile, generated, binary), or None.
+    """
+    if diff_file.skipped:
+        return diff_file.skipped
+    if diff_file.is_binary:
+        return "binary"
+    reason = path_skip_reason(diff_file.path)
+    if reason:
+        return reason
+    head = "\n".join(line for hunk in diff_file.hunks[:1] for line in hunk.lines[:5])
+    if any(marker in head for marker in GENERATED_MARKERS):
+        return "generated"
+    return None
+
+
+@dataclass
+class PackedDiff:
+    text: str
+    original_tokens: int
+    packed_tokens: int
+    dropped_files: Dict[str, str] = field(default_factory=dict)
+    omitted_hunks: int = 0
+    files: List[DiffFile] = field(default_factory=list)
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(self.original_tokens - self.packed_tokens, 0)
+
+    def report(self) -> Dict[str, int]:
+        return {
+            "original_tokens": self.original_tokens,
+            "packed_tokens": self.packed_tokens,
+            "tokens_saved": self.tokens_saved,
+            "dropped_files": len(self.dropped_files),
+            "omitted_hunks": self.omitted_hunks,
+        }
+
+
+def _hunk_score(diff_file: DiffFile, hunk: DiffHunk, duplicates: List[DuplicateMatch]) -> float:
+    """
+    Ranks a hunk by how much it matters to the review: added branching (complexity),
+    overlap with a near-duplicate region, and (weakly) the size of the change.
+    """
+    added = hunk.added_lines()
+    complexity = calculate_cyclomatic_complexity("\n".join(text for _, text in added)) - 1
+    duplicate_score = 0.0
+    if added:
+        first, last = added[0][0], added[-1][0]
+        for match in duplicates:
+            if match.diff_path == diff_file.path and match.diff_start_line <= last and match.diff_end_line >= first:
+                duplicate_score = max(duplicate_score, match.score)
+    changed = sum(1 for line in hunk.lines if line[:1] in ("+", "-"))
+    return complexity * 2.0 + duplicate_score * 10.0 + math.log1p(changed)
+
+
+def pack_diff(pr_diff: Union[str, ParsedDiff, Iterable[DiffFile]], token_budget: int = DEFAULT_DIFF_TOKEN_BUDGET,
+              duplicates: Optional[List[DuplicateMatch]] = None, original_tokens: Optional[int] = None) -> PackedDiff:
+    """
+    Fits a unified diff into `token_budget`: drops lockfiles, generated and binary files,
+    then keeps the highest-value hunks (by complexity and duplication) and re-emits them in
+    their original order, followed by a note listing what was left out.
+    """
+    truncated = False
+    if isinstance(pr_diff, str):
+        original_tokens = estimate_tokens(pr_diff)
+        diff_files = parse_unified_diff(pr_diff)
+    elif isinstance(pr_diff, ParsedDiff):
+        original_tokens = math.ceil(pr_diff.bytes_read / 4)
+        diff_files = pr_diff.files
+        truncated = pr_diff.truncated
+    else:
+        diff_files = list(pr_diff)
+        if original_tokens is None:
+            original_tokens = sum(estimate_tokens(f.text()) for f in diff_files)
+    duplicates = duplicates or []
+
+    dropped: Dict[str, str] = {}
+    candidates: List[Tuple[float, int, int, int]] = []  # (score, file index, hunk index, tokens)
+    kept_files: List[DiffFile] = []
+    for diff_file in diff_files:
+        reason = skip_reason(diff_file)
+        if reason:
+            dropped[diff_file.path] = reason
+            continue
+        file_index = len(kept_files)
+        kept_files.append(diff_file)
+        for hunk_index, hunk in enumerate(diff_file.hunks):
+            tokens = estimate_tokens(hunk.text())
+            candidates.append((_hunk_score(diff_file, hunk, duplicates), file_index, hunk_index, tokens))
+
+    header_tokens = {i: estimate_tokens("\n".join(f.header_lines)) for i, f in enumerate(kept_files)}
+    selected = set()
+    used = 0
+    files_with_hunks = set()
+    for score, file_index, hunk_index, tokens in sorted(candidates, key=lambda c: -c[0]):
+        cost = tokens + (0 if file_index in files_with_hunks else header_tokens[file_index])
+        if used + cost > token_budget:
+            continue
+        used += cost
+        selected.add((file_index, hunk_index))
+        files_with_hunks.add(file_index)
+
+    parts = []
+    packed_files = []
+    omitted: Dict[str, int] = {}
+    for file_index, diff_file in enumerate(kept_files):
+        hunks = [h for i, h in enumerate(diff_file.hunks) if (file_index, i) in selected]
+        if len(hunks) < len(diff_file.hunks):
+            omitted[diff_file.path] = len(diff_file.hunks) - len(hunks)
+        if hunks or not diff_file.hunks:
+            packed_file = replace(diff_file, hunks=hunks)
+            packed_files.append(packed_file)
+            parts.append(packed_file.text())
+
+    notes = []
+    if truncated:
+        notes.append("# [DULA] The diff exceeded the size limit; files after this point were not fetched.")
+    if omitted:
+        listed = ", ".join(f"{path} ({count})" for path, count in omitted.items())
+        notes.append(f"# [DULA] Omitted lower-priority hunks to fit the token budget: {listed}")
+    if dropped:
+        listed = ", ".join(f"{path} ({reason})" for path, reason in dropped.items())
+        notes.append(f"# [DULA] Skipped files: {listed}")
+    text = "\n".join(parts + notes)
+    return PackedDiff(
+        text=text,
+        original_tokens=original_tokens,
+        packed_tokens=estimate_tokens(text),
+        dropped_files=dropped,
+        omitted_hunks=sum(omitted.values()),
+        files=packed_files,
+    )
+
+
+@dataclass
+class DiffShard:
+    """A slice of the diff reviewed by one map-reduce call, with the files it covers."""
+    text: str
+    paths: List[str] = field(default_factory=list)
+
+
+def shard_diff(diff_files: List[DiffFile], shard_token_budget: int) -> List[DiffShard]:
+    """
+    Groups files into diff shards of at most ~`shard_token_budget` tokens for map-reduce
+    reviews. Small files are batched together; a file larger than the budget is split
+    into hunk groups, each repeating the file header.
+    """
+    shards: List[DiffShard] = []
+    current: List[str] = []
+    current_paths: List[str] = []
+    current_tokens = 0
+
+    def flush():
+        nonlocal current, current_paths, current_tokens
+        if current:
+            shards.append(DiffShard("\n".join(current), current_paths))
+        current, current_paths, current_tokens = [], [], 0
+
+    for diff_file in diff_files:
+        text = diff_file.text()
+        tokens = estimate_tokens(text)
+        if tokens <= shard_token_budget:
+            if current_tokens + tokens > shard_token_budget:
+                flush()
+            current.append(text)
+            current_paths.append(diff_file.path)
+            current_tokens += tokens
+            continue
+
+        flush()
+        header = "\n".join(diff_file.header_lines)
+        group: List[str] = []
+        group_tokens = estimate_tokens(header)
+        for hunk in diff_file.hunks:
+            hunk_text = hunk.text()
+            hunk_tokens = estimate_tokens(hunk_text)
+            if group and group_tokens + hunk_tokens > shard_token_budget:
+                shards.append(DiffShard("\n".join([header] + group), [diff_file.path]))
+                group, group_tokens = [], estimate_tokens(header)
+            group.append(hunk_text)
+            group_tokens += hunk_tokens
+        if group:
+            shards.append(DiffShard("\n".join([header] + group), [diff_file.path]))
+    flush()
+    return shards
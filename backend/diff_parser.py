@@ -0,0 +1,220 @@
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@(.*)$")
+
+
+@dataclass
+class DiffHunk:
+    """A single `@@` hunk of a unified diff, with its raw (prefixed) lines."""
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    section: str = ""
+    lines: List[str] = field(default_factory=list)
+
+    @property
+    def header(self) -> str:
+        return f"@@ -{self.old_start},{self.old_count} +{self.new_start},{self.new_count} @@{self.section}"
+
+    def added_lines(self) -> List[Tuple[int, str]]:
+        """
+        Returns the `+` lines of the hunk as (new_line_number, text) pairs, without the prefix.
+        """
+        result = []
+        line_no = self.new_start
+        for line in self.lines:
+            if line.startswith("+"):
+                result.append((line_no, line[1:]))
+                line_no += 1
+            elif line.startswith(" ") or line == "":
+                line_no += 1
+        return result
+
+    def text(self) -> str:
+        return self.header + "\n" + "\n".join(self.lines)
+
+
+@dataclass
+class DiffFile:
+    """All hunks of one file in a unified diff."""
+    path: str
+    old_path: Optional[str] = None
+    is_binary: bool = False
+    is_deleted: bool = False
+    header_lines: List[str] = field(default_factory=list)
+    hunks: List[DiffHunk] = field(default_factory=list)
+    # Why the file's hunks were dropped while parsing (vendored, lockfile, ...), if they were
+    skipped: Optional[str] = None
+
+    def text(self) -> str:
+        return "\n".join(self.header_lines + [hunk.text() for hunk in self.hunks])
+
+
+def _strip_path_prefix(path: str) -> Optional[str]:
+    path = path.strip()
+    if path == "/dev/null":
+        return None
+    if path.startswith("a/") or path.startswith("b/"):
+        return path[2:]
+    return path
+
+
+class DiffParser:
+    """
+    Incremental unified diff parser. Feed it lines with `feed_line` and collect finished
+    files from the return value; call `close` at the end to flush the last file.
+    When `skip_path` returns a reason for a file's path, its hunk lines are discarded as
+    they arrive and only the file header is kept.
+    """
+
+    def __init__(self, skip_path: Optional[Callable[[str], Optional[str]]] = None):
+        self.skip_path = skip_path
+        self.current: Optional[DiffFile] = None
+        self.hunk: Optional[DiffHunk] = None
+        self.discarding = False
+
+    def feed_line(self, line: str) -> Optional[DiffFile]:
+        finished = None
+        if line.startswith("diff --git "):
+            finished = self.close()
+            parts = line[len("diff --git "):].split(" b/", 1)
+            new_path = parts[1] if len(parts) == 2 else parts[0]
+            old_path = _strip_path_prefix(parts[0])
+            self.current = DiffFile(path=new_path, old_path=old_path, header_lines=[line])
+            self.discarding = False
+            if self.skip_path is not None:
+                self.current.skipped = self.skip_path(new_path)
+            return finished
+
+        if self.current is None:
+            return None
+
+        if self.current.skipped:
+            # Keep the short file header for reporting, drop everything from the first hunk on
+            if line.startswith("@@"):
+                self.discarding = True
+            elif not self.discarding:
+                self.current.header_lines.append(line)
+            return None
+
+        match = HUNK_HEADER_RE.match(line)
+        if match:
+            self.hunk = DiffHunk(
+                old_start=int(match.group(1)),
+                old_count=int(match.group(2) or 1),
+                new_start=int(match.group(3)),
+                new_count=int(match.group(4) or 1),
+                section=match.group(5),
+            )
+            self.current.hunks.append(self.hunk)
+        elif self.hunk is not None and line[:1] in ("+", "-", " ", "\\", ""):
+            self.hunk.lines.append(line)
+        else:
+            self.current.header_lines.append(line)
+            if line.startswith("Binary files ") or line.startswith("GIT binary patch"):
+                self.current.is_binary = True
+            elif line.startswith("deleted file mode"):
+                self.current.is_deleted = True
+            elif line.startswith("+++ "):
+                path = _strip_path_prefix(line[4:])
+                if path:
+                    self.current.path = path
+        return finished
+
+    def close(self) -> Optional[DiffFile]:
+        finished = self.current
+        self.current = None
+        self.hunk = None
+        return finished
+
+
+def iter_diff_files(lines: Iterable[str], skip_path: Optional[Callable[[str], Optional[str]]] = None) -> Iterator[DiffFile]:
+    """Lazily yields the files of a unified diff from an iterable of lines."""
+    parser = DiffParser(skip_path)
+    for line in lines:
+        finished = parser.feed_line(line)
+        if finished is not None:
+            yield finished
+    last = parser.close()
+    if last is not None:
+        yield last
+
+
+def parse_unified_diff(diff_text: str) -> List[DiffFile]:
+    """
+    Parses a `git diff` style unified diff into files and hunks.
+    """
+    return list(iter_diff_files(diff_text.splitlines()))
+
+
+@dataclass
+class ParsedDiff:
+    """A diff parsed from a stream: the files kept, what was skipped and whether caps were hit."""
+    files: List[DiffFile] = field(default_factory=list)
+    skipped: Dict[str, str] = field(default_factory=dict)
+    bytes_read: int = 0
+    truncated: bool = False
+    # Which cap stopped the stream: "bytes" or "files"
+    truncated_by: Optional[str] = None
+
+    def text(self) -> str:
+        """Re-emits the kept files as a unified diff (skipped files are left out)."""
+        return "\n".join(f.text() for f in self.files if not f.skipped)
+
+
+class DiffStreamReader:
+    """
+    Builds a `ParsedDiff` from diff lines as they arrive (e.g. from a streamed HTTP response),
+    so the raw diff text is never held in memory. Reading stops once `max_bytes` have been
+    consumed or `max_files` files have started; `feed` then returns False.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, max_files: Optional[int] = None,
+                 skip_path: Optional[Callable[[str], Optional[str]]] = None):
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.parser = DiffParser(skip_path)
+        self.result = ParsedDiff()
+        self.files_started = 0
+
+    def _add(self, diff_file: Optional[DiffFile]):
+        if diff_file is None:
+            return
+        if diff_file.skipped:
+            self.result.skipped[diff_file.path] = diff_file.skipped
+        self.result.files.append(diff_file)
+
+    def _truncate(self, cap: str) -> bool:
+        self.result.truncated = True
+        self.result.truncated_by = cap
+        return False
+
+    def feed(self, line: str) -> bool:
+        if self.result.truncated:
+            return False
+        # UTF-8 size of the line plus its newline, as it came over the wire
+        self.result.bytes_read += (len(line) if line.isascii() else len(line.encode("utf-8"))) + 1
+        if self.max_bytes is not None and self.result.bytes_read > self.max_bytes:
+            return self._truncate("bytes")
+        if line.startswith("diff --git "):
+            self.files_started += 1
+            if self.max_files is not None and self.files_started > self.max_files:
+                return self._truncate("files")
+        self._add(self.parser.feed_line(line))
+        return True
+
+    def finish(self) -> ParsedDiff:
+        """
+        Flushes the last file. When the byte cap cut it off, its possibly partial last hunk is
+        dropped; the file cap only ever stops at a file boundary, so nothing is lost then.
+        """
+        last = self.parser.close()
+        if last is not None and self.result.truncated_by == "bytes" and last.hunks:
+            last.hunks.pop()
+            if not last.hunks:
+                last = None
+        self._add(last)
+        return self.result
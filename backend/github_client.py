@@ -1,59 +1,376 @@
-import os
-import requests  # type: ignore
-from typing import Dict, Any, Optional
+import io
+import re
+import json
+import asyncio
+import tarfile
+import httpx  # type: ignore
+from typing import Dict, Any, AsyncIterator, Iterable, Iterator, List, Optional, Tuple
 
-class GitHubClient:
-    def __init__(self, token: str):
+from .cache import LRUCache
+from .metrics import timed
+from .rate_limiter import GitHubRateLimiter
+from .tree_summary import RepoTree
+
+API_URL = "https://api.github.com"
+RAW_URL = "https://raw.githubusercontent.com"
+
+# (connect, read) timeouts in seconds for every GitHub call.
+DEFAULT_TIMEOUT = (5.0, 30.0)
+
+SHA_RE = re.compile(r"^[0-9a-f]{40}$")
+
+# Transport errors raised before the request left the client; safe to resend even for a POST.
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def _tree_to_structure(tree_json: Dict[str, Any], touched_paths: Iterable[str] = ()) -> str:
+    # A budgeted outline centred on the touched paths keeps the prompt small on monorepos
+    return RepoTree.from_tree_json(tree_json).outline(touched_paths)
+
+
+def _iter_tarball(content: bytes, extensions: Tuple[str, ...], max_file_bytes: int) -> Iterator[Tuple[str, str]]:
+    with tarfile.open(fileobj=io.BytesIO(content), mode="r:gz") as archive:
+        for member in archive:
+            if not member.isfile() or member.size > max_file_bytes:
+                continue
+            # Archive entries are prefixed with "<owner>-<repo>-<sha>/"
+            path = member.name.split("/", 1)[-1]
+            if extensions and not path.endswith(extensions):
+                continue
+            handle = archive.extractfile(member)
+            if handle is None:
+                continue
+            try:
+                yield path, handle.read().decode("utf-8")
+            except UnicodeDecodeError:
+                continue
+
+
+def _is_sha(ref: str) -> bool:
+    return bool(SHA_RE.match(ref))
+
+
+def _blob_query(repo_full_name: str, ref: str, paths: List[str]) -> str:
+    """One GraphQL query that reads every path at `ref`, aliased f0, f1, ..."""
+    owner, name = repo_full_name.split("/", 1)
+    fields = " ".join(
+        f"f{i}: object(expression: {json.dumps(f'{ref}:{path}')}) {{ ... on Blob {{ text isBinary }} }}"
+        for i, path in enumerate(paths)
+    )
+    return f"query {{ repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ {fields} }} }}"
+
+
+def _parse_blob_response(payload: Dict[str, Any], paths: List[str]) -> Optional[Dict[str, str]]:
+    """Maps the aliased GraphQL result back to {path: text}; None when the query itself failed."""
+    repository = (payload.get("data") or {}).get("repository")
+    if repository is None:
+        return None
+    texts = {}
+    for i, path in enumerate(paths):
+        blob = repository.get(f"f{i}")
+        if blob and not blob.get("isBinary") and blob.get("text") is not None:
+            texts[path] = blob["text"]
+    return texts
+
+
+class CachedResponse:
+    """The subset of the httpx response interface used by the client, served from cache."""
+
+    def __init__(self, content: bytes, status_code: int = 200):
+        self.content = content
+        self.status_code = status_code
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+
+class ResponseCacheMixin:
+    """
+    GET caching for `AsyncGitHubClient`. Content addressed by a commit/blob SHA
+    is cached without expiry; mutable resources (PR metadata, diffs, branch refs) are stored
+    already expired, so every read revalidates them with `If-None-Match`. A 304 is not
+    charged against the rate limit, and a push is never hidden behind a stale entry.
+    """
+
+    cache: LRUCache
+
+    def _cache_key(self, url: str, accept: str = "") -> str:
+        return f"{url}|{accept}"
+
+    def _cache_begin(self, key: str) -> Tuple[Optional[CachedResponse], Dict[str, str]]:
+        entry = self.cache.get_entry(key)
+        if entry is None:
+            self.cache.record("misses")
+            return None, {}
+        if entry.is_fresh():
+            self.cache.record("hits")
+            return CachedResponse(entry.value), {}
+        self.cache.record("expired")
+        if entry.etag:
+            return None, {"If-None-Match": entry.etag}
+        return None, {}
+
+    def _cached_blobs(self, blobs: Dict[str, str]) -> Tuple[Dict[str, str], List[str]]:
+        """Splits {path: blob SHA} into texts already cached by blob SHA and paths still to fetch."""
+        texts, missing = {}, []
+        for path, sha in blobs.items():
+            text = self.cache.get(f"blob:{sha}") if sha else None
+            if text is not None:
+                texts[path] = text
+            else:
+                missing.append(path)
+        return texts, missing
+
+    def _remember_blobs(self, blobs: Dict[str, str], texts: Dict[str, str]):
+        for path, text in texts.items():
+            if blobs.get(path):
+                self.cache.set(f"blob:{blobs[path]}", text, ttl=None)
+
+    def _cache_finish(self, key: str, response: Any, immutable: bool) -> Any:
+        if response.status_code == 304:
+            entry = self.cache.get_entry(key)
+            if entry is not None:
+                self.cache.record("revalidated")
+                self.cache.touch(key, ttl=None if immutable else 0)
+                return CachedResponse(entry.value)
+        if response.status_code == 200 and (immutable or response.headers.get("ETag")):
+            # Without an ETag a mutable response could never be revalidated, so it is not kept
+            self.cache.set(key, response.content, ttl=None if immutable else 0,
+                           etag=response.headers.get("ETag"))
+        return response
+
+
+class AsyncGitHubClient(ResponseCacheMixin):
+    """
+    GitHub REST/GraphQL client built on pooled `httpx.AsyncClient`s (one per host,
+    so each host gets its own connection limit) with keep-alive and timeouts.
+    """
+
+    def __init__(self, token: str, timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+                 max_connections_per_host: int = 20, max_keepalive_per_host: int = 10,
+                 cache: Optional[LRUCache] = None, rate_limiter: Optional[GitHubRateLimiter] = None):
         self.token = token
+        self.cache = cache if cache is not None else LRUCache()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else GitHubRateLimiter()
         self.headers = {
             "Authorization": f"Bearer {self.token}",
             "Accept": "application/vnd.github.v3+json",
         }
+        connect_timeout, read_timeout = timeout
+        client_options = {
+            "timeout": httpx.Timeout(read_timeout, connect=connect_timeout),
+            "limits": httpx.Limits(max_connections=max_connections_per_host,
+                                   max_keepalive_connections=max_keepalive_per_host),
+            "follow_redirects": True,
+        }
+        self.api = httpx.AsyncClient(base_url=API_URL, headers=self.headers, **client_options)
+        self.raw = httpx.AsyncClient(base_url=RAW_URL, headers={"Authorization": f"token {self.token}"}, **client_options)
+
+    async def aclose(self):
+        await self.api.aclose()
+        await self.raw.aclose()
 
-    def get_pr_diff(self, rep_full_name: str, pr_number: int) -> str:
+    async def _send(self, client: Any, method: str, path: str, idempotent: bool = True,
+                    stream: bool = False, **kwargs) -> Any:
+        """
+        Sends a request paced by the rate limiter, retrying transient failures. A
+        non-idempotent request (a POST that creates something) is only resent after errors
+        where it never reached GitHub, so a timed-out comment is not posted twice. With
+        `stream=True` a successful response body is left unread and the caller must close it.
+        """
+        attempt = 0
+        while True:
+            wait = self.rate_limiter.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                response = await client.send(client.build_request(method, path, **kwargs), stream=stream)
+                if stream and response.status_code != 200:
+                    await response.aread()
+            except httpx.TransportError as e:
+                delay = self.rate_limiter.error_delay(attempt) if idempotent or isinstance(e, NOT_SENT_ERRORS) else None
+                if delay is None:
+                    raise
+                print(f"GitHub {method} {path} failed ({e}), retrying in {delay:.1f}s")
+            else:
+                self.rate_limiter.update(response.headers)
+                delay = self.rate_limiter.retry_delay(response, attempt, idempotent)
+                if delay is None:
+                    return response
+                print(f"GitHub {method} {path} returned {response.status_code}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _get(self, client: Any, path: str, headers: Optional[Dict[str, str]] = None,
+                   params: Optional[Dict[str, str]] = None, immutable: bool = False) -> Any:
+        headers = headers or {}
+        url = str(client.build_request("GET", path, params=params).url)
+        key = self._cache_key(url, headers.get("Accept", ""))
+        cached, conditional = self._cache_begin(key)
+        if cached is not None:
+            return cached
+        response = await self._send(client, "GET", path, headers={**headers, **conditional}, params=params)
+        return self._cache_finish(key, response, immutable)
+
+    @timed("github.get_pr_diff")
+    async def get_pr_diff(self, rep_full_name: str, pr_number: int) -> str:
         """
         Fetches the raw diff of the pull request to analyze code changes.
         """
-        url = f"https://api.github.com/repos/{rep_full_name}/pulls/{pr_number}"
-        headers = self.headers.copy()
-        headers["Accept"] = "application/vnd.github.v3.diff"  # Get diff format
-        
-        response = requests.get(url, headers=headers)
+        response = await self._get(self.api, f"/repos/{rep_full_name}/pulls/{pr_number}",
+                                   headers={"Accept": "application/vnd.github.v3.diff"})
+        if response.status_code == 200:
+            return response.text
+        print(f"Failed to fetch PR diff: {response.text}")
+        return ""
+
+    @timed("github.get_compare_diff")
+    async def get_compare_diff(self, repo_full_name: str, base: str, head: str) -> Optional[str]:
+        """
+        Fetches the diff between two commits (e.g. the previously reviewed and the current PR
+        head). Returns None when GitHub cannot compare them, e.g. after a force push.
+        """
+        response = await self._get(self.api, f"/repos/{repo_full_name}/compare/{base}...{head}",
+                                   headers={"Accept": "application/vnd.github.v3.diff"},
+                                   immutable=_is_sha(base) and _is_sha(head))
         if response.status_code == 200:
             return response.text
-        else:
-            print(f"Failed to fetch PR diff: {response.text}")
-            return ""
+        print(f"Failed to fetch compare diff: {response.status_code}")
+        return None
+
+    @timed("github.stream_pr_diff")
+    async def stream_pr_diff(self, repo_full_name: str, pr_number: int, etag: Optional[str] = None,
+                             response_info: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """
+        Streams the PR diff line by line, so very large diffs are never held in memory whole.
+        With `etag` the request is conditional: an unchanged diff comes back as a 304, which
+        GitHub does not charge against the rate limit, and nothing is yielded. `response_info`
+        receives the response's status code and ETag.
+        """
+        headers = {"Accept": "application/vnd.github.v3.diff"}
+        if etag:
+            headers["If-None-Match"] = etag
+        response = await self._send(self.api, "GET", f"/repos/{repo_full_name}/pulls/{pr_number}",
+                                    headers=headers, stream=True)
+        if response_info is not None:
+            response_info.update(status=response.status_code, etag=response.headers.get("ETag"))
+        try:
+            if response.status_code == 304:
+                return
+            if response.status_code != 200:
+                print(f"Failed to stream PR diff: {response.status_code}")
+                return
+            async for line in response.aiter_lines():
+                yield line.rstrip("\r\n")
+        finally:
+            await response.aclose()
+
+    @timed("github.get_pull_request")
+    async def get_pull_request(self, repo_full_name: str, pr_number: int) -> Optional[Dict[str, Any]]:
+        """
+        Fetches the pull request metadata (head/base SHAs, branch names, ...).
+        """
+        response = await self._get(self.api, f"/repos/{repo_full_name}/pulls/{pr_number}")
+        if response.status_code == 200:
+            return response.json()
+        print(f"Failed to fetch PR metadata: {response.text}")
+        return None
+
+    @timed("github.list_open_pull_requests")
+    async def list_open_pull_requests(self, repo_full_name: str, max_pulls: int = 500) -> List[Dict[str, Any]]:
+        """
+        Lists the open pull requests of a repository, most recently updated first.
+        """
+        pulls: List[Dict[str, Any]] = []
+        page = 1
+        while len(pulls) < max_pulls:
+            response = await self._get(self.api, f"/repos/{repo_full_name}/pulls",
+                                       params={"state": "open", "sort": "updated", "direction": "desc",
+                                               "per_page": "100", "page": str(page)})
+            if response.status_code != 200:
+                print(f"Failed to list pull requests: {response.status_code}")
+                break
+            batch = response.json()
+            pulls.extend(batch)
+            if len(batch) < 100:
+                break
+            page += 1
+        return pulls[:max_pulls]
+
+    @timed("github.get_repo_files")
+    async def get_repo_files(self, repo_full_name: str, ref: str, extensions: Tuple[str, ...] = (), max_file_bytes: int = 200_000) -> Optional[List[Tuple[str, str]]]:
+        """
+        Downloads the repository tarball at `ref` and returns (path, text) for every text file,
+        or None when the archive could not be fetched.
+        Archives bypass the response cache (one large repository would evict everything else);
+        callers cache what they build from the files, e.g. the duplicate-code index per head SHA.
+        Extraction runs in a worker thread so the event loop keeps serving other requests.
+        """
+        response = await self._send(self.api, "GET", f"/repos/{repo_full_name}/tarball/{ref}")
+        if response.status_code != 200:
+            print(f"Failed to fetch repository archive: {response.status_code}")
+            return None
+        return await asyncio.to_thread(lambda: list(_iter_tarball(response.content, extensions, max_file_bytes)))
 
-    def get_repo_structure(self, repo_full_name: str, branch: str = "main") -> str:
+    @timed("github.get_repo_tree")
+    async def get_repo_tree(self, repo_full_name: str, ref: str = "main") -> Optional[Dict[str, Any]]:
         """
-        Fetches the repository file tree up to 2 levels deep to understand context.
+        Fetches the recursive git tree at `ref`; cached without expiry when `ref` is a commit SHA.
         """
-        url = f"https://api.github.com/repos/{repo_full_name}/git/trees/{branch}?recursive=1"
-        response = requests.get(url, headers=self.headers)
+        response = await self._get(self.api, f"/repos/{repo_full_name}/git/trees/{ref}",
+                                   params={"recursive": "1"}, immutable=_is_sha(ref))
         if response.status_code == 200:
-            tree = response.json().get("tree", [])
-            # Filter and truncate for prompt size
-            files = [str(item["path"]) for item in tree if item["type"] == "blob"]
-            return "\n".join(files[:100])  # type: ignore
+            return response.json()
+        return None
+
+    @timed("github.get_repo_structure")
+    async def get_repo_structure(self, repo_full_name: str, branch: str = "main", touched_paths: Iterable[str] = ()) -> str:
+        """
+        Fetches the repository file tree and summarizes it around the touched paths.
+        """
+        tree_json = await self.get_repo_tree(repo_full_name, branch)
+        if tree_json is not None:
+            return _tree_to_structure(tree_json, touched_paths)
         return "Unknown Structure"
 
-    def get_file_content(self, repo_full_name: str, file_path: str, branch: str = "main") -> Optional[str]:
+    @timed("github.get_file_content")
+    async def get_file_content(self, repo_full_name: str, file_path: str, branch: str = "main") -> Optional[str]:
         """
         Fetches the content of a specific important file (e.g. package.json, requirements.txt, pom.xml).
         """
-        url = f"https://raw.githubusercontent.com/{repo_full_name}/{branch}/{file_path}"
-        headers = {"Authorization": f"token {self.token}"}
-        response = requests.get(url, headers=headers)
+        response = await self._get(self.raw, f"/{repo_full_name}/{branch}/{file_path}", immutable=_is_sha(branch))
         if response.status_code == 200:
-             return response.text
+            return response.text
         return None
 
-    def post_comment(self, repo_full_name: str, issue_number: int, body: str) -> bool:
+    @timed("github.get_blobs")
+    async def get_blobs(self, repo_full_name: str, ref: str, blobs: Dict[str, str]) -> Dict[str, str]:
+        """
+        Reads several files at `ref` ({path: blob SHA}) in one GraphQL request, falling back
+        to concurrent raw fetches when GraphQL is unavailable. Texts are cached by blob SHA.
+        """
+        texts, missing = self._cached_blobs(blobs)
+        if missing:
+            response = await self._send(self.api, "POST", "/graphql",
+                                        json={"query": _blob_query(repo_full_name, ref, missing)})
+            fetched = _parse_blob_response(response.json(), missing) if response.status_code == 200 else None
+            if fetched is None:
+                print(f"GraphQL blob fetch failed ({response.status_code}), falling back to raw files")
+                contents = await asyncio.gather(*(self.get_file_content(repo_full_name, path, ref) for path in missing))
+                fetched = {path: text for path, text in zip(missing, contents) if text is not None}
+            self._remember_blobs(blobs, fetched)
+            texts.update(fetched)
+        return {path: texts[path] for path in blobs if path in texts}
+
+    @timed("github.post_comment")
+    async def post_comment(self, repo_full_name: str, issue_number: int, body: str) -> bool:
         """
         Posts a comment back to the GitHub PR (which is technically an issue comment).
         """
-        url = f"https://api.github.com/repos/{repo_full_name}/issues/{issue_number}/comments"
-        payload = {"body": body}
-        response = requests.post(url, headers=self.headers, json=payload)
+        response = await self._send(self.api, "POST", f"/repos/{repo_full_name}/issues/{issue_number}/comments",
+                                    idempotent=False, json={"body": body})
         return response.status_code == 201
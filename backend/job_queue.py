@@ -0,0 +1,222 @@
+import json
+import time
+import uuid
+import asyncio
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from .review_store import _sqlite_connection
+
+# Lower runs first: a `/confirm` finishes a review someone is waiting for, a `/review` starts one.
+PRIORITY_CONFIRM = 0
+PRIORITY_REVIEW = 1
+
+
+class QueueFull(Exception):
+    """Raised by `JobQueue.submit` when the pending-job limit is reached."""
+
+
+@dataclass
+class Job:
+    kind: str
+    repo_full_name: str
+    pr_number: int
+    payload: Dict[str, Any] = field(default_factory=dict)
+    priority: int = PRIORITY_REVIEW
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    enqueued_at: float = field(default_factory=time.time)
+
+    @property
+    def key(self) -> Tuple[str, str, int]:
+        """Jobs with the same key are coalesced while they wait."""
+        return (self.kind, self.repo_full_name, self.pr_number)
+
+    @property
+    def pr_key(self) -> Tuple[str, int]:
+        return (self.repo_full_name, self.pr_number)
+
+
+class JobStore:
+    """Persists waiting jobs so they survive a restart."""
+
+    def save(self, job: Job):
+        raise NotImplementedError
+
+    def delete(self, job_id: str):
+        raise NotImplementedError
+
+    def load_all(self) -> List[Job]:
+        raise NotImplementedError
+
+
+class SQLiteJobStore(JobStore):
+    def __init__(self, path: str):
+        self.path = path
+        with _sqlite_connection(self.path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS webhook_jobs ("
+                " job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, repo_full_name TEXT NOT NULL,"
+                " pr_number INTEGER NOT NULL, payload TEXT NOT NULL, priority INTEGER NOT NULL,"
+                " enqueued_at REAL NOT NULL)"
+            )
+
+    def save(self, job: Job):
+        with _sqlite_connection(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO webhook_jobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job.job_id, job.kind, job.repo_full_name, job.pr_number, json.dumps(job.payload),
+                 job.priority, job.enqueued_at),
+            )
+
+    def delete(self, job_id: str):
+        with _sqlite_connection(self.path) as conn:
+            conn.execute("DELETE FROM webhook_jobs WHERE job_id = ?", (job_id,))
+
+    def load_all(self) -> List[Job]:
+        with _sqlite_connection(self.path) as conn:
+            rows = conn.execute(
+                "SELECT job_id, kind, repo_full_name, pr_number, payload, priority, enqueued_at"
+                " FROM webhook_jobs ORDER BY enqueued_at"
+            ).fetchall()
+        return [Job(kind, repo, pr, json.loads(payload), priority, job_id, enqueued_at)
+                for job_id, kind, repo, pr, payload, priority, enqueued_at in rows]
+
+
+class JobQueue:
+    """
+    In-process scheduler for webhook work. Jobs wait in a bounded queue and are picked by
+    priority, then round-robin across repositories so one busy repo cannot starve the rest.
+    A job that is still waiting absorbs later duplicates for the same PR (the newest payload
+    wins) as long as no other job for that PR was queued after it, and jobs for one PR run
+    one at a time in the order they arrived.
+    """
+
+    def __init__(self, handlers: Dict[str, Callable[..., Awaitable[Any]]], workers: int = 4,
+                 max_pending: int = 256, store: Optional[JobStore] = None):
+        self.handlers = handlers
+        self.workers = workers
+        self.max_pending = max_pending
+        self.store = store
+        # priority -> repo -> waiting jobs
+        self.levels: Dict[int, "OrderedDict[str, Deque[Job]]"] = {}
+        # job_id -> waiting job, and the newest waiting job of every key
+        self.jobs: Dict[str, Job] = {}
+        self.waiting: Dict[Tuple[str, str, int], Job] = {}
+        self.pr_order: Dict[Tuple[str, int], Deque[str]] = {}
+        self.running: set = set()
+        self.tasks: List["asyncio.Task[None]"] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self.counters = {"enqueued": 0, "coalesced": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    @property
+    def wakeup(self) -> asyncio.Event:
+        # Created lazily so the queue can be built at import time, outside the event loop
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        return self._wakeup
+
+    def _push(self, job: Job):
+        self.levels.setdefault(job.priority, OrderedDict()).setdefault(job.repo_full_name, deque()).append(job)
+        self.jobs[job.job_id] = job
+        self.waiting[job.key] = job
+        self.pr_order.setdefault(job.pr_key, deque()).append(job.job_id)
+        self.wakeup.set()
+
+    async def submit(self, job: Job) -> Job:
+        """
+        Queues `job`, or folds it into an identical job that has not started yet and is still
+        the last one queued for its PR. Folding into an earlier job would move the new payload
+        ahead of jobs queued after that one: `/review A`, `/confirm`, `/review B` must not run
+        the confirmation against B's prompt. Raises QueueFull when `max_pending` jobs are waiting.
+        """
+        queued = self.waiting.get(job.key)
+        if queued is not None and self.pr_order[job.pr_key][-1] == queued.job_id:
+            queued.payload = job.payload
+            self.counters["coalesced"] += 1
+            if self.store is not None:
+                await asyncio.to_thread(self.store.save, queued)
+            return queued
+        if len(self.jobs) >= self.max_pending:
+            self.counters["rejected"] += 1
+            raise QueueFull(f"{len(self.jobs)} jobs already waiting")
+        self._push(job)
+        self.counters["enqueued"] += 1
+        if self.store is not None:
+            await asyncio.to_thread(self.store.save, job)
+        return job
+
+    def _next_job(self) -> Optional[Job]:
+        for priority in sorted(self.levels):
+            repos = self.levels[priority]
+            for repo_full_name, jobs in list(repos.items()):
+                for job in jobs:
+                    if job.pr_key in self.running or self.pr_order[job.pr_key][0] != job.job_id:
+                        continue
+                    jobs.remove(job)
+                    if jobs:
+                        repos.move_to_end(repo_full_name)
+                    else:
+                        del repos[repo_full_name]
+                    del self.jobs[job.job_id]
+                    if self.waiting.get(job.key) is job:
+                        del self.waiting[job.key]
+                    return job
+        return None
+
+    async def _run(self, job: Job):
+        self.running.add(job.pr_key)
+        finished = False
+        try:
+            await self.handlers[job.kind](job.repo_full_name, job.pr_number, **job.payload)
+            self.counters["completed"] += 1
+            finished = True
+        except Exception as e:
+            self.counters["failed"] += 1
+            finished = True
+            print(f"Job {job.kind} for {job.repo_full_name}#{job.pr_number} failed: {e}")
+        finally:
+            self.running.discard(job.pr_key)
+            order = self.pr_order[job.pr_key]
+            order.popleft()
+            if not order:
+                del self.pr_order[job.pr_key]
+            self.wakeup.set()
+        # A job interrupted by shutdown stays persisted and runs again after a restart
+        if finished and self.store is not None:
+            await asyncio.to_thread(self.store.delete, job.job_id)
+
+    async def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            await self._run(job)
+
+    async def start(self):
+        """Restores persisted jobs and starts the worker pool."""
+        if self.store is not None:
+            restored = [job for job in await asyncio.to_thread(self.store.load_all)
+                        if job.kind in self.handlers and job.job_id not in self.jobs]
+            for job in restored:
+                self._push(job)
+            if restored:
+                print(f"Restored {len(restored)} queued webhook jobs")
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stops the workers; with a store, jobs that did not finish run again after a restart."""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self.counters)
+        stats["waiting"] = len(self.jobs)
+        stats["running"] = len(self.running)
+        stats["workers"] = self.workers
+        return stats
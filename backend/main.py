@@ -1,18 +1,68 @@
 import os
 import hmac
+import json
+import time
+import asyncio
 import hashlib
-from fastapi import FastAPI, Request, HTTPException, BackgroundTasks  # type: ignore
+from contextlib import asynccontextmanager
+from typing import Any, Optional, Union
+
+# Reported as dula_startup_seconds{phase="import"} once the module has loaded
+IMPORT_STARTED = time.perf_counter()
+from fastapi import FastAPI, Request, HTTPException  # type: ignore
 from fastapi.middleware.cors import CORSMiddleware  # type: ignore
+from fastapi.responses import PlainTextResponse, StreamingResponse  # type: ignore
+from fastapi.concurrency import run_in_threadpool  # type: ignore
 from pydantic import BaseModel  # type: ignore
 from dotenv import load_dotenv  # type: ignore
 
-from .github_client import GitHubClient  # type: ignore
+try:
+    import orjson  # type: ignore
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+from .github_client import AsyncGitHubClient  # type: ignore
+from .cache import LRUCache, DiskCacheBackend
+from .review_store import (PendingReviewStore, SQLitePendingReviewStore, RedisPendingReviewStore, ReviewHistoryStore,
+                           SQLiteReviewHistoryStore, RedisReviewHistoryStore, review_key_digest, DEFAULT_PENDING_TTL, DEFAULT_HISTORY_TTL)
 from .ai_engine import AIEngine  # type: ignore
-from .algorithms import calculate_levenshtein_distance, calculate_cyclomatic_complexity
+from .diff_packer import pack_diff, shard_diff, DEFAULT_DIFF_TOKEN_BUDGET
+from .diff_parser import ParsedDiff, parse_unified_diff
+from .similarity import RepoIndexCache
+from .tree_summary import RepoTreeCache
+from .context_pipeline import (ContextPipeline, ParsedDiffCache, ReviewContext, MissingDiffError, build_layer1_pipeline, fetch_parsed_diff,
+                               DEFAULT_MAX_DIFF_BYTES, DEFAULT_MAX_DIFF_FILES)
+from .rate_limiter import GitHubRateLimiter
+from .complexity import ComplexityEngine
+from .job_queue import JobQueue, Job, SQLiteJobStore, QueueFull, PRIORITY_CONFIRM, PRIORITY_REVIEW
+from .metrics import REGISTRY, STARTUP_SECONDS, review_scope
 
 load_dotenv()
 
-app = FastAPI(title="DULA: Dual-Layer LLM Code Review Bot")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clients are built on first use (see get_gh_client/get_ai_engine), so the app serves
+    # health checks while the Gemini SDK has not been imported yet
+    if not GITHUB_TOKEN or not GEMINI_API_KEY:
+        print("Warning: GITHUB_TOKEN or GEMINI_API_KEY is not set; reviews will fail.")
+    # The state stores touch the SQLite file (or Redis), so they are opened here, off the event loop
+    await asyncio.to_thread(get_pending_reviews)
+    await asyncio.to_thread(get_review_history)
+    await get_job_queue().start()
+    try:
+        yield
+    finally:
+        await get_job_queue().stop()
+        # Let streamed Layer 2 reviews whose clients disconnected finish posting their comment
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        if gh_client is not None:
+            await gh_client.aclose()
+        if redis_client is not None:
+            redis_client.close()
+        complexity_engine.shutdown()
+
+app = FastAPI(title="DULA: Dual-Layer LLM Code Review Bot", lifespan=lifespan)
 
 # Enable CORS so the Chromium Extension can send requests from github.com
 app.add_middleware(
@@ -27,17 +77,218 @@ app.add_middleware(
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Optional directory for persisting cached GitHub responses across restarts/workers
+CACHE_DIR = os.getenv("DULA_CACHE_DIR")
+# LLM result cache: entry lifetime and optional directory for persisting results
+LLM_CACHE_TTL = float(os.getenv("DULA_LLM_CACHE_TTL", str(24 * 60 * 60)))
+LLM_CACHE_DIR = os.getenv("DULA_LLM_CACHE_DIR")
+# SQLite file shared by all workers for Layer 1 prompts awaiting /confirm
+STATE_DB = os.getenv("DULA_STATE_DB", "dula_state.db")
+PENDING_TTL = float(os.getenv("DULA_PENDING_TTL", DEFAULT_PENDING_TTL))
+# How long the per-shard findings of a PR's last map-reduce review are kept for incremental re-reviews
+HISTORY_TTL = float(os.getenv("DULA_HISTORY_TTL", DEFAULT_HISTORY_TTL))
+# Optional Redis URL for sharing pending reviews across hosts (requires the `redis` package)
+REDIS_URL = os.getenv("DULA_REDIS_URL")
+# Approximate token budget for the PR diff embedded in the Layer 1 / Layer 2 prompts
+DIFF_TOKEN_BUDGET = int(os.getenv("DULA_DIFF_TOKEN_BUDGET", DEFAULT_DIFF_TOKEN_BUDGET))
+# Caps for streaming PR diffs from GitHub; the rest of a larger diff is not fetched
+MAX_DIFF_BYTES = int(os.getenv("DULA_MAX_DIFF_BYTES", DEFAULT_MAX_DIFF_BYTES))
+MAX_DIFF_FILES = int(os.getenv("DULA_MAX_DIFF_FILES", DEFAULT_MAX_DIFF_FILES))
+# Line budget of the repository outline embedded in the Layer 1 prompt
+TREE_OUTLINE_LINES = int(os.getenv("DULA_TREE_OUTLINE_LINES", "80"))
+# Map-reduce Layer 2: shard size, shard cap, parallel shard reviews and the shard count that triggers it
+SHARD_TOKEN_BUDGET = int(os.getenv("DULA_SHARD_TOKEN_BUDGET", "6000"))
+MAX_SHARDS = int(os.getenv("DULA_MAX_SHARDS", "16"))
+MAP_REDUCE_WORKERS = int(os.getenv("DULA_MAP_REDUCE_WORKERS", "4"))
+MAP_REDUCE_MIN_SHARDS = int(os.getenv("DULA_MAP_REDUCE_MIN_SHARDS", "3"))
+# GitHub request pacing: max requests per second (lowered automatically near the rate limit) and retries
+GITHUB_RATE = float(os.getenv("DULA_GITHUB_RATE", "10"))
+GITHUB_MAX_RETRIES = int(os.getenv("DULA_GITHUB_MAX_RETRIES", "3"))
+# Webhook job scheduler: worker pool size, waiting-job limit and whether waiting jobs are kept in STATE_DB
+JOB_WORKERS = int(os.getenv("DULA_JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("DULA_JOB_QUEUE_SIZE", "256"))
+PERSIST_JOBS = os.getenv("DULA_PERSIST_JOBS", "").lower() in ("1", "true", "yes")
+# Processes parsing changed files for the complexity metrics (0: one per CPU)
+COMPLEXITY_WORKERS = int(os.getenv("DULA_COMPLEXITY_WORKERS", "0"))
+
+# Initialize caches; the clients using them are built on first use
+github_cache = LRUCache(disk_backend=DiskCacheBackend(CACHE_DIR) if CACHE_DIR else None)
+# Paces GitHub calls across all in-flight reviews and retries rate-limited/5xx responses
+github_rate_limiter = GitHubRateLimiter(rate=GITHUB_RATE, max_retries=GITHUB_MAX_RETRIES)
+llm_cache = LRUCache(max_entries=512, default_ttl=LLM_CACHE_TTL,
+                     disk_backend=DiskCacheBackend(LLM_CACHE_DIR) if LLM_CACHE_DIR else None)
+gh_client: Optional[AsyncGitHubClient] = None
+ai_engine: Optional[AIEngine] = None
+
+# Durable store for Layer 1 prompts waiting for confirmation, shared across workers.
+# load() returns {"prompt": "...", "diff": "...", "head_sha": "...", "instruction": "..."}
+# review_history keeps the last reviewed head SHA and per-shard findings of every PR.
+# Both are opened by get_pending_reviews/get_review_history, so importing the app writes nothing.
+redis_client: Any = None
+pending_reviews: Optional[PendingReviewStore] = None
+review_history: Optional[ReviewHistoryStore] = None
+
+# MinHash/LSH duplicate-code indexes, built once per (repo, head SHA).
+duplicate_index_cache = RepoIndexCache()
+
+# Layer 1 context gathering shared by the webhook and the extension API
+# Repository tree indexes, built once per tree SHA
+repo_tree_cache = RepoTreeCache()
+# Per-function complexity of changed files at the PR head, cached by blob SHA
+complexity_engine = ComplexityEngine(max_workers=COMPLEXITY_WORKERS or None)
+# Parsed PR diffs, revalidated by ETag so re-reviews of an unchanged PR skip the download
+diff_cache = ParsedDiffCache()
+
+layer1_pipeline: Optional[ContextPipeline] = None
+
+def require_env(name: str, value: Optional[str]) -> str:
+    if not value:
+        raise RuntimeError(f"Missing {name} environment variable.")
+    return value
+
+# Dependency providers: each client is built the first time a request needs it
+def get_gh_client() -> AsyncGitHubClient:
+    global gh_client
+    if gh_client is None:
+        started = time.perf_counter()
+        gh_client = AsyncGitHubClient(token=require_env("GITHUB_TOKEN", GITHUB_TOKEN), cache=github_cache,
+                                      rate_limiter=github_rate_limiter)
+        STARTUP_SECONDS.set(time.perf_counter() - started, phase="github_client")
+    return gh_client
+
+def get_ai_engine() -> AIEngine:
+    # The Gemini SDK itself is only imported on the engine's first uncached call
+    global ai_engine
+    if ai_engine is None:
+        ai_engine = AIEngine(api_key=require_env("GEMINI_API_KEY", GEMINI_API_KEY),
+                             max_concurrency=int(os.getenv("DULA_LLM_CONCURRENCY", "8")), cache=llm_cache)
+    return ai_engine
+
+def get_redis_client() -> Any:
+    global redis_client
+    if redis_client is None:
+        import redis  # type: ignore
+        redis_client = redis.Redis.from_url(REDIS_URL)
+    return redis_client
+
+def get_pending_reviews() -> PendingReviewStore:
+    global pending_reviews
+    if pending_reviews is None:
+        pending_reviews = (RedisPendingReviewStore(get_redis_client(), ttl=PENDING_TTL) if REDIS_URL
+                           else SQLitePendingReviewStore(STATE_DB, ttl=PENDING_TTL))
+    return pending_reviews
+
+def get_review_history() -> ReviewHistoryStore:
+    global review_history
+    if review_history is None:
+        review_history = (RedisReviewHistoryStore(get_redis_client(), ttl=HISTORY_TTL) if REDIS_URL
+                          else SQLiteReviewHistoryStore(STATE_DB, ttl=HISTORY_TTL))
+    return review_history
+
+def get_layer1_pipeline() -> ContextPipeline:
+    global layer1_pipeline
+    if layer1_pipeline is None:
+        layer1_pipeline = build_layer1_pipeline(get_gh_client(), get_ai_engine(), duplicate_index_cache, DIFF_TOKEN_BUDGET,
+                                                MAX_DIFF_BYTES, MAX_DIFF_FILES, repo_tree_cache, TREE_OUTLINE_LINES,
+                                                complexity_engine=complexity_engine, diff_cache=diff_cache)
+    return layer1_pipeline
+
+async def run_layer1_pipeline(repo_full_name: str, pr_number: int, instruction: str, use_cache: bool = True) -> ReviewContext:
+    """Runs the shared Layer 1 context pipeline and logs how long each step took."""
+    with review_scope(repo_full_name, pr_number):
+        context = await get_layer1_pipeline().run(ReviewContext(repo_full_name, pr_number, instruction, use_cache))
+    print(f"Diff packing for {repo_full_name}#{pr_number}: {context['packed_diff'].report()}")
+    print(f"Layer 1 pipeline timings (ms) for {repo_full_name}#{pr_number}: {context.timing_report()}")
+    return context
+
+def plan_layer2_review(pr_diff: Union[str, ParsedDiff], review_mode: str = "auto"):
+    """
+    Decides how Layer 2 runs: one call over the packed diff ("single") or one call per diff
+    shard in parallel plus a reduce step ("map_reduce"). "auto" picks map-reduce when the
+    diff splits into at least MAP_REDUCE_MIN_SHARDS shards.
+    Returns (mode, packed diff, shards).
+    """
+    if review_mode != "single":
+        packed_diff = pack_diff(pr_diff, token_budget=SHARD_TOKEN_BUDGET * MAX_SHARDS)
+        shards = shard_diff(packed_diff.files, SHARD_TOKEN_BUDGET)
+        if review_mode == "map_reduce" or len(shards) >= MAP_REDUCE_MIN_SHARDS:
+            return "map_reduce", packed_diff, shards
+    return "single", pack_diff(pr_diff, token_budget=DIFF_TOKEN_BUDGET), []
+
+async def find_changed_paths(repo_full_name: str, old_head: str, new_head: str):
+    """
+    Returns the paths touched between two PR heads according to GitHub's compare diff, or
+    None when the heads cannot be compared (e.g. the branch was force-pushed).
+    """
+    if old_head == new_head:
+        return set()
+    compare_diff = await get_gh_client().get_compare_diff(repo_full_name, old_head, new_head)
+    if compare_diff is None:
+        return None
+    changed = set()
+    for diff_file in parse_unified_diff(compare_diff):
+        changed.update((diff_file.path, diff_file.old_path))
+    return changed
+
+async def fetch_pr_head_sha(repo_full_name: str, pr_number: int) -> Optional[str]:
+    """The PR's current head SHA; read before its diff, so it is never newer than the diff."""
+    pull_request = await get_gh_client().get_pull_request(repo_full_name, pr_number)
+    return pull_request["head"]["sha"] if pull_request else None
+
+async def run_sharded_review(repo_full_name: str, pr_number: int, confirmed_prompt: str, packed_diff,
+                             head_sha: Optional[str] = None, review_key: str = "", use_cache: bool = True) -> str:
+    """
+    Map-reduce Layer 2 that builds on the previous review of the same PR with the same review
+    key (the `/review` instruction): shards whose files were not touched since the last
+    reviewed head SHA keep their findings, and only the files changed by the new pushes are
+    re-sharded and sent to the LLM. `head_sha` must be the commit `packed_diff` was read at;
+    without it nothing is reused or recorded.
+    """
+    previous = await run_in_threadpool(get_review_history().load, repo_full_name, pr_number)
+
+    reused = []
+    if (use_cache and head_sha and previous
+            and previous.get("review_key") == review_key_digest(review_key or confirmed_prompt)):
+        changed_paths = await find_changed_paths(repo_full_name, previous["head_sha"], head_sha)
+        if changed_paths is not None:
+            current_paths = {diff_file.path for diff_file in packed_diff.files}
+            reused = [shard for shard in previous["shards"]
+                      if set(shard["paths"]) <= current_paths and not changed_paths.intersection(shard["paths"])]
 
-if not GITHUB_TOKEN or not GEMINI_API_KEY:
-    raise RuntimeError("Missing GITHUB_TOKEN or GEMINI_API_KEY environment variables.")
+    reused_paths = {path for shard in reused for path in shard["paths"]}
+    shards = shard_diff([f for f in packed_diff.files if f.path not in reused_paths], SHARD_TOKEN_BUDGET)
+    print(f"Layer 2 map-reduce over {len(shards)} new + {len(reused)} reused shards: {packed_diff.report()}")
+    findings = await get_ai_engine().map_shards_async(confirmed_prompt, [shard.text for shard in shards],
+                                                max_workers=MAP_REDUCE_WORKERS, use_cache=use_cache)
 
-# Initialize clients
-gh_client = GitHubClient(token=GITHUB_TOKEN)
-ai_engine = AIEngine(api_key=GEMINI_API_KEY)
+    # Merge reused and new findings back into diff order
+    position = {diff_file.path: i for i, diff_file in enumerate(packed_diff.files)}
+    results = reused + [{"paths": shard.paths, "findings": finding} for shard, finding in zip(shards, findings)]
+    results.sort(key=lambda shard: min(position.get(path, 0) for path in shard["paths"]))
+    review = await get_ai_engine().reduce_findings_async(confirmed_prompt, [shard["findings"] for shard in results], use_cache)
 
-# In-memory store for Layer 1 prompts waiting for confirmation.
-# Format: {(repo_full_name, pr_number): {"prompt": "...", "diff": "..."}}
-pending_reviews = {}
+    if head_sha:
+        # Failed shard calls are not remembered, so the next review retries them
+        completed = [shard for shard in results if shard["findings"] is not None]
+        await run_in_threadpool(get_review_history().save, repo_full_name, pr_number, head_sha,
+                                review_key or confirmed_prompt, completed)
+    return review
+
+async def generate_layer2_review(repo_full_name: str, pr_number: int, confirmed_prompt: str, pr_diff: Union[str, ParsedDiff],
+                                 review_mode: str = "auto", use_cache: bool = True, head_sha: Optional[str] = None,
+                                 review_key: str = ""):
+    """
+    Runs Layer 2 in the mode chosen by `plan_layer2_review`. `head_sha` and `review_key` are
+    passed on to `run_sharded_review`. Returns (review, packed diff).
+    """
+    mode, packed_diff, _ = plan_layer2_review(pr_diff, review_mode)
+    with review_scope(repo_full_name, pr_number):
+        if mode == "map_reduce":
+            review = await run_sharded_review(repo_full_name, pr_number, confirmed_prompt, packed_diff,
+                                              head_sha, review_key, use_cache)
+        else:
+            review = await get_ai_engine().layer_2_generate_review_async(confirmed_prompt, packed_diff.text, use_cache)
+    return review, packed_diff
 
 def verify_signature(payload_body: bytes, secret_token: str, signature_header: str):
     """Verify that the webhook payload was sent from GitHub."""
@@ -48,64 +299,33 @@ def verify_signature(payload_body: bytes, secret_token: str, signature_header: s
     if not hmac.compare_digest(expected_signature, signature_header):
          raise HTTPException(status_code=403, detail="Request signatures didn't match!")
 
-def process_review_request(repo_full_name: str, pr_number: int, user_instruction: str):
+async def process_review_request(repo_full_name: str, pr_number: int, user_instruction: str):
     """Background task for Layer 1 (Prompt Enhancement)"""
-    # 1. Post a reaction/comment to indicate we're working
-    gh_client.post_comment(
-        repo_full_name, pr_number, 
-        "⏳ **DULA Layer 1 Triggered:** Parsing categories, user intent, and mapping repository semantics. Please wait..."
+    # 1. Post a reaction/comment to indicate we're working, while
+    # 2-5. the Layer 1 pipeline fetches the context, computes metrics, packs the diff and enhances the prompt
+    _, context = await asyncio.gather(
+        get_gh_client().post_comment(
+            repo_full_name, pr_number,
+            "⏳ **DULA Layer 1 Triggered:** Parsing categories, user intent, and mapping repository semantics. Please wait..."
+        ),
+        run_layer1_pipeline(repo_full_name, pr_number, user_instruction),
+        return_exceptions=True,
     )
-    
-    # 2. Get the PR diff
-    pr_diff = gh_client.get_pr_diff(repo_full_name, pr_number)
-    
-    # 3. Get repository context (up to 2 levels deep)
-    repo_structure = gh_client.get_repo_structure(repo_full_name)
-    
-    # 4. Grab key dependency file for deeper context
-    key_context = "No specific dependency files configured."
-    if "package.json" in repo_structure:
-         content = gh_client.get_file_content(repo_full_name, "package.json")
-         if content: key_context = "package.json:\n" + content[:1000]
-    elif "requirements.txt" in repo_structure:
-         content = gh_client.get_file_content(repo_full_name, "requirements.txt")
-         if content: key_context = "requirements.txt:\n" + content[:1000]
-
-    # 4.2 Grab an existing source file to check for DRY violations
-    source_context = ""
-    # In a real app we'd scan all files, but for the demo we'll target the known utils file if it exists
-    if "utils/security.py" in repo_structure:
-         source_content = gh_client.get_file_content(repo_full_name, "utils/security.py")
-         if source_content: source_context = source_content
-    elif "main.py" in repo_structure:
-         source_content = gh_client.get_file_content(repo_full_name, "main.py")
-         if source_content: source_context = source_content
-
-    # 4.5. Compute Deterministic Metrics
-    complexity = calculate_cyclomatic_complexity(pr_diff)
-    similarity_score = 0.0
-    if source_context:
-         similarity_score = calculate_levenshtein_distance(pr_diff, source_context)
-         
-    deterministic_metrics = f"""
-    - **Cyclomatic Complexity Score**: {complexity} (If > 15, flag as High Risk / Bug Prone)
-    - **DRY Violation (Similarity to Existing Source Code)**: {similarity_score}% (If > 80%, flag as duplicate code smell and demand it be imported instead of copied)
-    """
+    if isinstance(context, MissingDiffError):
+        await get_gh_client().post_comment(repo_full_name, pr_number, "❌ **Error:** Could not fetch the PR diff from GitHub. Please retry `/review` in a few minutes.")
+        return
+    if isinstance(context, BaseException):
+        raise context
 
-    # 5. Execute Layer 1: Context-Aware Enhancement
-    enhanced_prompt = ai_engine.layer_1_enhance_prompt(
-        basic_prompt=user_instruction,
-        repo_structure=repo_structure,
-        key_files_context=key_context,
-        pr_diff=pr_diff,
-        deterministic_metrics=deterministic_metrics
-    )
-    
-    # 6. Store in-memory for confirmation
-    pending_reviews[(repo_full_name, pr_number)] = {
-        "prompt": enhanced_prompt,
-        "diff": pr_diff
-    }
+    enhanced_prompt = context["enhanced_prompt"]
+    # Only the files that survived streaming are kept, re-emitted as diff text
+    pr_diff = context["diff"].text()
+    head_sha = context["pull_request"]["head"]["sha"] if context["pull_request"] else None
+
+    # 6. Store for confirmation (the full diff, so Layer 2 can pick single or map-reduce mode, and
+    # the head SHA it was read at, so Layer 2 records history against the commit it reviewed)
+    await run_in_threadpool(get_pending_reviews().save, repo_full_name, pr_number, enhanced_prompt, pr_diff,
+                            head_sha, user_instruction)
     
     # 7. Post the enhanced prompt to the PR asking for confirmation
     message = f"""### 🤖 DULA Layer 1: Context Analysis Complete
@@ -120,45 +340,105 @@ I have parsed your intent directly into the prompt matrix. Based on the `{user_i
 
 *(If not, reply with `/review [new instructions]` to restart the process)*
 """
-    gh_client.post_comment(repo_full_name, pr_number, message)
+    await get_gh_client().post_comment(repo_full_name, pr_number, message)
 
 
-def process_confirmation(repo_full_name: str, pr_number: int):
+async def process_confirmation(repo_full_name: str, pr_number: int):
     """Background task for Layer 2 (The Review Execution)"""
-    state_key = (repo_full_name, pr_number)
-    if state_key not in pending_reviews:
-        gh_client.post_comment(repo_full_name, pr_number, "❌ **Error:** No pending review found for this PR. Reply with `/review <instruction>` first.")
+    review_data = await run_in_threadpool(get_pending_reviews().load, repo_full_name, pr_number)
+    if review_data is None:
+        await get_gh_client().post_comment(repo_full_name, pr_number, "❌ **Error:** No pending review found for this PR. Reply with `/review <instruction>` first.")
         return
         
     # 1. Acknowledge execution
-    gh_client.post_comment(repo_full_name, pr_number, "🚀 **DULA Layer 2 Executing:** Running deep analytical structural review against the PR...")
-    
-    review_data = pending_reviews[state_key]
     confirmed_prompt = review_data["prompt"]
     pr_diff = review_data["diff"]
     
     # 2. Execute Layer 2
-    final_review = ai_engine.layer_2_generate_review(confirmed_prompt, pr_diff)
+    _, (final_review, _) = await asyncio.gather(
+        get_gh_client().post_comment(repo_full_name, pr_number, "🚀 **DULA Layer 2 Executing:** Running deep analytical structural review against the PR..."),
+        generate_layer2_review(repo_full_name, pr_number, confirmed_prompt, pr_diff,
+                               head_sha=review_data["head_sha"], review_key=review_data["instruction"]),
+    )
     
     # 3. Post Results
     header = "## 🧠 DULA Layer 2: Final Intelligent Code Review\n\n"
-    gh_client.post_comment(repo_full_name, pr_number, header + final_review)
+    await get_gh_client().post_comment(repo_full_name, pr_number, header + final_review)
     
-    # 4. Clean up memory
-    pending_reviews.pop(state_key, None)
+    # 4. Clean up state
+    await run_in_threadpool(get_pending_reviews().delete, repo_full_name, pr_number)
+
+
+# Webhook work runs on a bounded worker pool: /confirm before /review, round-robin across repos,
+# and repeated comments on a PR fold into the job that is still waiting.
+JOB_HANDLERS = {"review": process_review_request, "confirm": process_confirmation}
+job_queue: Optional[JobQueue] = None
+
+def get_job_queue() -> JobQueue:
+    global job_queue
+    if job_queue is None:
+        job_queue = JobQueue(JOB_HANDLERS, workers=JOB_WORKERS, max_pending=JOB_QUEUE_SIZE,
+                             store=SQLiteJobStore(STATE_DB) if PERSIST_JOBS else None)
+    return job_queue
+
+async def enqueue_job(job: Job):
+    try:
+        await get_job_queue().submit(job)
+    except QueueFull as e:
+        print(f"Rejected {job.kind} for {job.repo_full_name}#{job.pr_number}: {e}")
+        raise HTTPException(status_code=503, detail="DULA is busy, please retry later.")
 
+# Only these deliveries can carry a command; everything else from an org-wide hook is dropped unparsed
+WEBHOOK_EVENTS = {"pull_request", "issue_comment"}
+COMMAND_MARKERS = (b"/review", b"/confirm")
+DEFAULT_REVIEW_INSTRUCTION = "Perform a full structural review. Intent: general improvement. Categories: all."
+webhook_counters = {"received": 0, "ignored_event": 0, "ignored_no_command": 0, "ignored_action": 0, "queued": 0}
+
+# Gauges and counters that already live elsewhere are read when /metrics is scraped
+REGISTRY.callback("dula_job_queue_waiting", "Webhook jobs waiting for a worker.", "gauge",
+                  lambda: get_job_queue().stats()["waiting"])
+REGISTRY.callback("dula_job_queue_running", "Webhook jobs being processed.", "gauge",
+                  lambda: get_job_queue().stats()["running"])
+REGISTRY.callback("dula_jobs_total", "Webhook jobs by outcome.", "counter",
+                  lambda: {(name,): count for name, count in get_job_queue().counters.items()}, ("outcome",))
+REGISTRY.callback("dula_pending_reviews", "Layer 1 prompts awaiting /confirm.", "gauge",
+                  lambda: get_pending_reviews().count())
+REGISTRY.callback("dula_webhook_deliveries_total", "Webhook deliveries by outcome.", "counter",
+                  lambda: {(name,): count for name, count in webhook_counters.items()}, ("outcome",))
+REGISTRY.callback("dula_cache_lookups_total", "Cache lookups by cache and result.", "counter",
+                  lambda: {(cache_name, result): cache.stats()[result]
+                           for cache_name, cache in (("github", github_cache), ("llm", llm_cache), ("diff", diff_cache.cache))
+                           for result in ("hits", "misses", "expired", "revalidated")},
+                  ("cache", "result"))
+REGISTRY.callback("dula_github_rate_limit_remaining", "Remaining GitHub primary rate-limit budget.", "gauge",
+                  lambda: github_rate_limiter.stats()["remaining"])
+REGISTRY.callback("dula_github_requests_total", "GitHub requests, throttled requests and retries.", "counter",
+                  lambda: {(name,): github_rate_limiter.stats()[name] for name in ("requests", "throttled", "retries", "rate_limited")},
+                  ("kind",))
+
+@app.post("/webhook", status_code=202)
+@app.post("/webhook/", status_code=202)
+async def github_webhook(request: Request):
+    webhook_counters["received"] += 1
+    # 1. Header check: pushes, check runs, statuses, ... never reach the body
+    event = request.headers.get("x-github-event")
+    if event is not None and event not in WEBHOOK_EVENTS:
+        webhook_counters["ignored_event"] += 1
+        return {"status": "ignored"}
 
-@app.post("/webhook")
-@app.post("/webhook/")
-async def github_webhook(request: Request, background_tasks: BackgroundTasks):
     body = await request.body()
-    
+    # 2. Byte scan: a delivery without a command anywhere in it cannot trigger anything
+    if not any(marker in body for marker in COMMAND_MARKERS):
+        webhook_counters["ignored_no_command"] += 1
+        return {"status": "ignored"}
+
     if WEBHOOK_SECRET and WEBHOOK_SECRET != "optional_secret_for_webhook_validation":
          signature = request.headers.get("x-hub-signature-256")
          if signature:
              verify_signature(body, WEBHOOK_SECRET, signature)
-         
-    payload = await request.json()
+
+    # 3. Parse the body once
+    payload = json_loads(body)
     action = payload.get("action")
     
     comment_body = None
@@ -184,78 +464,161 @@ async def github_webhook(request: Request, background_tasks: BackgroundTasks):
         if comment_body.startswith("/review"):
             user_instruction = comment_body.replace("/review", "").strip()
             if not user_instruction:
-                 user_instruction = "Perform a full structural review. Intent: general improvement. Categories: all."
-            # Send to background task so webhook responds 200 immediately
-            background_tasks.add_task(process_review_request, repo_full_name, pr_number, user_instruction)
+                 user_instruction = DEFAULT_REVIEW_INSTRUCTION
+            # Queue the work so the webhook responds immediately
+            await enqueue_job(Job("review", repo_full_name, pr_number, {"user_instruction": user_instruction}, PRIORITY_REVIEW))
+            webhook_counters["queued"] += 1
+            return {"status": "queued"}
             
         elif comment_body.startswith("/confirm"):
-            background_tasks.add_task(process_confirmation, repo_full_name, pr_number)
+            await enqueue_job(Job("confirm", repo_full_name, pr_number, priority=PRIORITY_CONFIRM))
+            webhook_counters["queued"] += 1
+            return {"status": "queued"}
 
-    return {"status": "ok"}
+    webhook_counters["ignored_action"] += 1
+    return {"status": "ignored"}
 
 class Layer1Request(BaseModel):
     repo_full_name: str
     pr_number: int
     instruction: str = "Perform a deep structural code review."
+    bypass_cache: bool = False
 
 @app.post("/api/layer1")
-def api_layer1(req: Layer1Request):
-    """Synchronous endpoint for the extension widget to fetch the Enhanced Prompt."""
-    pr_diff = gh_client.get_pr_diff(req.repo_full_name, req.pr_number)
-    repo_structure = gh_client.get_repo_structure(req.repo_full_name)
-    
-    key_context = "No specific dependency files configured."
-    if "package.json" in repo_structure:
-         content = gh_client.get_file_content(req.repo_full_name, "package.json")
-         if content: key_context = "package.json:\n" + content[:1000]
-    elif "requirements.txt" in repo_structure:
-         content = gh_client.get_file_content(req.repo_full_name, "requirements.txt")
-         if content: key_context = "requirements.txt:\n" + content[:1000]
-
-    source_context = ""
-    if "utils/security.py" in repo_structure:
-         source_content = gh_client.get_file_content(req.repo_full_name, "utils/security.py")
-         if source_content: source_context = source_content
-    elif "main.py" in repo_structure:
-         source_content = gh_client.get_file_content(req.repo_full_name, "main.py")
-         if source_content: source_context = source_content
-
-    complexity = calculate_cyclomatic_complexity(pr_diff)
-    similarity_score = 0.0
-    if source_context:
-         similarity_score = calculate_levenshtein_distance(pr_diff, source_context)
-         
-    deterministic_metrics = f"""
-    - **Cyclomatic Complexity Score**: {complexity} (If > 15, flag as High Risk / Bug Prone)
-    - **DRY Violation (Similarity to Existing Source Code)**: {similarity_score}% (If > 80%, flag as duplicate code smell and demand it be imported instead of copied)
-    """
+async def api_layer1(req: Layer1Request):
+    """Endpoint for the extension widget to fetch the Enhanced Prompt."""
+    try:
+        context = await run_layer1_pipeline(req.repo_full_name, req.pr_number, req.instruction, use_cache=not req.bypass_cache)
+    except MissingDiffError:
+        raise HTTPException(status_code=502, detail="Could not fetch the PR diff from GitHub.")
+    return {
+        "enhanced_prompt": context["enhanced_prompt"],
+        "diff_tokens": context["packed_diff"].report(),
+        "timings_ms": context.timing_report(),
+    }
 
-    enhanced_prompt = ai_engine.layer_1_enhance_prompt(
-        basic_prompt=req.instruction,
-        repo_structure=repo_structure,
-        key_files_context=key_context,
-        pr_diff=pr_diff,
-        deterministic_metrics=deterministic_metrics
-    )
-    return {"enhanced_prompt": enhanced_prompt}
+async def fetch_pr_diff(repo_full_name: str, pr_number: int) -> ParsedDiff:
+    """Streams and parses the PR diff for the API endpoints, answering 502 when GitHub returns none."""
+    try:
+        return await fetch_parsed_diff(get_gh_client(), repo_full_name, pr_number, MAX_DIFF_BYTES, MAX_DIFF_FILES, diff_cache)
+    except MissingDiffError:
+        raise HTTPException(status_code=502, detail="Could not fetch the PR diff from GitHub.")
 
 class Layer2Request(BaseModel):
     repo_full_name: str
     pr_number: int
     confirmed_prompt: str
+    review_mode: str = "auto"  # "auto", "single" or "map_reduce"
+    bypass_cache: bool = False
 
 @app.post("/api/layer2")
-def api_layer2(req: Layer2Request):
-    """Synchronous endpoint to execute the confirmed prompt and post to GitHub."""
-    pr_diff = gh_client.get_pr_diff(req.repo_full_name, req.pr_number)
-    final_review = ai_engine.layer_2_generate_review(req.confirmed_prompt, pr_diff)
+async def api_layer2(req: Layer2Request):
+    """Endpoint to execute the confirmed prompt and post to GitHub."""
+    head_sha = await fetch_pr_head_sha(req.repo_full_name, req.pr_number)
+    pr_diff = await fetch_pr_diff(req.repo_full_name, req.pr_number)
+    final_review, packed_diff = await generate_layer2_review(req.repo_full_name, req.pr_number, req.confirmed_prompt, pr_diff,
+                                                             req.review_mode, use_cache=not req.bypass_cache, head_sha=head_sha)
     
     # Post it back to GitHub natively so it shows up in the PR
     header = "## 🧠 DULA Layer 2: Final Intelligent Code Review\n\n"
-    gh_client.post_comment(req.repo_full_name, req.pr_number, header + final_review)
+    await get_gh_client().post_comment(req.repo_full_name, req.pr_number, header + final_review)
     
-    return {"status": "success", "review": final_review}
+    return {"status": "success", "review": final_review, "diff_tokens": packed_diff.report()}
+
+# Work that must outlive the request that started it; the set keeps the tasks referenced until they finish
+background_tasks: set = set()
+
+def spawn_background(coro) -> "asyncio.Task":
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+def format_sse(event: str, data: dict) -> str:
+    """Encodes one server-sent event; the JSON payload keeps newlines out of the data line."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/layer2/stream")
+async def api_layer2_stream(req: Layer2Request):
+    """
+    Streaming variant of /api/layer2: emits the review as server-sent events (`chunk` events
+    while Gemini generates, then `done` once the GitHub comment is posted, or `error` when
+    generation failed and nothing was posted). The review runs in a background task that the
+    stream only observes, so a client that disconnects still gets its comment.
+    """
+    head_sha = await fetch_pr_head_sha(req.repo_full_name, req.pr_number)
+    pr_diff = await fetch_pr_diff(req.repo_full_name, req.pr_number)
+    mode, packed_diff, _ = plan_layer2_review(pr_diff, req.review_mode)
+    events: "asyncio.Queue[tuple]" = asyncio.Queue()
+
+    async def review_and_post():
+        try:
+            with review_scope(req.repo_full_name, req.pr_number):
+                if mode == "map_reduce":
+                    # Shards are reviewed in parallel, so the merged review arrives in one piece
+                    final_review = await run_sharded_review(req.repo_full_name, req.pr_number, req.confirmed_prompt, packed_diff,
+                                                            head_sha, use_cache=not req.bypass_cache)
+                    events.put_nowait(("chunk", {"text": final_review}))
+                else:
+                    chunks = []
+                    async for chunk in get_ai_engine().layer_2_stream_review(req.confirmed_prompt, packed_diff.text, not req.bypass_cache):
+                        chunks.append(chunk)
+                        events.put_nowait(("chunk", {"text": chunk}))
+                    final_review = "".join(chunks)
+        except Exception as e:
+            # A failed (possibly partial) review is never posted to the PR
+            print(f"Layer 2 stream for {req.repo_full_name}#{req.pr_number} failed: {e}")
+            events.put_nowait(("error", {"message": f"Could not generate review. {e}"}))
+            return
+
+        header = "## 🧠 DULA Layer 2: Final Intelligent Code Review\n\n"
+        try:
+            posted = await get_gh_client().post_comment(req.repo_full_name, req.pr_number, header + final_review)
+        except Exception as e:
+            # The stream must still end, or the widget waits forever
+            print(f"Posting the Layer 2 review for {req.repo_full_name}#{req.pr_number} failed: {e}")
+            posted = False
+        events.put_nowait(("done", {"status": "success" if posted else "comment_failed", "diff_tokens": packed_diff.report()}))
+
+    spawn_background(review_and_post())
+
+    async def event_stream():
+        # Flush the headers right away so the widget can switch to streaming mode
+        yield ": stream opened\n\n"
+        while True:
+            event, data = await events.get()
+            yield format_sse(event, data)
+            if event != "chunk":
+                return
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/cache/stats")
+def cache_stats():
+    """Hit/miss counters for the GitHub response, LLM result and parsed diff caches."""
+    return {"github": github_cache.stats(), "llm": llm_cache.stats(), "diff": diff_cache.cache.stats()}
+
+@app.get("/api/github/stats")
+def github_stats():
+    """Remaining GitHub rate-limit budget, pacing rate, throttle time and retry counters."""
+    return github_rate_limiter.stats()
+
+@app.get("/api/queue/stats")
+def queue_stats():
+    """Waiting/running webhook jobs, enqueue/coalesce/reject counters and webhook ingress counters."""
+    return {**get_job_queue().stats(), "webhook": dict(webhook_counters)}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus text exposition of stage latencies, LLM usage, queue depth and cache/GitHub counters."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 def home():
     return {"message": "DULA Backend is Running!"}
+
+STARTUP_SECONDS.set(time.perf_counter() - IMPORT_STARTED, phase="import")
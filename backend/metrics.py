@@ -0,0 +1,247 @@
+import time
+import inspect
+import functools
+import threading
+from contextlib import aclosing, contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, Tuple, Union
+
+try:
+    from opentelemetry import trace  # type: ignore
+    tracer = trace.get_tracer("dula")
+except ImportError:
+    tracer = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """Base for registry metrics: a name, help text, label names and per-label-set values."""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values: Dict[LabelValues, Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> Iterator[str]:
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}"
+        return "\n".join([header, *self.samples()])
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def samples(self) -> Iterator[str]:
+        with self.lock:
+            items = [(key, dict(state, buckets=list(state["buckets"]))) for key, state in self.values.items()]
+        for key, state in items:
+            labels = _format_labels(self.label_names, key)
+            for bound, count in zip(self.buckets, state["buckets"]):
+                bucket_labels = _format_labels(self.label_names, key, 'le="%s"' % bound)
+                yield f"{self.name}_bucket{bucket_labels} {count}"
+            inf_labels = _format_labels(self.label_names, key, 'le="+Inf"')
+            yield f"{self.name}_bucket{inf_labels} {state['count']}"
+            yield f"{self.name}_sum{labels} {_format_value(state['sum'])}"
+            yield f"{self.name}_count{labels} {state['count']}"
+
+
+class CallbackMetric(Metric):
+    """A gauge or counter read from existing state (queue sizes, cache stats) at scrape time."""
+
+    def __init__(self, name: str, documentation: str, kind: str,
+                 function: Callable[[], Union[float, Dict[LabelValues, float]]], labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.kind = kind
+        self.function = function
+
+    def samples(self) -> Iterator[str]:
+        try:
+            value = self.function()
+        except Exception as e:
+            print(f"Failed to collect {self.name}: {e}")
+            return
+        values = value if isinstance(value, dict) else {(): value}
+        for key, sample in values.items():
+            if sample is not None:
+                yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(sample)}"
+
+
+class MetricsRegistry:
+    """Holds every metric of the process and renders the Prometheus text exposition format."""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Any:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def callback(self, name: str, documentation: str, kind: str,
+                 function: Callable[[], Any], labels: Sequence[str] = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, kind, function, labels))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram("dula_stage_duration_seconds", "Time spent per pipeline stage.", ("stage",))
+STAGE_ERRORS = REGISTRY.counter("dula_stage_errors_total", "Stages that raised an exception.", ("stage",))
+LLM_SECONDS = REGISTRY.histogram("dula_llm_request_duration_seconds", "Gemini call latency (cache misses only).", ("layer",))
+LLM_TOKENS = REGISTRY.histogram("dula_llm_tokens", "Tokens per Gemini call.", ("layer", "direction"), TOKEN_BUCKETS)
+LLM_ERRORS = REGISTRY.counter("dula_llm_errors_total", "Gemini calls that failed.", ("layer",))
+STARTUP_SECONDS = REGISTRY.gauge("dula_startup_seconds",
+                                 "Seconds spent importing the app and building each lazily created client.", ("phase",))
+
+# The review a stage belongs to, attached to tracing spans
+review_scope_var: ContextVar[Dict[str, Any]] = ContextVar("dula_review_scope", default={})
+
+
+@contextmanager
+def review_scope(repo_full_name: str, pr_number: int):
+    """Tags every stage started inside the block with the repository and PR number."""
+    token = review_scope_var.set({"dula.repo": repo_full_name, "dula.pr_number": pr_number})
+    try:
+        yield
+    finally:
+        review_scope_var.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Times a block into `dula_stage_duration_seconds{stage=name}`, counts failures and, when
+    OpenTelemetry is installed, runs it inside a span tagged with the current repo and PR.
+    """
+    span_context = tracer.start_as_current_span(name) if tracer is not None else nullcontext()
+    started = time.perf_counter()
+    with span_context as span:
+        if span is not None:
+            for key, value in review_scope_var.get().items():
+                span.set_attribute(key, value)
+        try:
+            yield
+        except Exception:
+            STAGE_ERRORS.inc(stage=name)
+            raise
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+
+
+def timed(name: str):
+    """Decorator form of `stage` for plain functions, coroutines and (async) generators."""
+
+    def decorator(function):
+        if inspect.isasyncgenfunction(function):
+            @functools.wraps(function)
+            async def async_generator_wrapper(*args, **kwargs):
+                with stage(name):
+                    async with aclosing(function(*args, **kwargs)) as items:
+                        async for item in items:
+                            yield item
+            return async_generator_wrapper
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def coroutine_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await function(*args, **kwargs)
+            return coroutine_wrapper
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                with stage(name):
+                    yield from function(*args, **kwargs)
+            return generator_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def record_llm_usage(layer: str, response: Any, seconds: Optional[float] = None):
+    """Records latency and prompt/output token counts from a Gemini response's `usage_metadata`."""
+    if seconds is not None:
+        LLM_SECONDS.observe(seconds, layer=layer)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    output_tokens = getattr(usage, "candidates_token_count", None)
+    if prompt_tokens:
+        LLM_TOKENS.observe(prompt_tokens, layer=layer, direction="prompt")
+    if output_tokens:
+        LLM_TOKENS.observe(output_tokens, layer=layer, direction="output")
@@ -0,0 +1,137 @@
+import time
+import random
+import threading
+from typing import Any, Dict, Mapping, Optional
+
+RETRYABLE_STATUS = (500, 502, 503, 504)
+
+
+class GitHubRateLimiter:
+    """
+    Client-side token bucket shared by every GitHub call of a process. The refill rate starts
+    at `rate` requests per second and is lowered to spread the remaining primary budget
+    (`X-RateLimit-Remaining`) evenly until the window resets; `Retry-After` and exhausted
+    budgets pause all callers until GitHub accepts requests again. GitHub keeps a separate
+    budget per `X-RateLimit-Resource` (REST `core`, `graphql`, ...); each is recorded, but only
+    `core` paces the bucket. Thread-safe, so calls made from worker threads can share it.
+    """
+
+    def __init__(self, rate: float = 10.0, burst: int = 20, max_retries: int = 3,
+                 backoff_base: float = 1.0, backoff_cap: float = 60.0):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        self.remaining: Optional[int] = None
+        self.limit: Optional[int] = None
+        self.reset_at: Optional[float] = None
+        # X-RateLimit-Resource -> {"remaining", "limit", "reset_at"} from its latest response
+        self.budgets: Dict[str, Dict[str, Any]] = {}
+        self.counters = {"requests": 0, "throttled": 0, "throttle_seconds": 0.0, "retries": 0, "rate_limited": 0}
+
+    def reserve(self) -> float:
+        """Takes one token and returns how long the caller must wait before sending."""
+        with self.lock:
+            if self.reset_at is not None and time.time() >= self.reset_at:
+                # A new rate-limit window has started
+                self.rate, self.reset_at = self.base_rate, None
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            wait = max(self.paused_until - now, -self.tokens / self.rate if self.tokens < 0 else 0.0)
+            self.counters["requests"] += 1
+            if wait > 0:
+                self.counters["throttled"] += 1
+                self.counters["throttle_seconds"] += wait
+            return wait
+
+    def pause(self, seconds: float):
+        """Holds back every caller for `seconds`."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def update(self, headers: Mapping[str, str]):
+        """
+        Records the primary rate-limit headers of a response and, for the REST `core` budget
+        (assumed when GitHub does not name the resource), adapts the refill rate to them.
+        """
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        try:
+            remaining_calls, reset_epoch = int(remaining), float(reset)
+        except ValueError:
+            return
+        resource = headers.get("X-RateLimit-Resource") or "core"
+        limit = int(headers.get("X-RateLimit-Limit", 0)) or None
+        with self.lock:
+            self.budgets[resource] = {"remaining": remaining_calls, "limit": limit, "reset_at": reset_epoch}
+        if resource != "core":
+            return
+        window = max(reset_epoch - time.time(), 1.0)
+        with self.lock:
+            self.remaining = remaining_calls
+            self.limit = limit or self.limit
+            self.reset_at = reset_epoch
+            self.rate = max(min(self.base_rate, remaining_calls / window), 1.0 / window)
+        if remaining_calls == 0:
+            self.pause(window)
+
+    def retry_delay(self, response: Any, attempt: int, idempotent: bool = True) -> Optional[float]:
+        """
+        Returns the delay before retrying `response` (an httpx response), or None
+        when it should be returned as is. Primary/secondary rate-limit responses (403/429) are
+        retried honouring `Retry-After`; 5xx errors only for idempotent requests, since a
+        failed POST may still have been applied. Backoff is jittered and exponential.
+        """
+        if attempt >= self.max_retries:
+            return None
+        status_code, headers = response.status_code, response.headers
+        rate_limited = status_code in (403, 429) and (
+            "Retry-After" in headers or headers.get("X-RateLimit-Remaining") == "0"
+            or "rate limit" in response.text.lower()
+        )
+        if not rate_limited and not (idempotent and status_code in RETRYABLE_STATUS):
+            return None
+        with self.lock:
+            self.counters["retries"] += 1
+            if rate_limited:
+                self.counters["rate_limited"] += 1
+        retry_after = headers.get("Retry-After")
+        if retry_after is not None and retry_after.isdigit():
+            delay = float(retry_after)
+            # Secondary limits apply to the whole token, so everyone waits
+            self.pause(delay)
+            return delay
+        return self.backoff(attempt)
+
+    def error_delay(self, attempt: int) -> Optional[float]:
+        """Delay before retrying a request that failed at the transport level, or None to give up."""
+        if attempt >= self.max_retries:
+            return None
+        with self.lock:
+            self.counters["retries"] += 1
+        return self.backoff(attempt)
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff, so retries from parallel reviews spread out."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats: Dict[str, Any] = dict(self.counters)
+            stats["throttle_seconds"] = round(stats["throttle_seconds"], 3)
+            stats["remaining"] = self.remaining
+            stats["limit"] = self.limit
+            stats["reset_at"] = self.reset_at
+            stats["rate_per_second"] = round(self.rate, 3)
+            stats["budgets"] = {resource: dict(budget) for resource, budget in self.budgets.items()}
+        return stats
@@ -0,0 +1,246 @@
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+DEFAULT_PENDING_TTL = 24 * 60 * 60  # seconds a Layer 1 prompt waits for `/confirm`
+DEFAULT_HISTORY_TTL = 30 * 24 * 60 * 60  # seconds a PR's last sharded review is kept for reuse
+
+
+def diff_digest(pr_diff: str) -> str:
+    return hashlib.sha256(pr_diff.encode("utf-8")).hexdigest()
+
+
+def _pack(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+def _unpack(data: bytes) -> str:
+    return zlib.decompress(data).decode("utf-8")
+
+
+def _add_missing_columns(conn: sqlite3.Connection, table: str, columns: Dict[str, str]):
+    """Upgrades a table created by an older version in place."""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, declaration in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+
+
+@contextmanager
+def _sqlite_connection(path: str) -> Iterator[sqlite3.Connection]:
+    """Opens a short-lived connection and commits (or rolls back) on exit."""
+    conn = sqlite3.connect(path, timeout=10.0)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+class PendingReviewStore:
+    """
+    Where Layer 1 prompts wait for `/confirm`. Implementations must be safe to share between
+    worker processes; prompts and diffs are stored compressed and diffs are stored once per
+    content hash, so identical diffs from repeated `/review` runs share one blob. The PR head
+    SHA the diff was read at and the user's `/review` instruction are kept with it, so Layer 2
+    records history against the commit that was actually reviewed.
+    """
+
+    def save(self, repo_full_name: str, pr_number: int, prompt: str, pr_diff: str,
+             head_sha: Optional[str] = None, instruction: str = ""):
+        raise NotImplementedError
+
+    def load(self, repo_full_name: str, pr_number: int) -> Optional[Dict[str, Any]]:
+        """Returns {"prompt", "diff", "head_sha", "instruction"} or None when missing or expired."""
+        raise NotImplementedError
+
+    def delete(self, repo_full_name: str, pr_number: int):
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+
+class SQLitePendingReviewStore(PendingReviewStore):
+    """
+    Default store: a WAL-mode SQLite file, safe for several uvicorn workers on one host and
+    persistent across restarts. Expired rows and unreferenced diff blobs are purged on write.
+    """
+
+    def __init__(self, path: str, ttl: float = DEFAULT_PENDING_TTL):
+        self.path = path
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pending_reviews ("
+                " repo_full_name TEXT NOT NULL, pr_number INTEGER NOT NULL,"
+                " prompt BLOB NOT NULL, diff_hash TEXT NOT NULL, expires_at REAL NOT NULL,"
+                " PRIMARY KEY (repo_full_name, pr_number))"
+            )
+            _add_missing_columns(conn, "pending_reviews", {"head_sha": "TEXT", "instruction": "TEXT NOT NULL DEFAULT ''"})
+            conn.execute("CREATE TABLE IF NOT EXISTS diff_blobs (diff_hash TEXT PRIMARY KEY, data BLOB NOT NULL)")
+
+    def _connect(self):
+        return _sqlite_connection(self.path)
+
+    def _purge_expired(self, conn: sqlite3.Connection):
+        conn.execute("DELETE FROM pending_reviews WHERE expires_at <= ?", (time.time(),))
+        conn.execute("DELETE FROM diff_blobs WHERE diff_hash NOT IN (SELECT diff_hash FROM pending_reviews)")
+
+    def save(self, repo_full_name: str, pr_number: int, prompt: str, pr_diff: str,
+             head_sha: Optional[str] = None, instruction: str = ""):
+        digest = diff_digest(pr_diff)
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO diff_blobs (diff_hash, data) VALUES (?, ?)", (digest, _pack(pr_diff)))
+            conn.execute(
+                "INSERT OR REPLACE INTO pending_reviews"
+                " (repo_full_name, pr_number, prompt, diff_hash, expires_at, head_sha, instruction)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (repo_full_name, pr_number, _pack(prompt), digest, time.time() + self.ttl, head_sha, instruction),
+            )
+            self._purge_expired(conn)
+
+    def load(self, repo_full_name: str, pr_number: int) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT p.prompt, d.data, p.head_sha, p.instruction FROM pending_reviews p"
+                " JOIN diff_blobs d ON p.diff_hash = d.diff_hash"
+                " WHERE p.repo_full_name = ? AND p.pr_number = ? AND p.expires_at > ?",
+                (repo_full_name, pr_number, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"prompt": _unpack(row[0]), "diff": _unpack(row[1]), "head_sha": row[2], "instruction": row[3]}
+
+    def delete(self, repo_full_name: str, pr_number: int):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM pending_reviews WHERE repo_full_name = ? AND pr_number = ?", (repo_full_name, pr_number))
+            self._purge_expired(conn)
+
+    def count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM pending_reviews WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+
+
+class RedisPendingReviewStore(PendingReviewStore):
+    """
+    Store for multi-host deployments. Accepts any Redis-like client exposing
+    `get`, `set(name, value, ex=...)`, `delete` and `scan_iter` (e.g. `redis.Redis`).
+    """
+
+    def __init__(self, client: Any, ttl: float = DEFAULT_PENDING_TTL, prefix: str = "dula"):
+        self.client = client
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    def _review_key(self, repo_full_name: str, pr_number: int) -> str:
+        return f"{self.prefix}:pending:{repo_full_name}:{pr_number}"
+
+    def _diff_key(self, digest: str) -> str:
+        return f"{self.prefix}:diff:{digest}"
+
+    def save(self, repo_full_name: str, pr_number: int, prompt: str, pr_diff: str,
+             head_sha: Optional[str] = None, instruction: str = ""):
+        digest = diff_digest(pr_diff)
+        # The blob outlives every review that references it, so it never disappears first
+        self.client.set(self._diff_key(digest), _pack(pr_diff), ex=self.ttl)
+        record = json.dumps({"prompt": prompt, "diff_hash": digest, "head_sha": head_sha, "instruction": instruction})
+        self.client.set(self._review_key(repo_full_name, pr_number), _pack(record), ex=self.ttl)
+
+    def load(self, repo_full_name: str, pr_number: int) -> Optional[Dict[str, Any]]:
+        data = self.client.get(self._review_key(repo_full_name, pr_number))
+        if data is None:
+            return None
+        record = json.loads(_unpack(data))
+        diff_data = self.client.get(self._diff_key(record["diff_hash"]))
+        if diff_data is None:
+            return None
+        return {"prompt": record["prompt"], "diff": _unpack(diff_data), "head_sha": record.get("head_sha"),
+                "instruction": record.get("instruction", "")}
+
+    def delete(self, repo_full_name: str, pr_number: int):
+        self.client.delete(self._review_key(repo_full_name, pr_number))
+
+    def count(self) -> int:
+        return sum(1 for _ in self.client.scan_iter(match=f"{self.prefix}:pending:*"))
+
+
+def review_key_digest(review_key: str) -> str:
+    return hashlib.sha256(review_key.encode("utf-8")).hexdigest()
+
+
+class ReviewHistoryStore:
+    """
+    Remembers the last sharded Layer 2 review of each PR: the head SHA it covered, a digest
+    of the review key (the user's `/review` instruction, which unlike the LLM-written prompt
+    is stable across runs) and the findings per shard, so a re-review after a new push only
+    sends the shards whose files changed to the LLM.
+    """
+
+    def save(self, repo_full_name: str, pr_number: int, head_sha: str, review_key: str, shards: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def load(self, repo_full_name: str, pr_number: int) -> Optional[Dict[str, Any]]:
+        """Returns {"head_sha": ..., "review_key": ..., "shards": [{"paths": [...], "findings": ...}]} or None."""
+        raise NotImplementedError
+
+
+class SQLiteReviewHistoryStore(ReviewHistoryStore):
+    """Keeps review history in the same SQLite file as the pending reviews."""
+
+    def __init__(self, path: str, ttl: float = DEFAULT_HISTORY_TTL):
+        self.path = path
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS review_history ("
+                " repo_full_name TEXT NOT NULL, pr_number INTEGER NOT NULL,"
+                " record BLOB NOT NULL, expires_at REAL NOT NULL,"
+                " PRIMARY KEY (repo_full_name, pr_number))"
+            )
+
+    def _connect(self):
+        return _sqlite_connection(self.path)
+
+    def save(self, repo_full_name: str, pr_number: int, head_sha: str, review_key: str, shards: List[Dict[str, Any]]):
+        record = json.dumps({"head_sha": head_sha, "review_key": review_key_digest(review_key), "shards": shards})
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO review_history (repo_full_name, pr_number, record, expires_at) VALUES (?, ?, ?, ?)",
+                (repo_full_name, pr_number, _pack(record), time.time() + self.ttl),
+            )
+            conn.execute("DELETE FROM review_history WHERE expires_at <= ?", (time.time(),))
+
+    def load(self, repo_full_name: str, pr_number: int) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT record FROM review_history WHERE repo_full_name = ? AND pr_number = ? AND expires_at > ?",
+                (repo_full_name, pr_number, time.time()),
+            ).fetchone()
+        return json.loads(_unpack(row[0])) if row else None
+
+
+class RedisReviewHistoryStore(ReviewHistoryStore):
+    """Review history for multi-host deployments; same client interface as `RedisPendingReviewStore`."""
+
+    def __init__(self, client: Any, ttl: float = DEFAULT_HISTORY_TTL, prefix: str = "dula"):
+        self.client = client
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    def _key(self, repo_full_name: str, pr_number: int) -> str:
+        return f"{self.prefix}:history:{repo_full_name}:{pr_number}"
+
+    def save(self, repo_full_name: str, pr_number: int, head_sha: str, review_key: str, shards: List[Dict[str, Any]]):
+        record = json.dumps({"head_sha": head_sha, "review_key": review_key_digest(review_key), "shards": shards})
+        self.client.set(self._key(repo_full_name, pr_number), _pack(record), ex=self.ttl)
+
+    def load(self, repo_full_name: str, pr_number: int) -> Optional[Dict[str, Any]]:
+        data = self.client.get(self._key(repo_full_name, pr_number))
+        return json.loads(_unpack(data)) if data is not None else None
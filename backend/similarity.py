@@ -0,0 +1,251 @@
+import re
+import hashlib
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from .diff_parser import DiffFile, parse_unified_diff
+
+# Token classes used to normalise code before shingling.
+TOKEN_RE = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|\d+(?:\.\d+)?|\w+|[^\w\s])""")
+COMMENT_RE = re.compile(r"(#|//).*$")
+
+# File types worth indexing for duplicate detection.
+SOURCE_EXTENSIONS = (
+    ".py", ".js", ".jsx", ".ts", ".tsx", ".java", ".go", ".rb", ".php", ".cs",
+    ".c", ".h", ".cc", ".cpp", ".hpp", ".rs", ".kt", ".swift", ".scala",
+)
+
+MAX_HASH = (1 << 64) - 1
+
+
+def normalize_tokens(line: str) -> List[str]:
+    """
+    Splits a line of code into tokens, dropping comments and folding literals so
+    that copies with different strings or numbers still match.
+    """
+    line = COMMENT_RE.sub("", line)
+    tokens = []
+    for token in TOKEN_RE.findall(line):
+        if token[0] in "\"'":
+            tokens.append("STR")
+        elif token[0].isdigit():
+            tokens.append("NUM")
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def shingle_hashes(lines: Iterable[str], shingle_size: int = 5) -> set:
+    """
+    Returns the set of 64-bit hashes of every `shingle_size`-token window across the lines.
+    """
+    tokens: List[str] = []
+    for line in lines:
+        tokens.extend(normalize_tokens(line))
+    if not tokens:
+        return set()
+    if len(tokens) < shingle_size:
+        shingle_size = len(tokens)
+    hashes = set()
+    for i in range(len(tokens) - shingle_size + 1):
+        shingle = "\x1f".join(tokens[i:i + shingle_size]).encode("utf-8")
+        hashes.add(int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), "little"))
+    return hashes
+
+
+def minhash_signature(hashes: set, num_perm: int = 64) -> Tuple[int, ...]:
+    """
+    One-permutation MinHash: each shingle hash falls into one of `num_perm` bins and the
+    minimum per bin is kept, so a signature costs O(shingles) instead of O(shingles * num_perm).
+    Empty bins are filled from the next non-empty bin (rotation densification).
+    """
+    bin_width = (MAX_HASH // num_perm) + 1
+    bins = [MAX_HASH] * num_perm
+    for value in hashes:
+        index = value // bin_width
+        if value < bins[index]:
+            bins[index] = value
+    filled = [i for i in range(num_perm) if bins[i] != MAX_HASH]
+    if not filled:
+        return tuple(bins)
+    for i in range(num_perm):
+        if bins[i] == MAX_HASH:
+            offset = 1
+            while bins[(i + offset) % num_perm] == MAX_HASH:
+                offset += 1
+            source = (i + offset) % num_perm
+            # Offset the borrowed value so densified bins only collide with the same donor.
+            bins[i] = (bins[source] + offset * bin_width) & MAX_HASH
+    return tuple(bins)
+
+
+def estimate_jaccard(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    matches = sum(1 for a, b in zip(sig_a, sig_b) if a == b)
+    return matches / len(sig_a)
+
+
+@dataclass
+class DuplicateMatch:
+    """A repository region that resembles a block of lines added by the PR."""
+    path: str
+    start_line: int
+    end_line: int
+    score: float
+    diff_path: str
+    diff_start_line: int
+    diff_end_line: int
+
+    def describe(self) -> str:
+        return (
+            f"`{self.diff_path}` L{self.diff_start_line}-{self.diff_end_line} ~ "
+            f"`{self.path}` L{self.start_line}-{self.end_line} ({round(self.score * 100, 2)}%)"
+        )
+
+
+class DuplicateCodeIndex:
+    """
+    MinHash/LSH index over fixed-size line windows of every source file in a repository.
+    Querying only touches the LSH buckets of the added diff blocks, so lookup cost does not
+    grow with the number of indexed files.
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, shingle_size: int = 5,
+                 window_lines: int = 12, window_step: int = 6):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.window_lines = window_lines
+        self.window_step = window_step
+        self.chunks: List[Tuple[str, int, int, Tuple[int, ...]]] = []
+        self.buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = defaultdict(list)
+
+    def _band_keys(self, signature: Tuple[int, ...]):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows]
+
+    def _windows(self, numbered_lines: List[Tuple[int, str]]):
+        """Yields (start_line, end_line, lines) windows over (line_number, text) pairs."""
+        numbered_lines = [(n, text) for n, text in numbered_lines if text.strip()]
+        if not numbered_lines:
+            return
+        last_start = max(len(numbered_lines) - self.window_lines, 0)
+        starts = list(range(0, last_start + 1, self.window_step))
+        if starts[-1] != last_start:
+            starts.append(last_start)
+        for start in starts:
+            window = numbered_lines[start:start + self.window_lines]
+            yield window[0][0], window[-1][0], [text for _, text in window]
+
+    def _signature(self, lines: List[str]) -> Optional[Tuple[int, ...]]:
+        hashes = shingle_hashes(lines, self.shingle_size)
+        if len(hashes) < 2:
+            return None
+        return minhash_signature(hashes, self.num_perm)
+
+    def add_file(self, path: str, content: str):
+        numbered = list(enumerate(content.splitlines(), start=1))
+        for start_line, end_line, lines in self._windows(numbered):
+            signature = self._signature(lines)
+            if signature is None:
+                continue
+            chunk_id = len(self.chunks)
+            self.chunks.append((path, start_line, end_line, signature))
+            for key in self._band_keys(signature):
+                self.buckets[key].append(chunk_id)
+
+    def query_lines(self, diff_path: str, numbered_lines: List[Tuple[int, str]],
+                    min_score: float = 0.0) -> List[DuplicateMatch]:
+        matches = []
+        for start_line, end_line, lines in self._windows(numbered_lines):
+            signature = self._signature(lines)
+            if signature is None:
+                continue
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates.update(self.buckets.get(key, ()))
+            for chunk_id in candidates:
+                path, chunk_start, chunk_end, chunk_signature = self.chunks[chunk_id]
+                if path == diff_path:
+                    continue
+                score = estimate_jaccard(signature, chunk_signature)
+                if score >= min_score:
+                    matches.append(DuplicateMatch(path, chunk_start, chunk_end, score,
+                                                  diff_path, start_line, end_line))
+        return matches
+
+    def query_diff(self, pr_diff: Union[str, Iterable[DiffFile]], top_k: int = 5, min_score: float = 0.3) -> List[DuplicateMatch]:
+        """
+        Returns the `top_k` best matching repository regions for the lines added by `pr_diff`
+        (diff text or parsed files), keeping only the best match per repository file.
+        """
+        best: Dict[str, DuplicateMatch] = {}
+        diff_files = parse_unified_diff(pr_diff) if isinstance(pr_diff, str) else pr_diff
+        for diff_file in diff_files:
+            if diff_file.is_binary or diff_file.is_deleted or diff_file.skipped:
+                continue
+            for hunk in diff_file.hunks:
+                for match in self.query_lines(diff_file.path, hunk.added_lines(), min_score):
+                    current = best.get(match.path)
+                    if current is None or match.score > current.score:
+                        best[match.path] = match
+        return sorted(best.values(), key=lambda m: m.score, reverse=True)[:top_k]
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+
+def build_repo_index(files: Iterable[Tuple[str, str]], **index_options) -> DuplicateCodeIndex:
+    """
+    Builds a `DuplicateCodeIndex` from (path, content) pairs, skipping non-source files.
+    """
+    index = DuplicateCodeIndex(**index_options)
+    for path, content in files:
+        if path.endswith(SOURCE_EXTENSIONS):
+            index.add_file(path, content)
+    return index
+
+
+class RepoIndexCache:
+    """
+    Keeps the most recently used indexes keyed by (repo, commit SHA). A commit is immutable,
+    so an index is built at most once per SHA.
+    """
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple[str, str], DuplicateCodeIndex]" = OrderedDict()
+
+    def get(self, repo_full_name: str, sha: str) -> Optional[DuplicateCodeIndex]:
+        key = (repo_full_name, sha)
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, repo_full_name: str, sha: str, index: DuplicateCodeIndex):
+        self.entries[(repo_full_name, sha)] = index
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get_or_build(self, repo_full_name: str, sha: str,
+                     builder: Callable[[], DuplicateCodeIndex]) -> DuplicateCodeIndex:
+        index = self.get(repo_full_name, sha)
+        if index is None:
+            index = builder()
+            self.put(repo_full_name, sha, index)
+        return index
+
+
+def format_duplicate_report(matches: List[DuplicateMatch]) -> Tuple[float, str]:
+    """
+    Turns query results into (best score %, markdown lines) for the deterministic metrics block.
+    """
+    if not matches:
+        return 0.0, "No near-duplicate code regions found in the repository."
+    best_score = round(matches[0].score * 100, 2)
+    lines = "\n".join(f"      - {match.describe()}" for match in matches)
+    return best_score, lines
@@ -0,0 +1,218 @@
+import posixpath
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from .cache import LRUCache
+
+LANGUAGES = {
+    ".py": "Python", ".js": "JavaScript", ".jsx": "JavaScript", ".mjs": "JavaScript",
+    ".ts": "TypeScript", ".tsx": "TypeScript", ".java": "Java", ".go": "Go", ".rb": "Ruby",
+    ".php": "PHP", ".cs": "C#", ".c": "C", ".h": "C", ".cc": "C++", ".cpp": "C++", ".hpp": "C++",
+    ".rs": "Rust", ".kt": "Kotlin", ".swift": "Swift", ".scala": "Scala", ".vue": "Vue",
+    ".html": "HTML", ".css": "CSS", ".scss": "CSS", ".sql": "SQL", ".sh": "Shell",
+}
+
+DEFAULT_OUTLINE_LINES = 80
+MAX_FILES_PER_DIRECTORY = 15
+
+# Dependency manifests worth showing to Layer 1, most informative first within a directory
+MANIFEST_NAMES = (
+    "package.json", "pyproject.toml", "requirements.txt", "setup.cfg", "Pipfile", "go.mod",
+    "Cargo.toml", "pom.xml", "build.gradle", "build.gradle.kts", "Gemfile", "composer.json",
+)
+DEFAULT_MAX_MANIFESTS = 3
+
+
+def _language(path: str) -> Optional[str]:
+    return LANGUAGES.get(posixpath.splitext(path)[1].lower())
+
+
+@dataclass
+class DirectoryInfo:
+    path: str
+    files: List[str] = field(default_factory=list)
+    subdirs: List[str] = field(default_factory=list)
+    # Recursive totals
+    total_files: int = 0
+    languages: Counter = field(default_factory=Counter)
+
+    def describe(self) -> str:
+        top = ", ".join(name for name, _ in self.languages.most_common(3))
+        return f"{self.path}/ ({self.total_files} files{'; ' + top if top else ''})"
+
+
+class RepoTree:
+    """
+    Directory index built from one recursive git tree: per-directory file lists, recursive
+    file counts and languages. Renders a line-budgeted outline centred on the paths a PR touches.
+    """
+
+    def __init__(self, sha: str, directories: Dict[str, DirectoryInfo], truncated: bool = False,
+                 manifests: Optional[Dict[str, str]] = None, blobs: Optional[Dict[str, str]] = None):
+        self.sha = sha
+        self.directories = directories
+        self.truncated = truncated
+        # Manifest path -> blob SHA
+        self.manifests = manifests or {}
+        # Every file path -> blob SHA
+        self.blobs = blobs or {}
+
+    def approx_bytes(self) -> int:
+        """Rough memory footprint: the paths and blob SHAs it holds, which dominate on large trees."""
+        blob_bytes = sum(len(path) + len(sha) for path, sha in self.blobs.items())
+        directory_bytes = sum(len(info.path) + sum(map(len, info.files)) for info in self.directories.values())
+        return blob_bytes + directory_bytes
+
+    @classmethod
+    def from_tree_json(cls, tree_json: Dict[str, Any]) -> "RepoTree":
+        directories: Dict[str, DirectoryInfo] = {"": DirectoryInfo("")}
+        manifests: Dict[str, str] = {}
+        blobs: Dict[str, str] = {}
+        for item in tree_json.get("tree", []):
+            path = str(item["path"])
+            if item["type"] == "tree":
+                directories.setdefault(path, DirectoryInfo(path))
+                continue
+            if item["type"] != "blob":
+                continue
+            parent, name = posixpath.split(path)
+            directories.setdefault(parent, DirectoryInfo(parent)).files.append(name)
+            blobs[path] = str(item.get("sha", ""))
+            if name in MANIFEST_NAMES:
+                manifests[path] = blobs[path]
+            language = _language(name)
+            # Credit the file to every ancestor, up to the root
+            while True:
+                info = directories.setdefault(parent, DirectoryInfo(parent))
+                info.total_files += 1
+                if language:
+                    info.languages[language] += 1
+                if not parent:
+                    break
+                parent = posixpath.dirname(parent)
+        for path in sorted(directories):
+            if path:
+                parent = posixpath.dirname(path)
+                directories.setdefault(parent, DirectoryInfo(parent)).subdirs.append(path)
+        return cls(str(tree_json.get("sha", "")), directories, bool(tree_json.get("truncated")), manifests, blobs)
+
+    def has_file(self, path: str) -> bool:
+        return path in self.blobs
+
+    def blob_sha(self, path: str) -> Optional[str]:
+        return self.blobs.get(path) or None
+
+    def find_manifests(self, touched_paths: Iterable[str] = (), limit: int = DEFAULT_MAX_MANIFESTS) -> Dict[str, str]:
+        """
+        Returns up to `limit` manifests (path -> blob SHA): for each directory the PR touches,
+        the nearest manifests walking up towards the root, then the root's own manifests.
+        """
+        found: Dict[str, str] = {}
+        for directory in self._focus_directories(touched_paths) + [""]:
+            while True:
+                for name in MANIFEST_NAMES:
+                    path = posixpath.join(directory, name)
+                    if path in self.manifests and len(found) < limit:
+                        found.setdefault(path, self.manifests[path])
+                if not directory or any(posixpath.dirname(p) == directory for p in found):
+                    break
+                directory = posixpath.dirname(directory)
+        return found
+
+    def _focus_directories(self, touched_paths: Iterable[str]) -> List[str]:
+        """Deepest existing directory of every touched path, most touched first."""
+        counts: Counter = Counter()
+        for path in touched_paths:
+            parent = posixpath.dirname(path)
+            while parent and parent not in self.directories:
+                parent = posixpath.dirname(parent)
+            counts[parent] += 1
+        return [path for path, _ in counts.most_common()]
+
+    def outline(self, touched_paths: Iterable[str] = (), max_lines: int = DEFAULT_OUTLINE_LINES) -> str:
+        """
+        Budgeted outline: repository totals and root files first, then the directories the PR
+        touches (with their files, changed ones starred), their subdirectories and siblings,
+        then the remaining top-level directories.
+        """
+        touched = set(touched_paths)
+        root = self.directories[""]
+        lines = [root.describe().replace("/ (", "Repository (", 1)]
+        if root.files:
+            lines.append("/: " + self._file_list(root, touched))
+        emitted = {""}
+
+        def emit(line: str) -> bool:
+            if len(lines) >= max_lines:
+                return False
+            lines.append(line)
+            return True
+
+        def emit_directory(path: str, prefix: str = "") -> bool:
+            if path in emitted or path not in self.directories:
+                return True
+            emitted.add(path)
+            return emit(prefix + self.directories[path].describe())
+
+        focus = [path for path in self._focus_directories(touched) if path]
+        complete = True
+        for path in focus:
+            if not complete:
+                break
+            info = self.directories[path]
+            emitted.add(path)
+            files = self._file_list(info, touched)
+            complete = emit(f"{info.describe()} [changed]" + (f": {files}" if files else ""))
+        for path in focus:
+            info = self.directories[path]
+            parent = self.directories[posixpath.dirname(path)]
+            for other in info.subdirs + parent.subdirs:
+                if not complete:
+                    break
+                complete = emit_directory(other, "  ")
+        for path in root.subdirs:
+            if not complete:
+                break
+            complete = emit_directory(path)
+
+        if not complete or self.truncated:
+            lines.append("... (outline truncated)")
+        return "\n".join(lines)
+
+    def _file_list(self, info: DirectoryInfo, touched: set) -> str:
+        def label(name: str) -> str:
+            return f"{name}*" if posixpath.join(info.path, name) in touched else name
+
+        changed = [name for name in info.files if posixpath.join(info.path, name) in touched]
+        others = [name for name in info.files if name not in changed]
+        shown = (changed + others)[:max(MAX_FILES_PER_DIRECTORY, len(changed))]
+        listed = ", ".join(label(name) for name in shown)
+        hidden = len(info.files) - len(shown)
+        return listed + (f", ... and {hidden} more" if hidden else "")
+
+
+class RepoTreeCache:
+    """
+    Built `RepoTree`s keyed by tree SHA, plus which tree each (repo, commit) resolved to.
+    Both are immutable, so entries never expire; a new push whose tree is unchanged (e.g. an
+    empty commit) and repeated reviews of one head reuse the index instead of rebuilding it.
+    Trees are sized by their paths, so `max_bytes` bounds the cache on monorepos too.
+    """
+
+    def __init__(self, max_entries: int = 32, max_bytes: int = 64 * 1024 * 1024):
+        self.cache = LRUCache(max_entries=max_entries * 2, max_bytes=max_bytes, default_ttl=None)
+
+    def get_for_commit(self, repo_full_name: str, commit_sha: str) -> Optional[RepoTree]:
+        tree_sha = self.cache.get(f"commit:{repo_full_name}@{commit_sha}")
+        return self.cache.get(f"tree:{tree_sha}") if tree_sha else None
+
+    def put(self, repo_full_name: str, commit_sha: str, tree_json: Dict[str, Any]) -> RepoTree:
+        tree_sha = str(tree_json.get("sha", ""))
+        tree = self.cache.get(f"tree:{tree_sha}") if tree_sha else None
+        if tree is None:
+            tree = RepoTree.from_tree_json(tree_json)
+        if tree_sha:
+            self.cache.set(f"tree:{tree_sha}", tree, ttl=None, size=max(tree.approx_bytes(), 1))
+            self.cache.set(f"commit:{repo_full_name}@{commit_sha}", tree_sha, ttl=None)
+        return tree
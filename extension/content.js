@@ -94,6 +94,7 @@ function createDulaWidget() {
                             <div class="dula-spinner"></div>
                             <p style="margin: 0; font-size: 14px;"><strong>Layer 2 Executing:</strong> Running deep deterministic analysis. Generating final report...</p>
                         </div>
+                        <div id="dula-stream-output" class="dula-stream-output"></div>
                     </div>
                     
                     <!-- State 5: Success -->
@@ -196,13 +197,72 @@ async function handleTriggerLayer1() {
     }
 }
 
+// Split the review markdown into its top-level "# " sections
+function splitReviewSections(markdown) {
+    const sections = [];
+    let current = null;
+    for (const line of markdown.split('\n')) {
+        if (line.startsWith('# ') || current === null) {
+            current = { title: line.startsWith('# ') ? line.slice(2).trim() : '', lines: [] };
+            sections.push(current);
+            if (line.startsWith('# ')) continue;
+        }
+        current.lines.push(line);
+    }
+    return sections;
+}
+
+// Render the sections received so far, reusing the blocks that are already on screen
+function renderStreamedReview(markdown) {
+    const container = document.getElementById('dula-stream-output');
+    const sections = splitReviewSections(markdown);
+    sections.forEach((section, index) => {
+        let block = container.children[index];
+        if (!block) {
+            block = document.createElement('div');
+            block.className = 'dula-stream-section';
+            block.appendChild(document.createElement('h4'));
+            block.appendChild(document.createElement('pre'));
+            container.appendChild(block);
+        }
+        block.querySelector('h4').textContent = section.title;
+        block.querySelector('h4').style.display = section.title ? 'block' : 'none';
+        block.querySelector('pre').textContent = section.lines.join('\n').trim();
+    });
+}
+
+// Read a text/event-stream response and invoke onEvent(name, data) for each event
+async function readServerSentEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let eventName = 'message';
+            let data = '';
+            for (const line of rawEvent.split('\n')) {
+                if (line.startsWith('event: ')) eventName = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            if (data) onEvent(eventName, JSON.parse(data));
+        }
+    }
+}
+
 async function handleTriggerLayer2() {
     switchState(4);
+    document.getElementById('dula-stream-output').innerHTML = '';
     const confirmedPrompt = document.getElementById('dula-prompt-editor').value;
     const ctx = getPrContext();
 
     try {
-        const response = await fetch('https://code-review-bot-5kl5.onrender.com/api/layer2', {
+        const response = await fetch('https://code-review-bot-5kl5.onrender.com/api/layer2/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
@@ -217,6 +277,27 @@ async function handleTriggerLayer2() {
             throw new Error(`API Failed: ${response.status} - ${errText}`);
         }
 
+        // Render sections as they arrive
+        let reviewText = '';
+        let finalStatus = null;
+        let streamError = null;
+        await readServerSentEvents(response, (eventName, data) => {
+            if (eventName === 'chunk') {
+                reviewText += data.text;
+                renderStreamedReview(reviewText);
+            } else if (eventName === 'done') {
+                finalStatus = data.status;
+            } else if (eventName === 'error') {
+                streamError = data.message;
+            }
+        });
+        if (streamError) {
+            throw new Error(streamError);
+        }
+        if (finalStatus !== 'success') {
+            throw new Error(`Review stream ended without posting the comment (${finalStatus || 'interrupted'})`);
+        }
+
         // Success
         switchState(5);
         // We removed the forced reload so the user doesn't lose their train of thought.
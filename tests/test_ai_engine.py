@@ -0,0 +1,54 @@
+import asyncio
+import unittest
+
+from backend.benchmarks.fakes import FakeAIEngine, FakeGenerativeModel
+
+
+class BrokenStream:
+    async def __aiter__(self):
+        yield type("Chunk", (), {"text": "partial "})()
+        raise RuntimeError("quota exceeded")
+
+
+class BrokenStreamModel(FakeGenerativeModel):
+    async def generate_content_async(self, prompt, stream=False):
+        return BrokenStream()
+
+
+class Layer2StreamTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = FakeAIEngine()
+        self.engine.model = BrokenStreamModel()
+
+    def test_stream_raises_after_partial_output(self):
+        async def consume():
+            return [chunk async for chunk in self.engine.layer_2_stream_review("prompt", "diff", use_cache=False)]
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(consume())
+
+    def test_non_streaming_review_reports_the_error(self):
+        review = asyncio.run(self.engine.layer_2_generate_review_async("prompt", "diff", use_cache=False))
+        self.assertTrue(review.startswith("Error: Could not generate review."))
+
+    def test_stream_yields_the_review(self):
+        engine = FakeAIEngine()
+
+        async def consume():
+            return "".join([chunk async for chunk in engine.layer_2_stream_review("prompt", "diff", use_cache=False)])
+
+        self.assertTrue(asyncio.run(consume()).startswith("Deterministic output"))
+
+
+class Layer1PromptTest(unittest.TestCase):
+    def test_layer_1_is_told_not_to_copy_the_diff(self):
+        diff = "diff --git a/app.py b/app.py\n+print('hi')"
+        prompt = FakeAIEngine().build_layer_1_prompt("Review.", "app.py", "", diff)
+        self.assertIn("DO NOT reproduce the PR diff", prompt)
+        self.assertIn("summarize the changed files and hunks", prompt)
+        # The diff is still given to Layer 1 for its own analysis, exactly once
+        self.assertEqual(prompt.count(diff), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
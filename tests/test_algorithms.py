@@ -0,0 +1,69 @@
+import random
+import unittest
+
+from backend.algorithms import calculate_levenshtein_distance
+
+
+def reference_similarity(s1: str, s2: str) -> float:
+    """Textbook full-matrix Levenshtein, as a percentage of the longer string."""
+    if not s1 or not s2:
+        return 0.0
+    previous = list(range(len(s2) + 1))
+    for i, char1 in enumerate(s1, start=1):
+        current = [i]
+        for j, char2 in enumerate(s2, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char1 != char2)))
+        previous = current
+    max_len = max(len(s1), len(s2))
+    return round(max((max_len - previous[-1]) / max_len * 100, 0.0), 2)
+
+
+def mutated_pair(length: int, edits: int, seed: int = 1):
+    rng = random.Random(seed)
+    s1 = "".join(rng.choice("abcdefgh ") for _ in range(length))
+    chars = list(s1)
+    for _ in range(edits):
+        chars[rng.randrange(len(chars))] = rng.choice("xyz")
+    return s1, "".join(chars)
+
+
+class LevenshteinTest(unittest.TestCase):
+    def test_matches_reference_on_small_inputs(self):
+        rng = random.Random(3)
+        for _ in range(200):
+            s1 = "".join(rng.choice("ab") for _ in range(rng.randrange(0, 12)))
+            s2 = "".join(rng.choice("ab") for _ in range(rng.randrange(0, 12)))
+            self.assertEqual(calculate_levenshtein_distance(s1, s2), reference_similarity(s1, s2), (s1, s2))
+
+    def test_default_call_is_exact_on_long_inputs(self):
+        # Over a million cells: the old default budget cut the scan off and under-reported similarity
+        s1, s2 = mutated_pair(1438, 140)
+        expected = reference_similarity(s1, s2)
+        self.assertGreater(len(s1) * len(s2), 1_000_000)
+        self.assertEqual(calculate_levenshtein_distance(s1, s2), expected)
+
+    def test_threshold_band_keeps_the_verdict(self):
+        s1, s2 = mutated_pair(600, 60, seed=5)
+        exact = reference_similarity(s1, s2)
+        for threshold in (50.0, 80.0, exact, 95.0, 99.0):
+            result = calculate_levenshtein_distance(s1, s2, threshold=threshold)
+            self.assertEqual(result >= threshold, exact >= threshold, threshold)
+            if exact >= threshold:
+                self.assertEqual(result, exact)
+
+    def test_budget_exit_never_changes_the_verdict(self):
+        s1, s2 = mutated_pair(1438, 140)
+        exact = reference_similarity(s1, s2)
+        for threshold in (60.0, 80.0, 95.0):
+            result = calculate_levenshtein_distance(s1, s2, threshold=threshold, max_cost=1000)
+            self.assertEqual(result >= threshold, exact >= threshold, threshold)
+            if exact >= threshold:
+                self.assertLessEqual(result, exact)
+
+    def test_budget_without_threshold_is_ignored(self):
+        s1, s2 = mutated_pair(800, 80)
+        self.assertEqual(calculate_levenshtein_distance(s1, s2, max_cost=10), reference_similarity(s1, s2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from backend.batch import BatchTarget, review_pull_request
+
+
+class FakeContext(dict):
+    def timing_report(self):
+        return {}
+
+
+class FakeApp:
+    """The parts of `backend.main` that `review_pull_request` uses, with a canned Layer 2 result."""
+
+    def __init__(self, review: str):
+        self.review = review
+        self.posted = []
+
+    async def run_layer1_pipeline(self, repo_full_name, pr_number, instruction, use_cache):
+        return FakeContext(enhanced_prompt="Review carefully.", diff=None, pull_request={"head": {"sha": "abc"}})
+
+    async def generate_layer2_review(self, *args, **kwargs):
+        return self.review, SimpleNamespace(report=lambda: {"packed_tokens": 10})
+
+    def get_gh_client(self):
+        app = self
+
+        class Client:
+            async def post_comment(self, repo_full_name, pr_number, body):
+                app.posted.append(body)
+                return True
+
+        return Client()
+
+
+class ReviewPullRequestTest(unittest.TestCase):
+    def review(self, app: FakeApp, output_dir: str):
+        return asyncio.run(review_pull_request(app, BatchTarget("o/r", 1), "Review.", output_dir=output_dir, post=True))
+
+    def test_failed_layer_2_is_not_written_or_posted(self):
+        app = FakeApp("Error: Could not generate review. quota exceeded")
+        with tempfile.TemporaryDirectory() as directory:
+            result = self.review(app, directory)
+            self.assertEqual(os.listdir(directory), [])
+        self.assertEqual(result.status, "failed")
+        self.assertTrue(result.error.startswith("Error: Could not generate review."))
+        self.assertEqual(app.posted, [])
+
+    def test_review_is_written_and_posted(self):
+        app = FakeApp("All good.")
+        with tempfile.TemporaryDirectory() as directory:
+            result = self.review(app, directory)
+            self.assertEqual(len(os.listdir(directory)), 1)
+        self.assertEqual(result.status, "reviewed")
+        self.assertTrue(result.posted)
+
+
+if __name__ == "__main__":
+    unittest.main()
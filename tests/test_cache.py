@@ -0,0 +1,78 @@
+import os
+import time
+import tempfile
+import unittest
+import importlib.util
+
+from backend.cache import DiskCacheBackend, LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_ttl_and_byte_bound(self):
+        cache = LRUCache(max_entries=10, max_bytes=10, default_ttl=60)
+        cache.set("a", b"12345")
+        cache.set("b", b"12345", ttl=None)
+        cache.set("c", b"123")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), b"12345")
+        self.assertEqual(cache.stats()["evictions"], 1)
+        cache.set("expired", b"x", ttl=0)
+        self.assertIsNone(cache.get("expired"))
+        self.assertIsNotNone(cache.get_entry("expired"))
+
+    def test_disk_backend_adopts_the_lru_bound(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = LRUCache(max_bytes=4096, disk_backend=DiskCacheBackend(directory))
+            self.assertEqual(cache.disk_backend.max_bytes, 4096)
+
+    def test_disk_backend_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as directory:
+            disk = DiskCacheBackend(directory, max_bytes=3000)
+            cache = LRUCache(max_bytes=1_000_000, disk_backend=disk)
+            for i in range(6):
+                cache.set(f"key{i}", os.urandom(900), ttl=None)
+                # Distinct mtimes, so eviction order does not depend on filesystem timestamp resolution
+                os.utime(disk._path(f"key{i}"), (time.time() - 100 + i, time.time() - 100 + i))
+            on_disk = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+            self.assertLessEqual(on_disk, 3000)
+            self.assertIsNotNone(disk.get("key5"))
+            self.assertIsNone(disk.get("key0"))
+
+    def test_oversized_entries_are_not_written_to_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = LRUCache(max_bytes=100, disk_backend=DiskCacheBackend(directory))
+            cache.set("big", b"x" * 1000)
+            self.assertEqual(os.listdir(directory), [])
+
+
+@unittest.skipUnless(importlib.util.find_spec("httpx"), "httpx is not installed")
+class ResponseCacheTest(unittest.TestCase):
+    class Response:
+        def __init__(self, status_code: int, content: bytes = b"", etag: str = ""):
+            self.status_code = status_code
+            self.content = content
+            self.headers = {"ETag": etag} if etag else {}
+
+    def setUp(self):
+        from backend.github_client import ResponseCacheMixin
+        self.client = ResponseCacheMixin()
+        self.client.cache = LRUCache(default_ttl=300)
+
+    def test_mutable_resources_revalidate_on_every_read(self):
+        self.client._cache_finish("pr", self.Response(200, b"v1", '"e1"'), immutable=False)
+        cached, conditional = self.client._cache_begin("pr")
+        self.assertIsNone(cached)
+        self.assertEqual(conditional, {"If-None-Match": '"e1"'})
+        self.assertEqual(self.client._cache_finish("pr", self.Response(304), immutable=False).content, b"v1")
+        # Still expired after the 304, so the next read asks GitHub again
+        self.assertEqual(self.client._cache_begin("pr")[1], {"If-None-Match": '"e1"'})
+
+    def test_immutable_resources_are_served_from_cache(self):
+        self.client._cache_finish("tree", self.Response(200, b"tree", '"t"'), immutable=True)
+        cached, conditional = self.client._cache_begin("tree")
+        self.assertEqual(cached.content, b"tree")
+        self.assertEqual(conditional, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import asyncio
+import unittest
+
+from backend.benchmarks.corpus import fixture_for_diff, synthetic_diff
+from backend.benchmarks.fakes import FakeAIEngine, FakeGitHubClient
+from backend.context_pipeline import MissingDiffError, ParsedDiffCache, ReviewContext, build_layer1_pipeline, fetch_parsed_diff
+from backend.similarity import RepoIndexCache
+
+REPO = "octo/repo"
+
+
+class FetchParsedDiffTest(unittest.TestCase):
+    def setUp(self):
+        self.gh_client = FakeGitHubClient([fixture_for_diff(REPO, 1, synthetic_diff(8 * 1024, seed=1))])
+        self.diff_cache = ParsedDiffCache()
+
+    def fetch(self, pr_number: int = 1):
+        return asyncio.run(fetch_parsed_diff(self.gh_client, REPO, pr_number, diff_cache=self.diff_cache))
+
+    def test_unchanged_diff_is_revalidated_not_reparsed(self):
+        first = self.fetch()
+        second = self.fetch()
+        self.assertIs(second, first)
+        self.assertEqual(self.diff_cache.cache.stats()["revalidated"], 1)
+
+    def test_changed_diff_is_parsed_again(self):
+        first = self.fetch()
+        self.gh_client.add_fixture(fixture_for_diff(REPO, 1, synthetic_diff(8 * 1024, seed=2)))
+        second = self.fetch()
+        self.assertIsNot(second, first)
+        self.assertNotEqual(second.text(), first.text())
+
+    def test_missing_diff_raises(self):
+        with self.assertRaises(MissingDiffError):
+            self.fetch(pr_number=404)
+
+
+class FlakyArchiveClient(FakeGitHubClient):
+    """Fails the first repository archive download, like a GitHub 5xx after all retries."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.archive_failures = 1
+
+    async def get_repo_files(self, *args, **kwargs):
+        if self.archive_failures:
+            self.archive_failures -= 1
+            await self._call("get_repo_files")
+            return None
+        return await super().get_repo_files(*args, **kwargs)
+
+
+class DuplicateIndexTest(unittest.TestCase):
+    def test_failed_archive_fetch_is_not_cached(self):
+        fixture = fixture_for_diff(REPO, 1, synthetic_diff(8 * 1024, seed=3))
+        gh_client = FlakyArchiveClient([fixture])
+        index_cache = RepoIndexCache()
+        pipeline = build_layer1_pipeline(gh_client, FakeAIEngine(), index_cache)
+        head_sha = fixture["pull_request"]["head"]["sha"]
+
+        asyncio.run(pipeline.run(ReviewContext(REPO, 1, "Review.")))
+        self.assertIsNone(index_cache.get(REPO, head_sha))
+        asyncio.run(pipeline.run(ReviewContext(REPO, 1, "Review.")))
+        self.assertIsNotNone(index_cache.get(REPO, head_sha))
+        self.assertEqual(gh_client.calls["get_repo_files"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+from backend.diff_parser import DiffStreamReader, parse_unified_diff
+
+TWO_FILE_DIFF = """diff --git a/a.py b/a.py
+--- a/a.py
++++ b/a.py
+@@ -1,2 +1,3 @@
+ import os
++import sys
+ x = 1
+@@ -10,2 +11,3 @@ def f():
+     y = 2
++    z = 3
+     return y
+diff --git a/b.py b/b.py
+--- a/b.py
++++ b/b.py
+@@ -1 +1,2 @@
+ a = 1
++b = 2
+"""
+
+
+def read(diff_text: str, **caps):
+    reader = DiffStreamReader(**caps)
+    for line in diff_text.splitlines():
+        if not reader.feed(line):
+            break
+    return reader.finish()
+
+
+class DiffStreamReaderTest(unittest.TestCase):
+    def test_matches_the_whole_text_parser(self):
+        parsed = read(TWO_FILE_DIFF)
+        self.assertFalse(parsed.truncated)
+        expected = parse_unified_diff(TWO_FILE_DIFF)
+        self.assertEqual([f.text() for f in parsed.files], [f.text() for f in expected])
+
+    def test_file_cap_keeps_the_last_complete_hunk(self):
+        parsed = read(TWO_FILE_DIFF, max_files=1)
+        self.assertTrue(parsed.truncated)
+        self.assertEqual(parsed.truncated_by, "files")
+        self.assertEqual([f.path for f in parsed.files], ["a.py"])
+        self.assertEqual(len(parsed.files[0].hunks), 2)
+
+    def test_byte_cap_drops_the_partial_hunk(self):
+        cut = TWO_FILE_DIFF.index("+    z = 3")
+        parsed = read(TWO_FILE_DIFF, max_bytes=cut)
+        self.assertEqual(parsed.truncated_by, "bytes")
+        self.assertEqual([f.path for f in parsed.files], ["a.py"])
+        self.assertEqual(len(parsed.files[0].hunks), 1)
+
+    def test_byte_cap_counts_utf8_bytes(self):
+        line = "+" + "é" * 10
+        parsed = read(f"diff --git a/x b/x\n@@ -1 +1 @@\n{line}\n")
+        self.assertEqual(parsed.bytes_read, len(f"diff --git a/x b/x\n@@ -1 +1 @@\n{line}\n".encode("utf-8")))
+        self.assertTrue(read(f"diff --git a/x b/x\n@@ -1 +1 @@\n{line}\n", max_bytes=50).truncated)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import asyncio
+import unittest
+import importlib.util
+
+from backend.rate_limiter import GitHubRateLimiter
+
+
+@unittest.skipUnless(importlib.util.find_spec("httpx"), "httpx is not installed")
+class SendRetryTest(unittest.TestCase):
+    class FailingTransport:
+        """Stands in for an httpx.AsyncClient whose every send fails with `error`."""
+
+        def __init__(self, error: Exception):
+            self.error = error
+            self.sent = 0
+
+        def build_request(self, method: str, path: str, **kwargs):
+            return (method, path)
+
+        async def send(self, request, stream: bool = False):
+            self.sent += 1
+            raise self.error
+
+    def send(self, error: Exception, idempotent: bool) -> int:
+        import httpx  # type: ignore
+        from backend.github_client import AsyncGitHubClient
+
+        transport = self.FailingTransport(error)
+
+        async def run():
+            client = AsyncGitHubClient("token", rate_limiter=GitHubRateLimiter(max_retries=2, backoff_base=0.0))
+            try:
+                with self.assertRaises(httpx.TransportError):
+                    await client._send(transport, "POST", "/repos/o/r/issues/1/comments", idempotent=idempotent)
+            finally:
+                await client.aclose()
+
+        asyncio.run(run())
+        return transport.sent
+
+    def test_timed_out_post_is_sent_exactly_once(self):
+        import httpx  # type: ignore
+        self.assertEqual(self.send(httpx.ReadTimeout("timed out"), idempotent=False), 1)
+
+    def test_post_that_never_connected_is_retried(self):
+        import httpx  # type: ignore
+        self.assertEqual(self.send(httpx.ConnectError("refused"), idempotent=False), 3)
+
+    def test_idempotent_request_retries_timeouts(self):
+        import httpx  # type: ignore
+        self.assertEqual(self.send(httpx.ReadTimeout("timed out"), idempotent=True), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
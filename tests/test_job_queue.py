@@ -0,0 +1,71 @@
+import asyncio
+import unittest
+
+from backend.job_queue import Job, JobQueue, QueueFull, PRIORITY_CONFIRM
+
+
+class JobQueueTest(unittest.TestCase):
+    def run_queue(self, submissions, workers: int = 1, **options):
+        """Submits every job before the workers start, then runs the queue until it drains."""
+        calls = []
+
+        def handler(kind):
+            async def handle(repo_full_name, pr_number, **payload):
+                calls.append((kind, repo_full_name, pr_number, payload))
+            return handle
+
+        async def run():
+            queue = JobQueue({"review": handler("review"), "confirm": handler("confirm")}, workers=workers, **options)
+            for job in submissions:
+                await queue.submit(job)
+            await queue.start()
+            while queue.stats()["waiting"] or queue.stats()["running"]:
+                await asyncio.sleep(0.01)
+            await queue.stop()
+            return queue
+
+        return asyncio.run(run()), calls
+
+    def test_duplicate_waiting_jobs_coalesce(self):
+        queue, calls = self.run_queue([
+            Job("review", "o/r", 1, {"user_instruction": "A"}),
+            Job("review", "o/r", 1, {"user_instruction": "B"}),
+        ])
+        self.assertEqual(calls, [("review", "o/r", 1, {"user_instruction": "B"})])
+        self.assertEqual(queue.counters["coalesced"], 1)
+
+    def test_later_review_does_not_jump_a_waiting_confirm(self):
+        _, calls = self.run_queue([
+            Job("review", "o/r", 1, {"user_instruction": "A"}),
+            Job("confirm", "o/r", 1, priority=PRIORITY_CONFIRM),
+            Job("review", "o/r", 1, {"user_instruction": "B"}),
+        ])
+        self.assertEqual(calls, [
+            ("review", "o/r", 1, {"user_instruction": "A"}),
+            ("confirm", "o/r", 1, {}),
+            ("review", "o/r", 1, {"user_instruction": "B"}),
+        ])
+
+    def test_confirm_runs_before_reviews_of_other_prs(self):
+        _, calls = self.run_queue([
+            Job("review", "o/r", 1),
+            Job("review", "o/r", 2),
+            Job("confirm", "o/r", 3, priority=PRIORITY_CONFIRM),
+        ])
+        self.assertEqual(calls[0][0], "confirm")
+
+    def test_round_robin_across_repositories(self):
+        _, calls = self.run_queue([Job("review", "busy/repo", n) for n in range(1, 4)] + [Job("review", "quiet/repo", 1)])
+        self.assertEqual([call[1] for call in calls[:2]], ["busy/repo", "quiet/repo"])
+
+    def test_rejects_when_full(self):
+        async def run():
+            queue = JobQueue({}, workers=0, max_pending=1)
+            await queue.submit(Job("review", "o/r", 1))
+            with self.assertRaises(QueueFull):
+                await queue.submit(Job("review", "o/r", 2))
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import asyncio
+import unittest
+import importlib.util
+from unittest import mock
+
+from backend.benchmarks.corpus import fixture_for_diff, synthetic_diff
+from backend.benchmarks.fakes import FakeAIEngine, FakeGitHubClient
+
+REPO = "octo/repo"
+
+
+class FailingCommentClient(FakeGitHubClient):
+    """Raises on every comment post, like a transport error after all retries."""
+
+    async def post_comment(self, repo_full_name: str, issue_number: int, body: str) -> bool:
+        await self._call("post_comment")
+        raise ConnectionError("connection reset")
+
+
+@unittest.skipUnless(importlib.util.find_spec("fastapi") and importlib.util.find_spec("httpx"),
+                     "fastapi and httpx are not installed")
+class Layer2StreamTest(unittest.TestCase):
+    def test_failed_comment_post_still_ends_the_stream(self):
+        from backend import main
+
+        gh_client = FailingCommentClient([fixture_for_diff(REPO, 1, synthetic_diff(4 * 1024))])
+        request = main.Layer2Request(repo_full_name=REPO, pr_number=1, confirmed_prompt="Review.", review_mode="single")
+
+        async def stream():
+            response = await main.api_layer2_stream(request)
+            return [event async for event in response.body_iterator]
+
+        with mock.patch.object(main, "gh_client", gh_client), mock.patch.object(main, "ai_engine", FakeAIEngine()):
+            events = asyncio.run(asyncio.wait_for(stream(), timeout=10))
+        self.assertTrue(events[-1].startswith("event: done"))
+        self.assertIn('"status": "comment_failed"', events[-1])
+        self.assertEqual(gh_client.calls["post_comment"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import time
+import unittest
+
+from backend.rate_limiter import GitHubRateLimiter
+
+
+def rate_limit_headers(remaining: int, resource: str = "", limit: int = 5000) -> dict:
+    headers = {"X-RateLimit-Remaining": str(remaining), "X-RateLimit-Limit": str(limit),
+               "X-RateLimit-Reset": str(time.time() + 3600)}
+    if resource:
+        headers["X-RateLimit-Resource"] = resource
+    return headers
+
+
+class RateLimitBudgetTest(unittest.TestCase):
+    def test_core_budget_paces_the_bucket(self):
+        limiter = GitHubRateLimiter(rate=10.0)
+        limiter.update(rate_limit_headers(360, "core"))
+        self.assertEqual(limiter.remaining, 360)
+        self.assertAlmostEqual(limiter.rate, 0.1, places=2)
+
+    def test_graphql_budget_is_tracked_separately(self):
+        limiter = GitHubRateLimiter(rate=10.0)
+        limiter.update(rate_limit_headers(4000, "core"))
+        limiter.update(rate_limit_headers(0, "graphql"))
+        self.assertEqual(limiter.remaining, 4000)
+        self.assertEqual(limiter.paused_until, 0.0)
+        self.assertEqual(limiter.stats()["budgets"]["graphql"]["remaining"], 0)
+
+    def test_unnamed_resource_counts_as_core(self):
+        limiter = GitHubRateLimiter()
+        limiter.update(rate_limit_headers(42))
+        self.assertEqual(limiter.remaining, 42)
+        self.assertIn("core", limiter.stats()["budgets"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from backend.review_store import SQLitePendingReviewStore, SQLiteReviewHistoryStore, review_key_digest
+
+
+class PendingReviewStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "state.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_head_sha_and_instruction_round_trip(self):
+        store = SQLitePendingReviewStore(self.path)
+        store.save("o/r", 1, "prompt", "diff --git a/x b/x", "abc123", "check errors")
+        self.assertEqual(store.load("o/r", 1), {"prompt": "prompt", "diff": "diff --git a/x b/x",
+                                                "head_sha": "abc123", "instruction": "check errors"})
+
+    def test_upgrades_a_table_without_head_sha(self):
+        with sqlite3.connect(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE pending_reviews (repo_full_name TEXT NOT NULL, pr_number INTEGER NOT NULL,"
+                " prompt BLOB NOT NULL, diff_hash TEXT NOT NULL, expires_at REAL NOT NULL,"
+                " PRIMARY KEY (repo_full_name, pr_number))"
+            )
+        store = SQLitePendingReviewStore(self.path)
+        store.save("o/r", 1, "prompt", "diff", "abc123")
+        self.assertEqual(store.load("o/r", 1)["head_sha"], "abc123")
+
+
+class ReviewHistoryStoreTest(unittest.TestCase):
+    def test_records_the_review_key_digest(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = SQLiteReviewHistoryStore(os.path.join(directory, "state.db"))
+            store.save("o/r", 1, "abc123", "check errors", [{"paths": ["x"], "findings": "ok"}])
+            record = store.load("o/r", 1)
+        self.assertEqual(record["head_sha"], "abc123")
+        self.assertEqual(record["review_key"], review_key_digest("check errors"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import random
+import unittest
+
+from backend.similarity import (MAX_HASH, DuplicateCodeIndex, estimate_jaccard, minhash_signature, normalize_tokens,
+                                shingle_hashes)
+
+FUNCTION = [
+    "def load_settings(path, defaults):",
+    "    settings = dict(defaults)",
+    "    with open(path) as handle:",
+    "        for line in handle:",
+    "            key, _, value = line.partition('=')",
+    "            if not key.strip():",
+    "                continue",
+    "            settings[key.strip()] = value.strip()",
+    "    if 'timeout' in settings:",
+    "        settings['timeout'] = float(settings['timeout'])",
+    "    return settings",
+    "",
+]
+
+
+def random_hashes(rng: random.Random, count: int) -> set:
+    return {rng.getrandbits(64) for _ in range(count)}
+
+
+class MinHashTest(unittest.TestCase):
+    def test_estimate_tracks_exact_jaccard(self):
+        rng = random.Random(3)
+        shared = random_hashes(rng, 600)
+        a = shared | random_hashes(rng, 200)
+        b = shared | random_hashes(rng, 200)
+        exact = len(a & b) / len(a | b)
+        estimate = estimate_jaccard(minhash_signature(a, 128), minhash_signature(b, 128))
+        self.assertAlmostEqual(estimate, exact, delta=0.12)
+
+    def test_identical_and_disjoint_sets(self):
+        rng = random.Random(5)
+        a, b = random_hashes(rng, 300), random_hashes(rng, 300)
+        self.assertEqual(estimate_jaccard(minhash_signature(a), minhash_signature(set(a))), 1.0)
+        self.assertLess(estimate_jaccard(minhash_signature(a), minhash_signature(b)), 0.1)
+
+    def test_sparse_sets_are_densified(self):
+        signature = minhash_signature({12345, MAX_HASH // 2}, 64)
+        self.assertNotIn(MAX_HASH, signature)
+        self.assertEqual(minhash_signature(set(), 8), (MAX_HASH,) * 8)
+
+    def test_literals_and_comments_are_normalized(self):
+        self.assertEqual(normalize_tokens("x = 'a' + 1  # note"), normalize_tokens('x = "b" + 22'))
+        self.assertEqual(shingle_hashes(["x = 'a' + 1"]), shingle_hashes(["x = 'zz' + 9  // other"]))
+
+
+class DuplicateCodeIndexTest(unittest.TestCase):
+    def test_finds_a_copied_function(self):
+        index = DuplicateCodeIndex()
+        index.add_file("config/loader.py", "\n".join(["import os", ""] + FUNCTION))
+        index.add_file("app/views.py", "\n".join(f"value_{i} = compute({i}, 'label')" for i in range(30)))
+        added = "\n".join("+" + line for line in FUNCTION)
+        diff = (f"diff --git a/app/settings.py b/app/settings.py\n--- a/app/settings.py\n+++ b/app/settings.py\n"
+                f"@@ -0,0 +1,{len(FUNCTION)} @@\n{added}\n")
+        matches = index.query_diff(diff)
+        self.assertEqual([m.path for m in matches], ["config/loader.py"])
+        self.assertGreater(matches[0].score, 0.8)
+
+    def test_a_file_never_matches_itself(self):
+        index = DuplicateCodeIndex()
+        index.add_file("config/loader.py", "\n".join(FUNCTION))
+        self.assertEqual(index.query_lines("config/loader.py", list(enumerate(FUNCTION, start=1))), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
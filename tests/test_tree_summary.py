@@ -0,0 +1,27 @@
+import unittest
+
+from backend.tree_summary import RepoTree, RepoTreeCache
+
+
+def tree_json(sha: str, files: int) -> dict:
+    return {"sha": sha, "tree": [{"path": f"src/module_{i}.py", "type": "blob", "sha": f"{i:040x}"}
+                                 for i in range(files)]}
+
+
+class RepoTreeCacheTest(unittest.TestCase):
+    def test_trees_are_sized_by_their_paths(self):
+        small = RepoTree.from_tree_json(tree_json("a" * 40, 10))
+        large = RepoTree.from_tree_json(tree_json("b" * 40, 1000))
+        self.assertGreater(large.approx_bytes(), 50 * small.approx_bytes())
+
+    def test_byte_bound_evicts_large_trees(self):
+        cache = RepoTreeCache(max_entries=32, max_bytes=100_000)
+        cache.put("o/r", "c1", tree_json("a" * 40, 800))
+        cache.put("o/r", "c2", tree_json("b" * 40, 800))
+        self.assertIsNone(cache.get_for_commit("o/r", "c1"))
+        self.assertIsNotNone(cache.get_for_commit("o/r", "c2"))
+        self.assertLessEqual(cache.cache.stats()["bytes"], 100_000)
+
+
+if __name__ == "__main__":
+    unittest.main()